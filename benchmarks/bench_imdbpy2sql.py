@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+bench_imdbpy2sql.py
+
+Run the whole imdbpy2sql.py pipeline and report the time spent in every
+stage, as written by its --metrics option.
+
+    bench_imdbpy2sql.py [options] [-- imdbpy2sql.py options]
+
+        -d /dir/         the plain text data files to use; if not given,
+                         synthetic files are written by gen_ptdf.py.
+        -m movies        the number of generated movies (default: 10000).
+        -p persons       the number of generated persons (default: 20000).
+        -o file.json     save the results, in JSON format.
+        -r runs          the number of runs for every mode (default: 1);
+                         the best time is reported.
+        --csv-uri URI    also run in CSV mode, using this database;
+                         importing CSV files is not supported for SQLite,
+                         so a MySQL or PostgreSQL URI is required.
+        --keep           don't remove the working directory.
+
+The SQLite mode uses a new database in a temporary directory, with the
+--sqlite-transactions option.
+"""
+
+import os
+import sys
+import json
+import time
+import getopt
+import shutil
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(BENCH_DIR, os.pardir, 'media_browser', 'bin',
+                    'imdbpy2sql.py')
+
+HELP = __doc__
+
+
+def readMetrics(fname):
+    """Return the time of every stage (and the order in which they
+    were completed) and the total time, from a metrics file."""
+    stages = {}
+    order = []
+    total = None
+    peakRSS = None
+    fd = open(fname)
+    for line in fd:
+        try:
+            data = json.loads(line)
+        except ValueError:
+            continue
+        if data.get('event') == 'stage':
+            stage = data['stage']
+            if stage not in stages:
+                order.append(stage)
+            stages[stage] = stages.get(stage, 0.0) + data['seconds']
+        elif data.get('event') == 'run':
+            total = data['seconds']
+            peakRSS = data.get('peak_rss_kb')
+    fd.close()
+    return {'stages': stages, 'order': order, 'seconds': total,
+            'peak_rss_kb': peakRSS}
+
+
+def runImport(dataDir, workDir, mode, csvURI=None, extraArgs=()):
+    """Run imdbpy2sql.py once; return the metrics read from its
+    --metrics file."""
+    metricsFile = os.path.join(workDir, '%s.metrics' % mode)
+    if os.path.exists(metricsFile):
+        os.remove(metricsFile)
+    if mode == 'csv':
+        csvDir = os.path.join(workDir, 'csv')
+        if os.path.isdir(csvDir):
+            shutil.rmtree(csvDir)
+        os.makedirs(csvDir)
+        args = ['-u', csvURI, '-c', csvDir]
+    else:
+        dbFile = os.path.join(workDir, 'imdb.db')
+        if os.path.exists(dbFile):
+            os.remove(dbFile)
+        args = ['-u', 'sqlite:' + dbFile, '--sqlite-transactions']
+    cmd = [sys.executable, SCRIPT, '-d', dataDir, '--metrics', metricsFile]
+    cmd += args + list(extraArgs)
+    logFile = os.path.join(workDir, '%s.log' % mode)
+    print 'RUNNING %s (output in %s)' % (' '.join(cmd), logFile)
+    log = open(logFile, 'w')
+    # imdbpy2sql.py writes its temporary files in the current directory.
+    start = time.time()
+    ret = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT,
+                        cwd=workDir)
+    elapsed = time.time() - start
+    log.close()
+    if ret != 0:
+        print 'ERROR: imdbpy2sql.py exited with status %d; see %s' % (ret,
+                                                                logFile)
+        sys.exit(ret)
+    metrics = readMetrics(metricsFile)
+    metrics['wall_seconds'] = round(elapsed, 3)
+    return metrics
+
+
+def bestRun(runs):
+    """Return the fastest of a list of runs."""
+    return min(runs, key=lambda x: x['wall_seconds'])
+
+
+def printResults(results):
+    """Print a table with the time of every stage, for every mode."""
+    modes = sorted(results)
+    stages = []
+    for mode in modes:
+        for stage in results[mode]['order']:
+            if stage not in stages:
+                stages.append(stage)
+    print '%-40s' % 'stage' + ''.join(['%12s' % m for m in modes])
+    for stage in stages:
+        row = '%-40s' % stage[:40]
+        for mode in modes:
+            seconds = results[mode]['stages'].get(stage)
+            if seconds is None: row += '%12s' % '-'
+            else: row += '%12.2f' % seconds
+        print row
+    print '%-40s' % 'TOTAL (wall)' + \
+            ''.join(['%12.2f' % results[m]['wall_seconds'] for m in modes])
+    print '%-40s' % 'peak RSS (KB)' + \
+            ''.join(['%12s' % results[m]['peak_rss_kb'] for m in modes])
+
+
+def main():
+    try:
+        optlist, args = getopt.getopt(sys.argv[1:], 'd:m:p:o:r:h',
+                                    ['csv-uri=', 'keep', 'help'])
+    except getopt.error, e:
+        print 'Troubles with arguments: %s' % e
+        print HELP
+        sys.exit(2)
+    dataDir = None
+    nrMovies = 10000
+    nrPersons = 20000
+    outFile = None
+    nrRuns = 1
+    csvURI = None
+    keep = False
+    for opt, value in optlist:
+        if opt == '-d':
+            dataDir = os.path.abspath(value)
+        elif opt == '-m':
+            nrMovies = int(value)
+        elif opt == '-p':
+            nrPersons = int(value)
+        elif opt == '-o':
+            outFile = value
+        elif opt == '-r':
+            nrRuns = max(1, int(value))
+        elif opt == '--csv-uri':
+            csvURI = value
+        elif opt == '--keep':
+            keep = True
+        elif opt in ('-h', '--help'):
+            print HELP
+            sys.exit(0)
+    workDir = tempfile.mkdtemp(prefix='bench_imdbpy2sql-')
+    try:
+        if dataDir is None:
+            sys.path.insert(0, BENCH_DIR)
+            from gen_ptdf import Generator
+            dataDir = os.path.join(workDir, 'data')
+            os.makedirs(dataDir)
+            Generator(dataDir, nrMovies, nrPersons).run()
+        modes = ['sqlite']
+        if csvURI:
+            modes.append('csv')
+        else:
+            print 'NOTE: CSV mode skipped (see the --csv-uri option)'
+        results = {}
+        for mode in modes:
+            runs = [runImport(dataDir, workDir, mode, csvURI, args)
+                    for i in xrange(nrRuns)]
+            results[mode] = bestRun(runs)
+        printResults(results)
+        if outFile:
+            fd = open(outFile, 'w')
+            json.dump({'data': dataDir, 'args': args, 'results': results},
+                        fd, indent=2, sort_keys=True)
+            fd.close()
+    finally:
+        if keep:
+            print 'working directory: %s' % workDir
+        else:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
+
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+bench_ptdf.py
+
+Compare the imdb.ptdf tokenizers with the per-line code previously used
+by imdbpy2sql.py, on the IMDb's plain text data files; the results of
+the two versions are also checked to be identical.
+
+    bench_ptdf.py /directory/with/PlainTextDataFiles/ [max lines per file]
+"""
+
+import os
+import gc
+import sys
+import gzip
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'media_browser'))
+
+from imdb.ptdf import splitFields, splitRating, splitCastLine
+
+
+def unpack(line, headers, sep='\t'):
+    """The old unpack function of imdbpy2sql.py."""
+    r = {}
+    ls1 = filter(None, line.split(sep))
+    for index, item in enumerate(ls1):
+        try: name = headers[index]
+        except IndexError: name = 'item%s' % index
+        r[name] = item.strip()
+    return r
+
+
+def oldInfo(lines):
+    res = []
+    for line in lines:
+        data = unpack(line.strip(), ('title', 'info', 'note'))
+        if 'title' not in data: continue
+        if 'info' not in data: continue
+        res.append((data['title'], data['info'], data.get('note')))
+    return res
+
+def newInfo(lines):
+    res = []
+    for line in lines:
+        title, info, note = splitFields(line.strip(), 3)
+        if info is None: continue
+        res.append((title, info, note))
+    return res
+
+
+def oldRating(lines):
+    res = []
+    for line in lines:
+        data = unpack(line, ('votes distribution', 'votes', 'rating', 'title'),
+                        sep='  ')
+        if 'title' not in data: continue
+        res.append((data['title'].strip(), data.get('votes distribution'),
+                    data.get('votes'), data.get('rating')))
+    return res
+
+def newRating(lines):
+    res = []
+    for line in lines:
+        data = splitRating(line)
+        if data is None: continue
+        res.append((data[3], data[0], data[1], data[2]))
+    return res
+
+
+def oldCast(lines):
+    res = []
+    for line in lines:
+        if line and line[0] != '\t':
+            if line[0] == '\n': continue
+            sl = filter(None, line.split('\t'))
+            if len(sl) != 2: continue
+            name, line = sl
+        line = line.strip()
+        ll = line.split('  ')
+        title = ll[0]
+        note = None
+        role = None
+        order = None
+        for item in ll[1:]:
+            if not item: continue
+            if item[0] == '[':
+                role = item[1:]
+                if role[-1:] == ']':
+                    role = role[:-1]
+                if role[-1:] == ')':
+                    nidx = role.find('(')
+                    if nidx != -1:
+                        note = role[nidx:]
+                        role = role[:nidx].rstrip()
+                        if not role: role = None
+            elif item[0] == '(':
+                if note is None:
+                    note = item
+                else:
+                    note = '%s %s' % (note, item)
+            elif item[0] == '<':
+                textor = item[1:-1]
+                try:
+                    order = long(textor)
+                except ValueError:
+                    os = textor.split(',')
+                    if len(os) == 3:
+                        try:
+                            order = ((long(os[2])-1) * 1000) + \
+                                    ((long(os[1])-1) * 100) + (long(os[0])-1)
+                        except ValueError:
+                            pass
+        res.append((title, role, note, order))
+    return res
+
+def newCast(lines):
+    res = []
+    for line in lines:
+        if line and line[0] != '\t':
+            if line[0] == '\n': continue
+            sl = filter(None, line.split('\t'))
+            if len(sl) != 2: continue
+            name, line = sl
+        res.append(splitCastLine(line.strip()))
+    return res
+
+
+# (data file, old version, new version)
+BENCHMARKS = [('movies.list.gz', oldInfo, newInfo),
+            ('genres.list.gz', oldInfo, newInfo),
+            ('language.list.gz', oldInfo, newInfo),
+            ('production-companies.list.gz', oldInfo, newInfo),
+            ('ratings.list.gz', oldRating, newRating),
+            ('actors.list.gz', oldCast, newCast),
+            ('actresses.list.gz', oldCast, newCast)]
+
+
+def readLines(fname, maxLines=None):
+    """Return the lines of a data file, or None if it's missing."""
+    try:
+        fd = gzip.open(fname)
+    except IOError:
+        return None
+    lines = []
+    try:
+        for line in fd:
+            lines.append(line)
+            if maxLines and len(lines) >= maxLines:
+                break
+    except IOError:
+        return None
+    fd.close()
+    return lines
+
+
+def timeit(funct, lines, repeat=3):
+    """Return the result of funct(lines) and the best time out of repeat."""
+    best = None
+    # The collector would mostly measure the size of the results.
+    gc.disable()
+    try:
+        for i in xrange(repeat):
+            start = time.time()
+            res = funct(lines)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        gc.enable()
+    return res, best
+
+
+def main():
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(2)
+    dataDir = sys.argv[1]
+    maxLines = None
+    if len(sys.argv) > 2:
+        maxLines = int(sys.argv[2])
+    print '%-30s %10s %10s %10s %8s' % ('file', 'lines', 'old (s)',
+                                        'new (s)', 'speedup')
+    for fname, oldFunct, newFunct in BENCHMARKS:
+        lines = readLines(os.path.join(dataDir, fname), maxLines)
+        if lines is None:
+            continue
+        oldRes, oldTime = timeit(oldFunct, lines)
+        newRes, newTime = timeit(newFunct, lines)
+        if oldRes != newRes:
+            print 'ERROR: different results for %s' % fname
+            sys.exit(1)
+        print '%-30s %10d %10.3f %10.3f %7.2fx' % (fname, len(lines),
+                oldTime, newTime, oldTime / max(newTime, 1e-9))
+
+
+if __name__ == '__main__':
+    main()
+
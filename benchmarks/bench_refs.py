@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""
+bench_refs.py
+
+Compare the single pass references substitution of imdb.utils with the
+code previously used (one regular expression for every kind of reference),
+on a large synthetic Movie object; the results of the two versions are
+also checked to be identical.
+
+    bench_refs.py [number of items per section]
+"""
+
+import os
+import gc
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'media_browser'))
+
+from imdb import utils
+from imdb.utils import re_titleRef, re_nameRef, re_characterRef, \
+                        escape4xml, _handleTextNotes
+from imdb.Movie import Movie
+from imdb.Person import Person
+from imdb.Character import Character
+
+
+def oldModClearRefs(s, titlesRefs, namesRefs, charactersRefs):
+    """The old modClearRefs function."""
+    s = re_titleRef.sub(r'\1', s)
+    s = re_characterRef.sub(r'\1', s)
+    return re_nameRef.sub(r'\1', s)
+
+
+def oldRefsToReplace(value, modFunct, titlesRefs, namesRefs, charactersRefs):
+    """The old _refsToReplace function."""
+    mRefs = []
+    for refRe, refTemplate in [(re_titleRef, u'_%s_ (qv)'),
+                                (re_nameRef, u"'%s' (qv)"),
+                                (re_characterRef, u'#%s# (qv)')]:
+        theseRefs = []
+        for theRef in refRe.findall(value):
+            goodValue = modFunct(refTemplate % theRef, titlesRefs, namesRefs,
+                                charactersRefs)
+            if '_' in goodValue or len(goodValue) > 128:
+                continue
+            toReplace = escape4xml(goodValue)
+            replaceWith = goodValue.replace(theRef, escape4xml(theRef))
+            theseRefs.append((toReplace, replaceWith))
+        mRefs.append(theseRefs)
+    return mRefs
+
+
+def oldNormalizeValue(value, withRefs=False, modFunct=None, titlesRefs=None,
+                    namesRefs=None, charactersRefs=None, refsCache=None):
+    """The old _normalizeValue function (refsCache is ignored)."""
+    if isinstance(value, (unicode, str)):
+        if not withRefs:
+            value = _handleTextNotes(escape4xml(value))
+        else:
+            replaceLists = oldRefsToReplace(value, modFunct, titlesRefs,
+                                        namesRefs, charactersRefs)
+            value = modFunct(value, titlesRefs or {}, namesRefs or {},
+                            charactersRefs or {})
+            value = _handleTextNotes(escape4xml(value))
+            for replaceList in replaceLists:
+                for toReplace, replaceWith in replaceList:
+                    value = value.replace(toReplace, replaceWith)
+    else:
+        value = unicode(value)
+    return value
+
+
+def modLinks(s, titlesRefs, namesRefs, charactersRefs):
+    """Replace references with links, like imdb.helpers.modHtmlLinks."""
+    def _replaceMovie(match):
+        item = titlesRefs.get(match.group(1))
+        if item is None: return match.group(1)
+        return u'<a href="/title/tt%s">%s</a>' % (item.movieID,
+                                                match.group(1))
+    def _replacePerson(match):
+        item = namesRefs.get(match.group(1))
+        if item is None: return match.group(1)
+        return u'<a href="/name/nm%s">%s</a>' % (item.personID,
+                                                match.group(1))
+    s = s.replace('<', '&lt;').replace('>', '&gt;')
+    s = re_titleRef.sub(_replaceMovie, s)
+    s = re_nameRef.sub(_replacePerson, s)
+    return re_characterRef.sub(r'\1', s)
+
+
+WORDS = ('the', 'movie', 'was', 'shot', 'in', 'only', 'days', "director's",
+        'cut', 'scene', 'original', 'script', 'actor', 'role', 'during')
+
+def makeMovie(nrItems, seed=0):
+    """Return a Movie with nrItems trivia, goofs, quotes and plot items,
+    full of references, and the dictionaries of the references."""
+    rnd = random.Random(seed)
+    titlesRefs = {}
+    namesRefs = {}
+    charactersRefs = {}
+    titles = []
+    names = []
+    characters = []
+    for i in xrange(200):
+        title = u'%s %s (%d)' % (rnd.choice(WORDS).capitalize(),
+                                rnd.choice(WORDS), rnd.randint(1920, 2015))
+        titles.append(title)
+        titlesRefs[title] = Movie(title=title, movieID='%07d' % i)
+        name = u'%s, %s' % (rnd.choice(WORDS).capitalize(),
+                            rnd.choice(WORDS).capitalize())
+        names.append(name)
+        namesRefs[name] = Person(name=name, personID='%07d' % i)
+        character = rnd.choice(WORDS).capitalize()
+        characters.append(character)
+        charactersRefs[character] = Character(name=character,
+                                            characterID='%07d' % i)
+    def _text():
+        chunks = []
+        for i in xrange(rnd.randint(10, 60)):
+            x = rnd.random()
+            if x < 0.06:
+                chunks.append(u'_%s_ (qv)' % rnd.choice(titles))
+            elif x < 0.12:
+                chunks.append(u"'%s' (qv)" % rnd.choice(names))
+            elif x < 0.14:
+                chunks.append(u'#%s# (qv)' % rnd.choice(characters))
+            else:
+                chunks.append(rnd.choice(WORDS))
+        return u' '.join(chunks)
+    data = {'title': u'Benchmark', 'year': 2000}
+    for key in ('trivia', 'goofs', 'quotes', 'plot'):
+        data[key] = [_text() for i in xrange(nrItems)]
+    movie = Movie(movieID='0000000', data=data, titlesRefs=titlesRefs,
+                namesRefs=namesRefs, charactersRefs=charactersRefs)
+    return movie
+
+
+def timeit(funct, repeat=3):
+    """Return the result of funct() and the best time out of repeat."""
+    best = None
+    gc.disable()
+    try:
+        for i in xrange(repeat):
+            start = time.time()
+            res = funct()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        gc.enable()
+    return res, best
+
+
+def main():
+    nrItems = 2000
+    if len(sys.argv) > 1:
+        nrItems = int(sys.argv[1])
+    movie = makeMovie(nrItems)
+    strings = []
+    for key in ('trivia', 'goofs', 'quotes', 'plot'):
+        strings += movie.data[key]
+    tr, nr, cr = movie.titlesRefs, movie.namesRefs, movie.charactersRefs
+    def _newNormalize(mf):
+        # As in asXML, the escaped references are shared by all the strings.
+        refsCache = {}
+        return [utils._normalizeValue(s, True, mf, tr, nr, cr, refsCache)
+                for s in strings]
+    benchmarks = [
+        ('modClearRefs',
+            lambda: [oldModClearRefs(s, tr, nr, cr) for s in strings],
+            lambda: [utils.modClearRefs(s, tr, nr, cr) for s in strings])]
+    for mf, name in ((utils.modClearRefs, 'modClearRefs'),
+                    (modLinks, 'links')):
+        benchmarks.append(('_normalizeValue (%s)' % name,
+            lambda mf=mf: [oldNormalizeValue(s, True, mf, tr, nr, cr)
+                            for s in strings],
+            lambda mf=mf: _newNormalize(mf)))
+    def _asXML(normalizeValue, modFunct):
+        def _run():
+            origNormalizeValue = utils._normalizeValue
+            utils._normalizeValue = normalizeValue
+            try:
+                movie.set_mod_funct(modFunct)
+                return movie.asXML()
+            finally:
+                utils._normalizeValue = origNormalizeValue
+        return _run
+    for mf, oldMf, name in ((utils.modClearRefs, oldModClearRefs,
+                            'modClearRefs'), (modLinks, modLinks, 'links')):
+        benchmarks.append(('asXML (%s)' % name,
+                            _asXML(oldNormalizeValue, oldMf),
+                            _asXML(utils._normalizeValue, mf)))
+    print '%d strings, %d characters' % (len(strings),
+                                        sum([len(s) for s in strings]))
+    print '%-30s %10s %10s %8s' % ('benchmark', 'old (s)', 'new (s)',
+                                    'speedup')
+    for name, oldFunct, newFunct in benchmarks:
+        oldRes, oldTime = timeit(oldFunct)
+        newRes, newTime = timeit(newFunct)
+        if oldRes != newRes:
+            print 'ERROR: different results for %s' % name
+            sys.exit(1)
+        print '%-30s %10.3f %10.3f %7.2fx' % (name, oldTime, newTime,
+                                            oldTime / max(newTime, 1e-9))
+
+
+if __name__ == '__main__':
+    main()
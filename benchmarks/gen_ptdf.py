@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+gen_ptdf.py
+
+Write synthetic IMDb's plain text data files, with the same layout (and
+the same start/stop markers, read from imdbpy2sql.py) of the real ones,
+so that imdbpy2sql.py can be benchmarked without the real dumps.
+
+    gen_ptdf.py [-m movies] [-p persons] [-s seed] /output/directory/
+
+The number of persons is split among actors, actresses, directors
+and writers; every person is credited in a few titles.
+"""
+
+import os
+import sys
+import ast
+import gzip
+import getopt
+import random
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                    'media_browser', 'bin', 'imdbpy2sql.py')
+
+HELP = __doc__
+
+WORDS = ('love', 'night', 'dead', 'city', 'last', 'blue', 'house', 'river',
+        'king', 'war', 'girl', 'man', 'dark', 'summer', 'secret', 'road',
+        'star', 'fire', 'dream', 'time', 'heart', 'shadow', 'gold', 'wild')
+SURNAMES = ('Smith', 'Rossi', 'Garcia', 'Muller', 'Dubois', 'Kowalski',
+            'Tanaka', 'Silva', 'Jones', 'Novak', 'Ivanov', 'Larsen',
+            'Brown', 'Ferrari', 'Martin', 'Nielsen', 'Costa', 'Weber')
+NAMES = ('John', 'Maria', 'Paolo', 'Anna', 'Pierre', 'Yuki', 'Hans', 'Ewa',
+        'Carlos', 'Ingrid', 'Tom', 'Sofia', 'Ivan', 'Lucy', 'Marco', 'Ada')
+GENRES = ('Drama', 'Comedy', 'Thriller', 'Horror', 'Documentary', 'Romance',
+        'Action', 'Western', 'Animation', 'Short')
+LANGUAGES = ('English', 'Italian', 'French', 'German', 'Japanese', 'Spanish')
+COUNTRIES = ('USA', 'Italy', 'France', 'Germany', 'Japan', 'Spain', 'UK')
+COMPANIES = ('Pictures', 'Films', 'Studios', 'Productions', 'Entertainment')
+
+
+def readMarkers(script=SCRIPT):
+    """Return a dictionary with the *_START and *_STOP markers
+    defined in imdbpy2sql.py."""
+    fd = open(script)
+    tree = ast.parse(fd.read())
+    fd.close()
+    markers = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+            continue
+        target = node.targets[0]
+        if not isinstance(target, ast.Name):
+            continue
+        if not target.id.endswith(('_START', '_STOP')):
+            continue
+        try:
+            markers[target.id] = ast.literal_eval(node.value)
+        except ValueError:
+            pass
+    return markers
+
+
+def header(start):
+    """Return the lines matching a tuple of start markers."""
+    return ''.join(['%s\n' % x for x in start])
+
+
+class Generator(object):
+    """Write the data files, for nrMovies titles and nrPersons persons."""
+    def __init__(self, outDir, nrMovies, nrPersons, seed=0):
+        self.outDir = outDir
+        self.nrMovies = nrMovies
+        self.nrPersons = nrPersons
+        self.random = random.Random(seed)
+        self.markers = readMarkers()
+        self.titles = []
+
+    def _open(self, fname):
+        print 'WRITING', fname
+        return gzip.open(os.path.join(self.outDir, fname), 'wb')
+
+    def _words(self, nr):
+        choice = self.random.choice
+        return ' '.join([choice(WORDS) for i in xrange(nr)]).capitalize()
+
+    def _name(self, idx):
+        choice = self.random.choice
+        name = '%s, %s' % (choice(SURNAMES), choice(NAMES))
+        # Make it unique.
+        return '%s (%s)' % (name, self._roman(idx + 1))
+
+    def _roman(self, nr):
+        res = ''
+        for value, letters in ((1000, 'M'), (900, 'CM'), (500, 'D'),
+                            (400, 'CD'), (100, 'C'), (90, 'XC'), (50, 'L'),
+                            (40, 'XL'), (10, 'X'), (9, 'IX'), (5, 'V'),
+                            (4, 'IV'), (1, 'I')):
+            while nr >= value:
+                res += letters
+                nr -= value
+        return res
+
+    def movies(self):
+        """movies.list.gz: movies, tv series and their episodes."""
+        m = self.markers
+        fd = self._open('movies.list.gz')
+        fd.write('junk\n' + header(m['MOVIES_START']))
+        rnd = self.random
+        idx = 0
+        while idx < self.nrMovies:
+            year = rnd.randint(1920, 2015)
+            title = '%s (%d/%s)' % (self._words(rnd.randint(1, 4)), year,
+                                    self._roman(idx + 1))
+            if rnd.random() < 0.1:
+                # A tv series, with some episodes.
+                series = '"%s" (%d/%s)' % (self._words(2), year,
+                                        self._roman(idx + 1))
+                self.titles.append(series)
+                fd.write('%s\t\t\t%d-%d\n' % (series, year, year + 3))
+                idx += 1
+                for ep in xrange(1, rnd.randint(2, 10)):
+                    if idx >= self.nrMovies: break
+                    episode = '%s {%s (#1.%d)}' % (series, self._words(2), ep)
+                    self.titles.append(episode)
+                    fd.write('%s\t\t\t%d\n' % (episode, year))
+                    idx += 1
+                continue
+            self.titles.append(title)
+            fd.write('%s\t\t\t\t%d\n' % (title, year))
+            idx += 1
+        fd.write(m['MOVIES_STOP'] + '\n')
+        fd.close()
+
+    def cast(self, fname, nrPersons, firstIdx, roles=True):
+        """A cast list (actors, actresses, directors, ...)."""
+        m = self.markers
+        fd = self._open(fname)
+        fd.write('junk\n' + header(m['CAST_START']))
+        rnd = self.random
+        choice = rnd.choice
+        for idx in xrange(firstIdx, firstIdx + nrPersons):
+            fd.write(self._name(idx))
+            for credit in xrange(rnd.randint(1, 8)):
+                line = '\t' + choice(self.titles)
+                if rnd.random() < 0.2:
+                    line += '  (uncredited)'
+                if roles:
+                    line += '  [%s]' % choice(NAMES)
+                    if rnd.random() < 0.6:
+                        line += '  <%d>' % rnd.randint(1, 40)
+                if credit: line = '\t\t' + line
+                fd.write(line + '\n')
+            fd.write('\n')
+        fd.write(m['CAST_STOP'] + '\n')
+        fd.close()
+
+    def ratings(self):
+        """ratings.list.gz: top 250, bottom 10 and all the ratings."""
+        m = self.markers
+        fd = self._open('ratings.list.gz')
+        rnd = self.random
+        rated = rnd.sample(self.titles, min(len(self.titles),
+                                            len(self.titles) / 2 + 1))
+        def _line(title, rank):
+            distribution = ''.join([rnd.choice('0123456789.*')
+                                    for i in xrange(10)])
+            return '      %s  %7d   %s  %s\n' % (distribution,
+                    rnd.randint(5, 500000), rank, title)
+        for start, nr in (('RAT_TOP250_START', 250), ('RAT_BOT10_START', 10)):
+            fd.write(header(m[start][:-1]))
+            fd.write('%s  Votes  Rank  Title\n' % m[start][-1])
+            for title in rated[:nr]:
+                fd.write(_line(title, '%.1f' % rnd.uniform(1, 10)))
+            fd.write('\n')
+        fd.write(header(m['RAT_START']))
+        for title in rated:
+            fd.write(_line(title, '%.1f' % rnd.uniform(1, 10)))
+        fd.write('\n\nREPORT FORMAT\n')
+        fd.close()
+
+    def movieInfo(self, fname, start, values, perTitle=2, note=False):
+        """A file with information on a single line (genres, ...)."""
+        fd = self._open(fname)
+        fd.write('junk\n' + header(self.markers[start]))
+        rnd = self.random
+        for title in self.titles:
+            for value in rnd.sample(values, rnd.randint(1, perTitle)):
+                line = '%s\t\t\t%s' % (title, value)
+                if note and rnd.random() < 0.3:
+                    line += '\t(%s)' % self._words(1).lower()
+                fd.write(line + '\n')
+        fd.close()
+
+    def run(self):
+        self.movies()
+        nrPersons = self.nrPersons
+        self.cast('actors.list.gz', nrPersons * 4 / 10, 0)
+        self.cast('actresses.list.gz', nrPersons * 3 / 10, nrPersons * 4 / 10)
+        self.cast('directors.list.gz', nrPersons * 15 / 100,
+                nrPersons * 7 / 10, roles=False)
+        self.cast('writers.list.gz', nrPersons * 15 / 100,
+                nrPersons * 85 / 100, roles=False)
+        self.ratings()
+        self.movieInfo('genres.list.gz', 'GEN_START', GENRES, 3)
+        self.movieInfo('language.list.gz', 'LAN_START', LANGUAGES)
+        self.movieInfo('countries.list.gz', 'COU_START', COUNTRIES)
+        companies = ['%s %s [%s]' % (w.capitalize(), c, cc)
+                    for w in WORDS for c in COMPANIES
+                    for cc in ('us', 'it', 'fr')]
+        self.movieInfo('production-companies.list.gz', 'PRO_START',
+                    companies, note=True)
+
+
+def main():
+    try:
+        optlist, args = getopt.getopt(sys.argv[1:], 'm:p:s:h',
+                                    ['movies=', 'persons=', 'seed=', 'help'])
+    except getopt.error, e:
+        print 'Troubles with arguments: %s' % e
+        print HELP
+        sys.exit(2)
+    nrMovies = 10000
+    nrPersons = 20000
+    seed = 0
+    for opt, value in optlist:
+        if opt in ('-m', '--movies'):
+            nrMovies = int(value)
+        elif opt in ('-p', '--persons'):
+            nrPersons = int(value)
+        elif opt in ('-s', '--seed'):
+            seed = int(value)
+        elif opt in ('-h', '--help'):
+            print HELP
+            sys.exit(0)
+    if len(args) != 1:
+        print HELP
+        sys.exit(2)
+    if not os.path.isdir(args[0]):
+        os.makedirs(args[0])
+    Generator(args[0], nrMovies, nrPersons, seed).run()
+
+
+if __name__ == '__main__':
+    main()
+
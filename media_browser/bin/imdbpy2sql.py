@@ -14,12 +14,21 @@ import time
 import re
 import warnings
 import anydbm
+import marshal
+import json
+import shutil
+import tempfile
+import zlib
+import struct
+import threading
+import Queue
+from array import array
+from bisect import bisect_left
 from itertools import islice, chain
 try:
     from hashlib import md5
 except ImportError:
     from md5 import md5
-from gzip import GzipFile
 from types import UnicodeType
 
 #from imdb.parser.sql.dbschema import *
@@ -30,10 +39,11 @@ from imdb.utils import analyze_title, analyze_name, date_and_notes, \
         build_name, build_title, normalizeName, normalizeTitle, _articles, \
         build_company_name, analyze_company_name, canonicalTitle
 from imdb._exceptions import IMDbParserError, IMDbError
+from imdb.ptdf import splitFields, splitRating, splitCastLine
 
 
 HELP = """imdbpy2sql.py usage:
-    %s -d /directory/with/PlainTextDataFiles/ -u URI [-c /directory/for/CSV_files] [-o sqlobject,sqlalchemy] [-i table,dbm] [--CSV-OPTIONS] [--COMPATIBILITY-OPTIONS]
+    %s -d /directory/with/PlainTextDataFiles/ -u URI [-c /directory/for/CSV_files] [-o sqlobject,sqlalchemy] [-i table,dbm] [-j N] [--id-cache dict,compact,disk] [--metrics file] [--parsed-cache dir] [--prescan-cast] [--background-writer] [--adaptive-batches] [--sqlite-native] [--resume] [--delta] [--CSV-OPTIONS] [--COMPATIBILITY-OPTIONS]
 
         # NOTE: URI is something along the line:
                 scheme://[user[:password]@]host[:port]/database[?parameters]
@@ -44,6 +54,32 @@ HELP = """imdbpy2sql.py usage:
                 sqlite:/tmp/imdb.db
                 sqlite:/C|/full/path/to/database
 
+        # NOTE: resume (--resume):
+                At the end of every stage, a checkpoint with the IDs
+                assigned so far is saved in the imdbpy2sql.checkpoint
+                file; if a run is interrupted, --resume discards the
+                data of the unfinished stage and continues from there.
+                Not available in CSV mode.  With -i table, the imdbIDs
+                are also saved in dbm files next to the checkpoint
+                (imdbpy2sql.checkpoint.*_imdbIDs.db), since the
+                temporary tables are lost with the interrupted run.
+
+        # NOTE: delta mode (--delta):
+                Instead of dropping and recreating the database, titles,
+                names, characters, companies and keywords already in the
+                database are kept (along with their imdbIDs); new ones are
+                added and unreferenced ones are removed.  The data files
+                unchanged since the last run are skipped (checksums are
+                stored in the imdbpy2sql.delta file); for the others,
+                the checksums of the rows stored by the last run are
+                read from the database, and only the new rows are
+                inserted, while the ones not found again are deleted
+                (the memory used is proportional to the rows of the
+                largest changed file).  The other columns of titles and
+                names already in the database (e.g. the gender) are not
+                updated.  It requires a previous complete run (not in
+                CSV mode) and can't be used with --resume.
+
         # NOTE: CSV mode (-c path):
                 A directory is used to store CSV files; on supported
                 database servers it should be really fast.
@@ -57,6 +93,95 @@ HELP = """imdbpy2sql.py usage:
                 table of the database) or 'dbm' (imdbIDs stored on a dbm
                 file - this is the default if CSV is used).
 
+        # NOTE: parallel parsing (-j N or --jobs N):
+                The independent data files (companies, miscellaneous
+                movie info, ratings, ...) are parsed by N worker
+                processes; the actors and actresses lists are split in N
+                shards, parsed at the same time.  IDs are still assigned
+                by a single process, so the content of the database is
+                the same.
+                In CSV mode, up to N files are loaded at the same time
+                (over N connections, if the ORM provides them); the
+                indexes of N tables are built at the same time, too
+                (not on SQLite).
+
+        # NOTE: bulk loading:
+                Rows are stored with COPY FROM STDIN on PostgreSQL
+                (psycopg2) and LOAD DATA LOCAL INFILE on MySQL; if the
+                latter is not allowed by the server (local_infile), or
+                for other databases, INSERT statements are used: if a
+                batch is too large for the server (e.g. MySQL's
+                max_allowed_packet), it's split in two halves and
+                stored again, up to MAX_RECURSION times.
+
+        # NOTE: ID caches (--id-cache method):
+                The IDs assigned to titles, names, characters, companies
+                and keywords are kept in memory until the end of the run.
+                Valid options are 'dict' (the default: fastest, but a
+                full load needs several GB of RAM), 'compact' (only a
+                64 bit hash of every title/name is kept, in sorted
+                arrays: a fraction of the memory, and slightly slower)
+                or 'disk' (like 'compact', but the arrays are stored in
+                temporary files mapped in memory, so that they can be
+                paged out).  The memory used by every cache is reported
+                at the end of the cast lists and before the final flush.
+
+        # NOTE: adaptive batches (--adaptive-batches):
+                The number of rows stored at once in every table is
+                tuned while the data is imported, looking for the size
+                with the best throughput (rows per second), between
+                BATCH_MIN rows and the number of rows that fits in
+                BATCH_MEMORY bytes (estimated, for every table, from
+                the size of the flushed rows); every change is reported
+                (and written in the metrics).  Not used along with
+                the background writer.
+
+        # NOTE: background writer (--background-writer):
+                Rows are written to the database by a separate thread,
+                so that the data files are parsed while the previous
+                rows are stored; when too many batches are waiting to
+                be written, parsing is suspended.  If the writer fails
+                storing some data, the import is stopped with an error
+                as soon as more data is submitted (or at the end of the
+                stage); the batches queued after the failed one are not
+                stored, and are reported by table and number of rows.
+                The stage can be run again with --resume.  Not available
+                in CSV mode and for SQLite.
+
+        # NOTE: native SQLite loader (--sqlite-native):
+                Only for sqlite: URIs.  The ORM is used to create the
+                tables and the indexes, while the data is stored through
+                a separate connection of the sqlite3 module, with
+                write-ahead logging and without syncing to disk
+                (see SQLITE_PRAGMAS); the data of every stage is stored
+                in a single transaction, committed at its checkpoint.
+                The journal mode of the database is restored at the
+                end of the run.  It replaces --sqlite-transactions.
+
+        # NOTE: parsed cache (--parsed-cache dir):
+                The records parsed from the data files (cast lists,
+                companies, miscellaneous movie info, ratings, ...) are
+                stored in the given directory, in columns; later runs
+                read them from there, instead of parsing the gzipped
+                files again, as long as the data files are unchanged.
+                Remove the directory to parse everything again.
+
+        # NOTE: cast prescan (--prescan-cast):
+                Before the cast lists are stored, all of them are read
+                once to collect the titles and the names, that are
+                stored at once; the rows of the cast lists are then
+                stored without flushing titles and names every time.
+                All the new titles and names are kept in memory until
+                the end of the prescan.
+
+        # NOTE: metrics (--metrics file):
+                Metrics are appended to the given file, as JSON lines:
+                one "file" record for every data file read (lines and
+                lines per second), one "stage" record at the end of
+                every stage (duration, rows stored in every table,
+                number and duration of the flushes, size and hit rate
+                of the caches, peak RSS) and a final "run" record.
+
         # NOTE: --CSV-OPTIONS can be:
             --csv-ext STRING        files extension (.csv)
             --csv-only-write        exit after the CSV files are written.
@@ -69,6 +194,8 @@ HELP = """imdbpy2sql.py usage:
             --ms-sqlserver          compatibility mode for Microsoft SQL Server
                                     and SQL Express.
             --sqlite-transactions   uses transactions, to speed-up SQLite.
+            --sqlite-native         store data with the sqlite3 module
+                                    (see above).
 
 
                 See README.sqldb for more information.
@@ -87,6 +214,31 @@ DB_TABLES = []
 MAX_RECURSION = 10
 # Method used to (re)store imdbIDs.
 IMDBIDS_METHOD = None
+# Number of worker processes used to parse the data files.
+NR_JOBS = 1
+# Method used to keep the IDs of titles, names, ... in memory.
+ID_CACHE = 'dict'
+# Directory where the parsed records are kept across runs.
+PARSED_CACHE_DIR = None
+# Collect the titles and names of all the cast lists in advance.
+PRESCAN_CAST = False
+# Write to the database in a separate thread.
+BACKGROUND_WRITER = False
+# Tune the number of rows flushed at once.
+ADAPTIVE_BATCHES = False
+# Store the data in SQLite databases using the sqlite3 module.
+SQLITE_NATIVE = False
+# Pragmas of the sqlite3 connection used by --sqlite-native.
+SQLITE_PRAGMAS = ('journal_mode = WAL', 'synchronous = OFF',
+                'temp_store = MEMORY', 'cache_size = -262144')
+# File where the metrics are written, as JSON lines.
+METRICS_FILE = None
+# Continue an interrupted run, from its last checkpoint.
+RESUME = False
+CHECKPOINT_FILE = 'imdbpy2sql.checkpoint'
+# Update an existing database, reloading only the changed data files.
+DELTA = False
+DELTA_FILE = 'imdbpy2sql.delta'
 # If set, this directory is used to output CSV files.
 CSV_DIR = None
 CSV_CURS = None
@@ -151,12 +303,13 @@ if '--mysql-force-myisam' in sys.argv[1:]:
     sys.argv += MYSQLFORCEMYISAM_OPTS
 if '--ms-sqlserver' in sys.argv[1:]:
     sys.argv += SQLSERVER_OPTS
-if '--sqlite-transactions' in sys.argv[1:]:
+if '--sqlite-transactions' in sys.argv[1:] and \
+        '--sqlite-native' not in sys.argv[1:]:
     sys.argv += SQLITE_OPTS
 
 # Manage arguments list.
 try:
-    optlist, args = getopt.getopt(sys.argv[1:], 'u:d:e:o:c:i:h',
+    optlist, args = getopt.getopt(sys.argv[1:], 'u:d:e:o:c:i:j:h',
                                                 ['uri=', 'data=', 'execute=',
                                                 'mysql-innodb', 'ms-sqlserver',
                                                 'sqlite-transactions',
@@ -165,7 +318,14 @@ try:
                                                 'csv-only-write',
                                                 'csv-only-load',
                                                 'csv=', 'csv-ext=',
-                                                'imdbids=', 'help'])
+                                                'imdbids=', 'jobs=',
+                                                'id-cache=', 'metrics=',
+                                                'parsed-cache=',
+                                                'prescan-cast',
+                                                'background-writer',
+                                                'adaptive-batches',
+                                                'sqlite-native', 'resume',
+                                                'delta', 'help'])
 except getopt.error, e:
     print 'Troubles with arguments.'
     print HELP
@@ -182,6 +342,11 @@ for opt in optlist:
         CSV_EXT = opt[1]
     elif opt[0] in ('-i', '--imdbids'):
         IMDBIDS_METHOD = opt[1]
+    elif opt[0] in ('-j', '--jobs'):
+        try:
+            NR_JOBS = int(opt[1])
+        except ValueError:
+            NR_JOBS = 0
     elif opt[0] in ('-e', '--execute'):
         if opt[1].find(':') == -1:
             print 'WARNING: wrong command syntax: "%s"' % opt[1]
@@ -206,6 +371,24 @@ for opt in optlist:
         USE_ORM = opt[1].split(',')
     elif opt[0] == '--fix-old-style-titles':
         warnings.warn('The --fix-old-style-titles argument is obsolete.')
+    elif opt[0] == '--id-cache':
+        ID_CACHE = opt[1]
+    elif opt[0] == '--metrics':
+        METRICS_FILE = opt[1]
+    elif opt[0] == '--parsed-cache':
+        PARSED_CACHE_DIR = opt[1]
+    elif opt[0] == '--prescan-cast':
+        PRESCAN_CAST = True
+    elif opt[0] == '--background-writer':
+        BACKGROUND_WRITER = True
+    elif opt[0] == '--adaptive-batches':
+        ADAPTIVE_BATCHES = True
+    elif opt[0] == '--sqlite-native':
+        SQLITE_NATIVE = True
+    elif opt[0] == '--resume':
+        RESUME = True
+    elif opt[0] == '--delta':
+        DELTA = True
     elif opt[0] == '--csv-only-write':
         CSV_ONLY_WRITE = True
     elif opt[0] == '--csv-only-load':
@@ -229,11 +412,35 @@ if IMDBIDS_METHOD not in (None, 'dbm', 'table'):
     print HELP
     sys.exit(2)
 
+if NR_JOBS < 1:
+    print 'the number of jobs must be a positive integer'
+    print HELP
+    sys.exit(2)
+
+if ID_CACHE not in ('dict', 'compact', 'disk'):
+    print 'the ID cache method must be one of "dict", "compact" or "disk"'
+    print HELP
+    sys.exit(2)
+
+if ID_CACHE != 'dict' and array('l').itemsize < 8:
+    print 'WARNING: compact ID caches need 64 bit integers; using "dict".'
+    ID_CACHE = 'dict'
+
 if (CSV_ONLY_WRITE or CSV_ONLY_LOAD) and not CSV_DIR:
     print 'You must specify the CSV directory with the -c argument'
     print HELP
     sys.exit(3)
 
+if RESUME and CSV_DIR:
+    print 'The --resume argument can not be used in CSV mode'
+    print HELP
+    sys.exit(3)
+
+if DELTA and (CSV_DIR or RESUME):
+    print 'The --delta argument can not be used in CSV mode or with --resume'
+    print HELP
+    sys.exit(3)
+
 
 # Some warnings and notices.
 URIlower = URI.lower()
@@ -265,7 +472,7 @@ elif URIlower.startswith('mssql') and \
         '--ms-sqlserver' not in sys.argv[1:]:
     print "\nWARNING: you're using MS SQLServer without the --ms-sqlserver\n"\
             "command line option: if something goes wrong, try using it.\n"
-elif URIlower.startswith('sqlite') and \
+elif URIlower.startswith('sqlite') and not SQLITE_NATIVE and \
         '--sqlite-transactions' not in sys.argv[1:]:
     print "\nWARNING: you're using SQLite without the --sqlite-transactions\n"\
             "command line option: you'll have very poor performances!  Try\n"\
@@ -279,6 +486,9 @@ if ('--mysql-force-myisam' in sys.argv[1:] and
     print "\nWARNING: you've specified command line options that don't\n"\
             "belong to the database server you're using: proceed at your\n"\
             "own risk!\n"
+if SQLITE_NATIVE and not URIlower.startswith('sqlite'):
+    print 'WARNING: the --sqlite-native option is only used with SQLite.'
+    SQLITE_NATIVE = False
 
 
 if CSV_DIR:
@@ -353,6 +563,9 @@ class CSVCursor(object):
         self._fdPool = {}
         self._lobFDPool = {}
         self._counters = {}
+        # (table name, RawValue positions, row encoder) for every
+        # SQL statement.
+        self._encoders = {}
 
     def buildLine(self, items, tableToAddID=False, rawValues=(),
                     lobFD=None, lobFN=None):
@@ -405,54 +618,103 @@ class CSVCursor(object):
         # Build the line and add the end-of-line.
         return '%s%s' % (self.delimeter.join(r), self.csvEOL)
 
-    def executemany(self, sqlstr, items):
-        """Emulate the executemany method of a cursor, but writes the
-        data in a set of CSV files."""
+    def _sqlInfo(self, sqlstr):
+        """Return the table name and the list of (index, value) of the
+        RawValue(s) in the VALUES (...) portion of the query."""
         # XXX: find a safer way to get the table/file name!
         tName = sqlstr.split()[2]
-        lobFD = None
-        lobFN = None
-        doLOB = False
-        # XXX: ugly special case, to create the LOB file.
-        if URIlower.startswith('ibm') and tName == 'person_info':
-            doLOB = True
-        # Open the file descriptor or get it from the pool.
-        if tName in self._fdPool:
-            tFD = self._fdPool[tName]
-            lobFD = self._lobFDPool.get(tName)
-            lobFN = getattr(lobFD, 'name', None)
-            if lobFN:
-                lobFN = os.path.basename(lobFN)
-        else:
-            tFD = open(os.path.join(CSV_DIR, tName + self.csvExt), 'wb')
-            self._fdPool[tName] = tFD
-            if doLOB:
-                lobFN = '%s.lob' % tName
-                lobFD = open(os.path.join(CSV_DIR, lobFN), 'wb')
-                self._lobFDPool[tName] = lobFD
-        buildLine = self.buildLine
-        tableToAddID = False
-        if tName in ('cast_info', 'movie_info', 'person_info',
-                    'movie_companies', 'movie_link', 'aka_name',
-                    'complete_cast', 'movie_info_idx', 'movie_keyword'):
-            tableToAddID = tName
-            if tName not in self._counters:
-                self._counters[tName] = 1
         # Identify if there are RawValue in the VALUES (...) portion of
         # the query.
         parIdx = sqlstr.rfind('(')
         rawValues = []
-        vals = sqlstr[parIdx+1:-1]
+        nrParams = 0
         if parIdx != 0:
             vals = sqlstr[parIdx+1:-1]
             for idx, item in enumerate(vals.split(', ')):
                 if item[0] in ('%', '?', ':'):
+                    nrParams += 1
                     continue
                 rawValues.append((idx, item))
+        return tName, rawValues, nrParams
+
+    def makeEncoder(self, nrParams, tableToAddID=False, rawValues=()):
+        """Compile a function that builds the text lines for a list of
+        rows of nrParams values; it is called with the first value
+        of the counter of the table (ignored, if tableToAddID is not set)
+        and the rows, and returns the list of lines.
+        It's equivalent to buildLine, without the LOB handling."""
+        quote = self.quote
+        fields = []
+        args = []
+        if tableToAddID:
+            if self.quoteInteger and quote:
+                fields.append('%s%%d%s' % (quote, quote))
+            else:
+                fields.append('%d')
+            args.append('counter')
+        for idx in xrange(nrParams):
+            fields.append('%s')
+            v = 'v%d' % idx
+            conv = '(%s if %s.__class__ is str else str(%s))' % (v, v, v)
+            if quote:
+                conv = 'q + %s.replace(q, escaped) + q' % conv
+            if not self.quoteInteger:
+                # Integers are formatted by the % operator.
+                conv = '%s if %s.__class__ in _ints else %s' % (v, v, conv)
+            args.append('null if %s is None else %s' % (v, conv))
+        shift = tableToAddID and 1 or 0
+        for idx, item in rawValues:
+            fields.insert(idx + shift, item.replace('%', '%%'))
+        lineFormat = self.delimeter.replace('%', '%%').join(fields) + \
+                        self.csvEOL.replace('%', '%%')
+        code = 'def encode(start, rows):\n'
+        code += '    return [%r %% (%s)\n' % (lineFormat,
+                                        ''.join([x + ', ' for x in args]))
+        code += '            for counter, (%s) in enumerate(rows, start)]\n' % \
+                (''.join(['v%d, ' % i for i in xrange(nrParams)]) or '_')
+        namespace = {'q': quote, 'escaped': self.escaped, 'null': self.null,
+                    '_ints': (int, long, bool)}
+        exec code in namespace
+        return namespace['encode']
+
+    def executemany(self, sqlstr, items):
+        """Emulate the executemany method of a cursor, but writes the
+        data in a set of CSV files."""
+        if sqlstr not in self._encoders:
+            tName, rawValues, nrParams = self._sqlInfo(sqlstr)
+            tableToAddID = tName in ('cast_info', 'movie_info',
+                    'person_info', 'movie_companies', 'movie_link',
+                    'aka_name', 'complete_cast', 'movie_info_idx',
+                    'movie_keyword') and tName
+            encoder = None
+            # XXX: ugly special case, to create the LOB file.
+            if not (URIlower.startswith('ibm') and tName == 'person_info'):
+                encoder = self.makeEncoder(nrParams, tableToAddID, rawValues)
+            self._encoders[sqlstr] = (tName, tableToAddID, rawValues, encoder)
+        tName, tableToAddID, rawValues, encoder = self._encoders[sqlstr]
+        if tableToAddID and tName not in self._counters:
+            self._counters[tName] = 1
+        # Open the file descriptor or get it from the pool.
+        if tName not in self._fdPool:
+            self._fdPool[tName] = open(os.path.join(CSV_DIR,
+                                        tName + self.csvExt), 'wb')
+            if encoder is None:
+                lobFN = '%s.lob' % tName
+                self._lobFDPool[tName] = open(os.path.join(CSV_DIR, lobFN),
+                                            'wb')
+        tFD = self._fdPool[tName]
         # Write these lines.
-        tFD.writelines(buildLine(i, tableToAddID=tableToAddID,
-                        rawValues=rawValues, lobFD=lobFD, lobFN=lobFN)
-                        for i in items)
+        if encoder is not None:
+            lines = encoder(self._counters.get(tName, 0), items)
+            tFD.writelines(lines)
+            if tableToAddID:
+                self._counters[tName] += len(lines)
+        else:
+            lobFD = self._lobFDPool[tName]
+            lobFN = os.path.basename(lobFD.name)
+            tFD.writelines(self.buildLine(i, tableToAddID=tableToAddID,
+                            rawValues=rawValues, lobFD=lobFD, lobFN=lobFN)
+                            for i in items)
         # Flush to disk, so that no truncaded entries are ever left.
         # XXX: is this a good idea?
         tFD.flush()
@@ -488,33 +750,89 @@ class CSVCursor(object):
             fd.close()
 
 
-def loadCSVFiles():
-    """Load every CSV file into the database."""
+def _loadCSVFile(fName, connection):
+    """Load a CSV file into the database, using the given connection."""
+    curs = connection.cursor()
+    connection.commit()
+    tName = os.path.basename(fName[:-len(CSV_EXT)])
+    cfName = os.path.join(CSV_DIR, fName)
     CSV_REPL = {'quote': CSV_QUOTE, 'delimiter': CSV_DELIMITER,
-                'escape': CSV_ESCAPE, 'null': CSV_NULL, 'eol': CSV_EOL}
-    for fName in CSV_CURS.fileNames():
-        connectObject.commit()
-        tName = os.path.basename(fName[:-len(CSV_EXT)])
-        cfName = os.path.join(CSV_DIR, fName)
-        CSV_REPL['file'] = cfName
-        CSV_REPL['table'] = tName
-        sqlStr = CSV_LOAD_SQL % CSV_REPL
-        print ' * LOADING CSV FILE %s...' % cfName
-        sys.stdout.flush()
-        executeCustomQueries('BEFORE_CSV_TODB')
+                'escape': CSV_ESCAPE, 'null': CSV_NULL, 'eol': CSV_EOL,
+                'file': cfName, 'table': tName}
+    sqlStr = CSV_LOAD_SQL % CSV_REPL
+    since = _timeMark()
+    _log(' * LOADING CSV FILE %s...' % cfName)
+    executeCustomQueries('BEFORE_CSV_TODB', _curs=curs)
+    try:
+        curs.execute(sqlStr)
         try:
-            CURS.execute(sqlStr)
-            try:
-                res = CURS.fetchall()
-                if res:
-                    print 'LOADING OUTPUT:', res
-            except:
-                pass
-        except Exception, e:
-            print 'ERROR: unable to import CSV file %s: %s' % (cfName, str(e))
-            continue
-        connectObject.commit()
-        executeCustomQueries('AFTER_CSV_TODB')
+            res = curs.fetchall()
+            if res:
+                _log('LOADING OUTPUT: %s' % (res,))
+        except:
+            pass
+    except Exception, e:
+        _log('ERROR: unable to import CSV file %s: %s' % (cfName, str(e)))
+        return
+    connection.commit()
+    executeCustomQueries('AFTER_CSV_TODB', _curs=curs)
+    t('loading %s' % tName, since=since)
+
+
+def tableDependencies():
+    """Return a dictionary mapping the name of every table to the
+    names of the tables it refers to with a foreign key."""
+    names = dict([(table.__name__, tableName(table)) for table in DB_TABLES])
+    deps = {}
+    for table in DB_TABLES:
+        tName = tableName(table)
+        refs = set()
+        for col in table.sqlmeta.columns.values():
+            foreignKey = getattr(col, 'foreignKey', None)
+            if foreignKey and names.get(foreignKey, tName) != tName:
+                refs.add(names[foreignKey])
+        deps[tName] = refs
+    return deps
+
+
+def loadCSVFiles():
+    """Load every CSV file into the database; with NR_JOBS > 1,
+    independent tables are loaded at the same time, over different
+    connections."""
+    fNames = CSV_CURS.fileNames()
+    connections = []
+    if NR_JOBS > 1:
+        for i in xrange(min(NR_JOBS, len(fNames))):
+            connection = newConnection()
+            if connection is None:
+                break
+            connections.append(connection)
+        if len(connections) < 2:
+            print 'WARNING: unable to open more connections to the ' \
+                    'database; CSV files are loaded one at a time.'
+    if len(connections) < 2:
+        for fName in fNames:
+            _loadCSVFile(fName, connectObject)
+        return
+    pool = Queue.Queue()
+    for connection in connections:
+        pool.put(connection)
+    def _load(fName):
+        connection = pool.get()
+        try:
+            _loadCSVFile(fName, connection)
+        finally:
+            pool.put(connection)
+    tDeps = tableDependencies()
+    files = dict([(os.path.basename(fName[:-len(CSV_EXT)]), fName)
+                for fName in fNames])
+    fileDeps = {}
+    for tName, fName in files.iteritems():
+        fileDeps[fName] = [files[x] for x in tDeps.get(tName, ())
+                            if x in files]
+    runParallel(fNames, _load, fileDeps, len(connections))
+    for connection in connections:
+        connection.close()
 
 #-----------------------
 
@@ -548,10 +866,124 @@ if URI and URI.startswith('sqlite') and USED_ORM == 'sqlobject':
 # Cursor object.
 CURS = connectObject.cursor()
 
+
+def newConnection():
+    """Return a new connection to the database, or None if the ORM
+    can't provide more than one."""
+    try:
+        connection = conn.getConnection()
+    except Exception, e:
+        print 'WARNING: unable to open a new connection: %s' % e
+        return None
+    if connection is connectObject:
+        return None
+    return connection
+
 # Name of the database and style of the parameters.
 DB_NAME = conn.dbName
 PARAM_STYLE = conn.paramstyle
 
+if BACKGROUND_WRITER and (CSV_DIR or DB_NAME == 'sqlite'):
+    # SQLite connections can't be shared among threads, and CSV
+    # files are written by the main process.
+    print 'WARNING: the background writer is not available in CSV mode'
+    print 'WARNING: and for SQLite; rows will be written by the main thread.'
+    BACKGROUND_WRITER = False
+
+
+class SQLiteConnection(object):
+    """A connection of the sqlite3 module to the database opened by
+    the ORM, used to store the data with --sqlite-native; the rows of
+    a stage are stored in a single transaction, started by begin()
+    and committed by end() at its checkpoint (stages can be nested):
+    meanwhile, commit() does nothing."""
+    def __init__(self, fileName, ormConnection):
+        import sqlite3
+        self.fileName = fileName
+        self.ormConnection = ormConnection
+        self.connection = sqlite3.connect(fileName, isolation_level=None)
+        self.connection.text_factory = str
+        self._depth = 0
+        curs = self.connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            curs.execute('PRAGMA %s;' % pragma)
+        curs.close()
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def inStage(self):
+        """Return True if the transaction of a stage is open."""
+        return self._depth > 0
+
+    def begin(self):
+        self._depth += 1
+        if self._depth == 1:
+            self.connection.execute('BEGIN')
+
+    def end(self):
+        if not self._depth:
+            return
+        self._depth -= 1
+        self.connection.execute('COMMIT')
+        if self._depth:
+            # The enclosing stage goes on in a new transaction.
+            self.connection.execute('BEGIN')
+
+    def commit(self):
+        if not self._depth:
+            self.connection.commit()
+
+    def finish(self):
+        """Close the connection and restore the default journal mode,
+        so that the database is left in a single file; the journal mode
+        can't be changed while other connections use the database."""
+        self.connection.close()
+        try:
+            self.ormConnection.commit()
+            curs = self.ormConnection.cursor()
+            curs.execute('PRAGMA journal_mode = DELETE;')
+            curs.close()
+        except Exception, e:
+            print 'WARNING: unable to restore the journal mode of %s: %s' % \
+                    (self.fileName, e)
+
+
+def _sqliteFileName(curs):
+    """Return the file name of the main database of a sqlite
+    connection, or None for in-memory databases."""
+    curs.execute('PRAGMA database_list;')
+    for row in curs.fetchall():
+        if row[1] == 'main':
+            return row[2] or None
+    return None
+
+
+if SQLITE_NATIVE:
+    _fileName = _sqliteFileName(CURS)
+    if _fileName is None:
+        print 'WARNING: --sqlite-native is not available for in-memory'
+        print 'WARNING: databases; using the connection of the ORM.'
+        SQLITE_NATIVE = False
+    else:
+        print 'STORING data with the sqlite3 module in %s' % _fileName
+        connectObject = SQLiteConnection(_fileName, connectObject)
+        CURS = connectObject.cursor()
+
+
+def beginStage():
+    """Start the transaction of a stage (--sqlite-native only)."""
+    if SQLITE_NATIVE:
+        connectObject.begin()
+
+
+def commitStage():
+    """Commit the data stored so far by the current stage."""
+    if SQLITE_NATIVE:
+        connectObject.end()
+    else:
+        connectObject.commit()
+
 
 def _get_imdbids_method():
     """Return the method to be used to (re)store
@@ -598,6 +1030,26 @@ def _makeConvNamed(cols):
         return params
     return _converter
 
+def _valStr(s, index):
+    """Return the placeholder of a parameter, in the style of the db."""
+    if DB_NAME in ('mysql', 'postgres'): return '%s'
+    elif PARAM_STYLE == 'format': return '%s'
+    elif PARAM_STYLE == 'qmark': return '?'
+    elif PARAM_STYLE == 'numeric': return ':%s' % index
+    elif PARAM_STYLE == 'named': return ':%s' % s
+    elif PARAM_STYLE == 'pyformat': return '%(' + s + ')s'
+    return '%s'
+
+
+def _converterFor(cols):
+    """Return the function used to convert a row of parameters."""
+    if DB_NAME not in ('mysql', 'postgres') and \
+            PARAM_STYLE in ('named', 'pyformat'):
+        return _makeConvNamed(cols)
+    # Return the list itself.
+    return _identity
+
+
 def createSQLstr(table, cols, command='INSERT'):
     """Given a table and a list of columns returns a sql statement
     useful to insert a set of data in the database.
@@ -607,17 +1059,11 @@ def createSQLstr(table, cols, command='INSERT'):
     colNames = []
     values = []
     convCols = []
+    rawValues = []
     count = 1
-    def _valStr(s, index):
-        if DB_NAME in ('mysql', 'postgres'): return '%s'
-        elif PARAM_STYLE == 'format': return '%s'
-        elif PARAM_STYLE == 'qmark': return '?'
-        elif PARAM_STYLE == 'numeric': return ':%s' % index
-        elif PARAM_STYLE == 'named': return ':%s' % s
-        elif PARAM_STYLE == 'pyformat': return '%(' + s + ')s'
-        return '%s'
     for col in cols:
         if isinstance(col, RawValue):
+            rawValues.append((len(colNames), col.value))
             colNames.append(colName(table, col.string))
             values.append(str(col.value))
         elif col == 'id':
@@ -632,14 +1078,361 @@ def createSQLstr(table, cols, command='INSERT'):
             count += 1
     sqlstr += '(%s) ' % ', '.join(colNames)
     sqlstr += 'VALUES (%s)' % ', '.join(values)
-    if DB_NAME not in ('mysql', 'postgres') and \
-            PARAM_STYLE in ('named', 'pyformat'):
-        converter = _makeConvNamed(convCols)
-    else:
-        # Return the list itself.
-        converter = lambda x: x
+    converter = _converterFor(convCols)
+    _BULK_SPECS[sqlstr] = (tableName(table), colNames, rawValues)
     return sqlstr, converter
 
+
+def createRawSQLstr(tName, colNames):
+    """Like createSQLstr, for a table (not managed by the ORM) and
+    a list of names of columns."""
+    values = [_valStr(col, idx + 1) for idx, col in enumerate(colNames)]
+    sqlstr = 'INSERT INTO %s (%s) VALUES (%s)' % (tName, ', '.join(colNames),
+                                                ', '.join(values))
+    _BULK_SPECS[sqlstr] = (tName, list(colNames), [])
+    return sqlstr, _converterFor(colNames)
+
+
+def _identity(x):
+    return x
+
+
+#-----------------------
+# Bulk loading.
+#
+# Rows are sent to the database through the fastest path it offers:
+# COPY FROM STDIN for PostgreSQL, LOAD DATA LOCAL INFILE for MySQL,
+# executemany over an iterator (a single prepared statement) for SQLite,
+# and a plain executemany for everything else.
+
+# Table, list of columns and (index, value) of the RawValue columns,
+# for every statement built by createSQLstr.
+_BULK_SPECS = {}
+# Writers, for every statement.
+_BULK_WRITERS = {}
+# Set to False if LOAD DATA LOCAL INFILE is not allowed by MySQL.
+_MYSQL_LOCAL_INFILE = None
+
+_BULK_ESCAPE_RE = re.compile(r'[\\\t\n\r]')
+_BULK_ESCAPES = {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'}
+
+def _escapeBulk(match):
+    return _BULK_ESCAPES[match.group()]
+
+
+def _bulkValue(value):
+    """Return a value in the text format used by COPY and LOAD DATA."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, (int, long)):
+        return str(value)
+    if isinstance(value, UnicodeType):
+        value = value.encode('utf_8')
+    else:
+        value = str(value)
+    return _BULK_ESCAPE_RE.sub(_escapeBulk, value)
+
+
+class _LineStream(object):
+    """File-like object, reading the lines yielded by an iterator."""
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ''
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        for line in self._lines:
+            chunks.append(line)
+            length += len(line)
+            if size >= 0 and length >= size:
+                break
+        data = ''.join(chunks)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def readline(self, size=-1):
+        if self._buffer:
+            line = self._buffer
+            self._buffer = ''
+            return line
+        for line in self._lines:
+            return line
+        return ''
+
+
+class BulkWriter(object):
+    """Insert rows with the executemany method of the cursor."""
+    def __init__(self, sqlstr, converter):
+        self.sqlstr = sqlstr
+        self.converter = converter
+        self.table, self.columns, self.rawValues = _BULK_SPECS[sqlstr]
+
+    def write(self, rows):
+        """Insert the rows (an iterable of tuples)."""
+        self._insert(list(self.converter(list(rows))))
+
+    def _insert(self, params, _recursionLevel=0):
+        """Insert the converted rows with a single statement; if it's too
+        large for the database, the rows are split in two halves."""
+        try:
+            CURS.executemany(self.sqlstr, params)
+        except OperationalError, e:
+            if _recursionLevel >= MAX_RECURSION or len(params) < 2:
+                print 'WARNING recursion level exceded trying to flush data'
+                print 'WARNING this batch of data is lost (%d items in ' \
+                        '%s): %s' % (len(params), self.table, e)
+                return
+            _recursionLevel += 1
+            half = len(params) / 2
+            print ' * TOO MANY DATA (%d items in %s), recursion: %s' % \
+                    (len(params), self.table, _recursionLevel)
+            print '   * SPLITTING (run 1 of 2), recursion: %s' % \
+                    _recursionLevel
+            self._insert(params[:half], _recursionLevel)
+            print '   * SPLITTING (run 2 of 2), recursion: %s' % \
+                    _recursionLevel
+            self._insert(params[half:], _recursionLevel)
+
+    def lines(self, rows):
+        """Yield the rows, as lines of tab separated values."""
+        rawValues = self.rawValues
+        joiner = '\t'.join
+        for row in rows:
+            if rawValues:
+                row = list(row)
+                for idx, value in rawValues:
+                    row.insert(idx, value)
+            yield joiner([_bulkValue(x) for x in row]) + '\n'
+
+
+class SQLiteWriter(BulkWriter):
+    """The statement is prepared once and the rows are read from the
+    iterator as they are inserted, in a single transaction."""
+    def write(self, rows):
+        autocommit = getattr(connectObject, 'isolation_level', '') is None
+        if SQLITE_NATIVE and connectObject.inStage():
+            autocommit = False
+        if autocommit:
+            CURS.execute('BEGIN')
+        CURS.executemany(self.sqlstr, self.converter(iter(rows)))
+        if autocommit:
+            CURS.execute('COMMIT')
+
+
+class PostgresCopyWriter(BulkWriter):
+    """Stream the rows with COPY ... FROM STDIN."""
+    def write(self, rows):
+        CURS.copy_expert('COPY %s (%s) FROM STDIN' % (self.table,
+                        ', '.join(self.columns)), _LineStream(self.lines(rows)))
+
+
+class MySQLLoadWriter(BulkWriter):
+    """Write the rows in a temporary file, loaded with LOAD DATA LOCAL
+    INFILE; MySQL can't read them from a stream."""
+    def _load(self, fname):
+        CURS.execute("LOAD DATA LOCAL INFILE '%s' INTO TABLE %s "
+                    "CHARACTER SET utf8 (%s)" % (fname.replace('\\', '/'),
+                    self.table, ', '.join(self.columns)))
+
+    def write(self, rows):
+        fd, fname = tempfile.mkstemp(prefix='imdbpy2sql-', suffix='.txt',
+                                    dir=CSV_DIR)
+        try:
+            dataFD = os.fdopen(fd, 'wb')
+            dataFD.writelines(self.lines(rows))
+            dataFD.close()
+            self._load(fname)
+        finally:
+            os.unlink(fname)
+
+    def canLoad(self):
+        """Return True if LOAD DATA LOCAL INFILE is allowed."""
+        global _MYSQL_LOCAL_INFILE
+        if _MYSQL_LOCAL_INFILE is None:
+            try:
+                self.write(())
+                _MYSQL_LOCAL_INFILE = True
+            except Exception, e:
+                print 'WARNING: LOAD DATA LOCAL INFILE is not available ' \
+                        '(%s); using INSERT statements.' % e
+                _MYSQL_LOCAL_INFILE = False
+        return _MYSQL_LOCAL_INFILE
+
+
+def bulkWriter(sqlstr, converter):
+    """Return the writer for the given statement."""
+    writer = _BULK_WRITERS.get(sqlstr)
+    if writer is not None:
+        return writer
+    if DB_NAME == 'postgres' and hasattr(CURS, 'copy_expert'):
+        writer = PostgresCopyWriter(sqlstr, converter)
+    elif DB_NAME == 'mysql':
+        writer = MySQLLoadWriter(sqlstr, converter)
+        if not writer.canLoad():
+            writer = BulkWriter(sqlstr, converter)
+    elif DB_NAME == 'sqlite' and converter is _identity:
+        writer = SQLiteWriter(sqlstr, converter)
+    else:
+        writer = BulkWriter(sqlstr, converter)
+    _BULK_WRITERS[sqlstr] = writer
+    return writer
+
+
+def _writeRows(sqlstr, converter, rows):
+    """Store the rows in the database."""
+    bulkWriter(sqlstr, converter).write(rows)
+
+
+def insertRows(sqlstr, converter, rows):
+    """Store the rows (an iterable of tuples) in the database, or in
+    the CSV files."""
+    if _DELTA_ROWS:
+        rows = deltaNewRows(sqlstr, rows)
+    if METRICS_FILE is not None:
+        rows = _countingRows(_BULK_SPECS[sqlstr][0], rows)
+    if CSV_DIR:
+        CSV_CURS.executemany(sqlstr, rows)
+    elif _WRITER is not None:
+        # The rows are usually generated from data that is going to
+        # be cleared, as soon as we return.
+        _WRITER.submit(_writeRows, sqlstr, converter, list(rows))
+    else:
+        _writeRows(sqlstr, converter, rows)
+
+
+# Background writer (--background-writer).
+
+# Maximum number of calls waiting to be run by the writer thread.
+WRITE_QUEUE_SIZE = 8
+_WRITER = None
+
+class WriterError(Exception):
+    """A call run by the background writer failed: the data submitted
+    after it was not stored, and the import can't go on."""
+
+
+def _describeCall(funct, args):
+    """Describe a call submitted to the background writer."""
+    if funct is _writeRows:
+        return '%d rows for table %s' % (len(args[2]),
+                                        _BULK_SPECS[args[0]][0])
+    if funct is executeCustomQueries:
+        return 'the %s queries' % args[0]
+    return getattr(funct, '__name__', repr(funct))
+
+
+class BackgroundWriter(threading.Thread):
+    """Thread that runs the calls that write to the database, in the
+    order they were submitted; submit() blocks while the queue is full."""
+    def __init__(self, size=None):
+        threading.Thread.__init__(self, name='writer')
+        self.setDaemon(True)
+        self.queue = Queue.Queue(size or WRITE_QUEUE_SIZE)
+        # The exception (as returned by sys.exc_info) raised by the first
+        # failed call; re-raised in the main thread, as a WriterError, by
+        # submit(), wait() and stop().
+        self.error = None
+
+    def run(self):
+        get = self.queue.get
+        done = self.queue.task_done
+        while 1:
+            item = get()
+            try:
+                if item is None:
+                    return
+                funct, args, kwds = item
+                # After an error, the remaining calls are discarded: the
+                # exception is going to stop the import.
+                if self.error is not None:
+                    self._discard(funct, args)
+                    continue
+                try:
+                    funct(*args, **kwds)
+                except Exception, e:
+                    self.error = sys.exc_info()
+                    print 'ERROR: the background writer failed storing ' \
+                            '%s: %s' % (_describeCall(funct, args), e)
+            finally:
+                done()
+
+    def _discard(self, funct, args):
+        """Report a call that is not going to be run."""
+        print 'ERROR: data not stored, because of a previous error: %s' % \
+                _describeCall(funct, args)
+
+    def submit(self, funct, *args, **kwds):
+        if self.error is not None:
+            self._discard(funct, args)
+        self._raiseError()
+        self.queue.put((funct, args, kwds))
+
+    def _raiseError(self):
+        """Raise, in the calling thread, a WriterError for the failed call;
+        the error is kept, so that the import is stopped even if
+        the exception is caught."""
+        error = self.error
+        if error is not None:
+            raise WriterError('error writing to the database: %s: %s' %
+                            (error[0].__name__, error[1])), None, error[2]
+
+    def wait(self):
+        """Wait for every submitted call to be completed."""
+        queue = self.queue
+        queue.all_tasks_done.acquire()
+        try:
+            # A timeout, so that KeyboardInterrupt is received.
+            while queue.unfinished_tasks:
+                queue.all_tasks_done.wait(1)
+        finally:
+            queue.all_tasks_done.release()
+        self._raiseError()
+
+    def stop(self):
+        self.queue.put(None)
+        while self.isAlive():
+            self.join(1)
+        self._raiseError()
+
+
+def dbWrite(funct, *args, **kwds):
+    """Call funct, in the background writer thread if it's running."""
+    if _WRITER is not None and threading.currentThread() is not _WRITER:
+        _WRITER.submit(funct, *args, **kwds)
+    else:
+        funct(*args, **kwds)
+
+
+def startWriter():
+    """Start the background writer, if required; return True if
+    it was started."""
+    global _WRITER
+    if not BACKGROUND_WRITER or _WRITER is not None:
+        return False
+    _WRITER = BackgroundWriter()
+    _WRITER.start()
+    return True
+
+
+def waitWriter():
+    """Wait for the background writer (if any) to complete its work,
+    before the database is read by the main thread."""
+    if _WRITER is not None:
+        _WRITER.wait()
+
+
+def stopWriter():
+    """Wait for the background writer to complete its work, and stop it."""
+    global _WRITER
+    writer = _WRITER
+    if writer is not None:
+        _WRITER = None
+        writer.stop()
+
 def _(s, truncateAt=None):
     """Nicely print a string to sys.stdout, optionally
     truncating it a the given char."""
@@ -669,37 +1462,250 @@ def _minSec(*t):
         l.extend(divmod(int(i), 60))
     return tuple(l)
 
-def t(s, sinceBegin=False):
-    """Pretty-print timing information."""
+def _timeMark():
+    """Return the current wall clock and process times, to be used
+    with the 'since' argument of t()."""
+    return int(time.time()), os.times()
+
+def t(s, sinceBegin=False, since=None):
+    """Pretty-print timing information; since is a value returned
+    by _timeMark(), for operations run in parallel."""
     global CTIME, CTIMES
-    nt = int(time.time())
-    ntimes = os.times()
-    if not sinceBegin:
+    nt, ntimes = _timeMark()
+    if since is not None:
+        ct, cts = since
+    elif not sinceBegin:
         ct = CTIME
         cts = CTIMES
     else:
         ct = BEGIN_TIME
         cts = BEGIN_TIMES
-    print '# TIME', s, \
-            ': %dmin, %dsec (wall) %dmin, %dsec (user) %dmin, %dsec (system)' \
-            % _minSec(nt-ct, ntimes[0]-cts[0], ntimes[1]-cts[1])
-    if not sinceBegin:
+    _log('# TIME %s : %dmin, %dsec (wall) %dmin, %dsec (user) '
+            '%dmin, %dsec (system)' % ((s,) + _minSec(nt-ct, ntimes[0]-cts[0],
+                                                        ntimes[1]-cts[1])))
+    if not (sinceBegin or since is not None):
         CTIME = nt
         CTIMES = ntimes
 
-def title_soundex(title):
-    """Return the soundex code for the given title; the (optional) starting
-    article is pruned.  It assumes to receive a title without year/imdbIndex
-    or kind indications, but just the title string, as the one in the
-    analyze_title(title)['title'] value."""
-    if not title: return None
+# Serialize the output of the threads.
+_OUTPUT_LOCK = threading.Lock()
+
+def _log(msg):
+    """Print a line of output (safe to be called by threads)."""
+    _OUTPUT_LOCK.acquire()
+    try:
+        print msg
+        sys.stdout.flush()
+    finally:
+        _OUTPUT_LOCK.release()
+
+
+# Metrics.
+
+# Rows stored in every table; number and duration of the flushes
+# of every cache/table.
+METRICS = {'rows': {}, 'flushes': {}}
+_METRICS_FD = None
+
+def metric(event, **data):
+    """Append a record to the metrics file, if any."""
+    global _METRICS_FD
+    if METRICS_FILE is None:
+        return
+    if _METRICS_FD is None:
+        _METRICS_FD = open(METRICS_FILE, 'a')
+    data['event'] = event
+    data['time'] = round(time.time(), 3)
+    # A single write, so that records written by the worker processes
+    # are not mixed.
+    _METRICS_FD.write(json.dumps(data, sort_keys=True) + '\n')
+    _METRICS_FD.flush()
+
+
+def peakRSS():
+    """Return the peak resident set size of the process, in KB
+    (None if unknown)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes, not KB.
+        rss /= 1024
+    return rss
+
+
+def _countingRows(table, rows):
+    """Yield the rows, counting them in METRICS['rows']."""
+    tableRows = METRICS['rows']
+    nrRows = 0
+    try:
+        for row in rows:
+            nrRows += 1
+            yield row
+    finally:
+        tableRows[table] = tableRows.get(table, 0) + nrRows
+
+
+def countFlush(name, seconds):
+    """Record a flush of the given cache or table."""
+    flushes = METRICS['flushes'].setdefault(name, [0, 0.0])
+    flushes[0] += 1
+    flushes[1] += seconds
+
+
+def _cachesMetrics():
+    """Return the size and the hit rate of the main caches."""
+    res = {}
+    for cache in (CACHE_MID, CACHE_PID, CACHE_CID):
+        misses = cache.misses
+        lookups = cache.hits + misses
+        res[cache.className] = {'size': len(cache), 'hits': cache.hits,
+                'misses': misses,
+                'hit_rate': lookups and round(cache.hits / float(lookups), 4)}
+    return res
+
+
+def _diffCounts(after, before):
+    """Return the increments of the counts in after, from before."""
+    res = {}
+    for key, value in after.iteritems():
+        if isinstance(value, list):
+            old = before.get(key, [0, 0.0])
+            value = [value[0] - old[0], round(value[1] - old[1], 3)]
+            if value[0]: res[key] = value
+        else:
+            value -= before.get(key, 0)
+            if value: res[key] = value
+    return res
+
+
+def _metricsMark():
+    """Return a copy of the metrics collected so far."""
+    return {'time': time.time(), 'rows': METRICS['rows'].copy(),
+            'flushes': dict([(k, list(v))
+                            for k, v in METRICS['flushes'].iteritems()])}
+
+
+def stageMetrics(stage, mark):
+    """Write the metrics of a stage; mark is the value returned
+    by _metricsMark() before it started."""
+    if METRICS_FILE is None:
+        return
+    metric('stage', stage=stage,
+            seconds=round(time.time() - mark['time'], 3),
+            rows=_diffCounts(METRICS['rows'], mark['rows']),
+            flushes=_diffCounts(METRICS['flushes'], mark['flushes']),
+            caches=_cachesMetrics(), peak_rss_kb=peakRSS())
+
+
+def runMetrics():
+    """Write the metrics of the whole run."""
+    if METRICS_FILE is None:
+        return
+    metric('run', seconds=round(time.time() - BEGIN_TIME, 3),
+            rows=METRICS['rows'], flushes=_diffCounts(METRICS['flushes'], {}),
+            peak_rss_kb=peakRSS())
+
+
+def runParallel(items, funct, deps=None, nrThreads=None):
+    """Call funct(item) for every item, using nrThreads threads (NR_JOBS
+    by default); an item is processed only after the items listed
+    in deps[item] are done."""
+    if nrThreads is None:
+        nrThreads = NR_JOBS
+    deps = deps or {}
+    pending = list(items)
+    names = set(pending)
+    done = set()
+    running = set()
+    cond = threading.Condition()
+    def _next():
+        # The first pending item whose dependencies are done.
+        for item in pending:
+            for dep in deps.get(item, ()):
+                if dep in names and dep not in done and dep != item:
+                    break
+            else:
+                return item
+        if not running:
+            # Circular dependencies: go on anyway.
+            return pending[0]
+        return None
+    def _worker():
+        while True:
+            cond.acquire()
+            try:
+                while True:
+                    if not pending:
+                        return
+                    item = _next()
+                    if item is not None:
+                        break
+                    cond.wait()
+                pending.remove(item)
+                running.add(item)
+            finally:
+                cond.release()
+            try:
+                funct(item)
+            finally:
+                cond.acquire()
+                running.discard(item)
+                done.add(item)
+                cond.notifyAll()
+                cond.release()
+    threads = [threading.Thread(target=_worker)
+                for i in xrange(min(nrThreads, len(pending)))]
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    for thread in threads:
+        # A timeout, so that KeyboardInterrupt is received.
+        while thread.isAlive():
+            thread.join(1)
+
+# Maximum number of entries of every memo of phonetic codes.
+SOUNDEX_CACHE_SIZE = 250000
+
+class _Memo(dict):
+    """Bounded memo of the results of a function of a single (hashable)
+    argument; when it's full, it's emptied."""
+    def __init__(self, funct, maxSize=None):
+        dict.__init__(self)
+        self.funct = funct
+        self.maxSize = maxSize or SOUNDEX_CACHE_SIZE
+
+    def __missing__(self, key):
+        if len(self) >= self.maxSize:
+            self.clear()
+        value = self[key] = self.funct(key)
+        return value
+
+
+# The same surnames and titles are found again and again.
+_soundex = _Memo(soundex)
+
+def _title_soundex(title):
+    """Uncached version of title_soundex."""
     # Convert to canonical format.
     title = canonicalTitle(title)
     ts = title.split(', ')
     # Strip the ending article, if any.
     if ts[-1].lower() in _articles:
         title = ', '.join(ts[:-1])
-    return soundex(title)
+    return _soundex[title]
+
+_TITLE_SOUNDEX = _Memo(_title_soundex)
+
+def title_soundex(title):
+    """Return the soundex code for the given title; the (optional) starting
+    article is pruned.  It assumes to receive a title without year/imdbIndex
+    or kind indications, but just the title string, as the one in the
+    analyze_title(title)['title'] value."""
+    if not title: return None
+    return _TITLE_SOUNDEX[title]
 
 def name_soundexes(name, character=False):
     """Return three soundex codes for the given name; the name is assumed
@@ -720,12 +1726,17 @@ def name_soundexes(name, character=False):
     if s1 == s2: s2 = None
     if not character:
         namesplit = name.split(', ')
-        s3 = soundex(namesplit[0])
+        s3 = _soundex[namesplit[0]]
     else:
-        s3 = soundex(name.split(' ')[-1])
+        s3 = _soundex[name.split(' ')[-1]]
     if s3 and s3 in (s1, s2): s3 = None
     return (s1, s2, s3)
 
+def clearSoundexCaches():
+    """Empty the memos of the phonetic codes."""
+    _soundex.clear()
+    _TITLE_SOUNDEX.clear()
+
 
 # Tags to identify where the meaningful data begin/end in files.
 MOVIES = 'movies.list.gz'
@@ -784,15 +1795,31 @@ COMPCAST_START = ('CAST COVERAGE TRACKING LIST', '===========================')
 COMPCREW_START = ('CREW COVERAGE TRACKING LIST', '===========================')
 COMP_STOP = '---------------'
 
-GzipFileRL = GzipFile.readline
-class SourceFile(GzipFile):
+def _findLineStart(text, marker):
+    """Return the index of the first line of text starting with
+    marker, or -1."""
+    if text.startswith(marker):
+        return 0
+    idx = text.find('\n' + marker)
+    if idx != -1:
+        idx += 1
+    return idx
+
+# Size of the blocks of compressed data read from the data files.
+READ_BLOCK = 1024 * 1024
+
+class SourceFile(object):
     """Instances of this class are used to read gzipped files,
-    starting from a defined line to a (optionally) given end."""
+    starting from a defined line to a (optionally) given end.
+
+    The data is decompressed in large blocks; every block is converted
+    from latin_1 to utf_8 and split in lines at once, and the start/stop
+    markers are searched in the whole block."""
     def __init__(self, filename=None, mode=None, start=(), stop=None,
                     pwarning=1, *args, **kwds):
         filename = os.path.join(IMDB_PTDF_DIR, filename)
         try:
-            GzipFile.__init__(self, filename, mode, *args, **kwds)
+            self.fileobj = open(filename, 'rb')
         except IOError, e:
             if not pwarning: raise
             print 'WARNING WARNING WARNING'
@@ -802,29 +1829,124 @@ class SourceFile(GzipFile):
             print 'WARNING Complete error: ', e
             # re-raise the exception.
             raise
+        self.name = filename
+        # 16 + MAX_WBITS: expect the gzip header and trailer.
+        self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # Incomplete last line of the previous block.
+        self._pending = ''
+        self._eof = False
+        # Lines of the current block, in reverse order.
+        self._lines = []
+        # Lines and (uncompressed) bytes read, for the metrics.
+        self.nrLines = 0
+        self.nrBytes = 0
+        self._openTime = time.time()
         self.start = start
-        for item in start:
-            itemlen = len(item)
-            for line in self:
-                if line[:itemlen] == item: break
+        self._toStart = list(start)
+        self.stop = None
         self.set_stop(stop)
 
     def set_stop(self, stop):
-        if stop is not None:
-            self.stop = stop
-            self.stoplen = len(self.stop)
-            self.readline = self.readline_checkEnd
-        else:
-            self.readline = self.readline_NOcheckEnd
+        self.stop = stop
+        if stop is not None and self._lines:
+            # Lines already read from the current block.
+            lines = self._lines
+            for idx in xrange(len(lines) - 1, -1, -1):
+                if lines[idx].startswith(stop):
+                    del lines[:idx + 1]
+                    self._eof = True
+                    break
 
-    def readline_NOcheckEnd(self, size=-1):
-        line = GzipFile.readline(self, size)
-        return unicode(line, 'latin_1').encode('utf_8')
+    def _decompress(self, data):
+        """Decompress a block of data; a file can be made of more than
+        one gzip member."""
+        try:
+            text = self._decomp.decompress(data)
+            while self._decomp.unused_data:
+                data = self._decomp.unused_data
+                self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                text += self._decomp.decompress(data)
+        except zlib.error, e:
+            raise IOError('error reading %s: %s' % (self.name, e))
+        return text
+
+    def _nextBlock(self):
+        """Return the next block of complete lines, converted to utf_8;
+        an empty string is returned at the end of the data."""
+        while not self._eof:
+            data = self.fileobj.read(READ_BLOCK)
+            if data:
+                text = self._pending + self._decompress(data)
+                nlIdx = text.rfind('\n') + 1
+                self._pending = text[nlIdx:]
+                text = text[:nlIdx]
+            else:
+                self._eof = True
+                text = self._pending + self._decomp.flush()
+                self._pending = ''
+            toStart = self._toStart
+            while text and toStart:
+                # Skip everything up to the line starting with the marker.
+                markerIdx = _findLineStart(text, toStart[0])
+                if markerIdx == -1:
+                    text = ''
+                    break
+                del toStart[0]
+                nlIdx = text.find('\n', markerIdx) + 1
+                if nlIdx == 0: text = ''
+                else: text = text[nlIdx:]
+            if not text:
+                continue
+            if self.stop is not None:
+                stopIdx = _findLineStart(text, self.stop)
+                if stopIdx != -1:
+                    text = text[:stopIdx]
+                    self._eof = True
+            if text:
+                return unicode(text, 'latin_1').encode('utf_8')
+        return ''
+
+    def _fillLines(self):
+        """Put the lines of the next block in self._lines; return False
+        at the end of the data."""
+        text = self._nextBlock()
+        if not text:
+            return False
+        if '\r' in text:
+            # splitlines() would break lines at carriage returns, too.
+            lines = [line + '\n' for line in text.split('\n')]
+            if text[-1] == '\n': del lines[-1]
+            else: lines[-1] = lines[-1][:-1]
+        else:
+            lines = text.splitlines(True)
+        self.nrLines += len(lines)
+        self.nrBytes += len(text)
+        lines.reverse()
+        self._lines[:] = lines
+        return True
 
-    def readline_checkEnd(self, size=-1):
-        line = GzipFile.readline(self, size)
-        if self.stop is not None and line[:self.stoplen] == self.stop: return ''
-        return unicode(line, 'latin_1').encode('utf_8')
+    def readline(self, size=-1):
+        if not self._lines and not self._fillLines():
+            return ''
+        return self._lines.pop()
+
+    def __iter__(self):
+        lines = self._lines
+        pop = lines.pop
+        while lines or self._fillLines():
+            while lines:
+                yield pop()
+
+    def close(self):
+        if not self.fileobj.closed and METRICS_FILE is not None:
+            seconds = time.time() - self._openTime
+            metric('file', file=os.path.basename(self.name),
+                    lines=self.nrLines, bytes=self.nrBytes,
+                    seconds=round(seconds, 3),
+                    lines_per_sec=int(self.nrLines / max(seconds, 1e-6)))
+        self.fileobj.close()
+        self._lines[:] = []
+        self._eof = True
 
     def getByHashSections(self):
         return getSectionHash(self)
@@ -881,86 +2003,405 @@ def counter(initValue=1):
         yield i
         i += 1
 
-class _BaseCache(dict):
+# ID caches.
+#
+# By default the caches map the complete title/name strings to their IDs
+# with a dictionary; with --id-cache compact or disk only a 64 bit hash
+# of every key is kept, in a pair of sorted arrays.
+
+_unpackHash = struct.Struct('=q').unpack
+_ID_CACHE_DIR = None
+
+def _keyHash(key):
+    """Return a 64 bit hash of the given key."""
+    return _unpackHash(md5(key).digest()[:8])[0]
+
+
+def _formatSize(nbytes):
+    """Return the given number of bytes in a human readable format."""
+    for unit in ('bytes', 'KB', 'MB'):
+        if nbytes < 1024:
+            return '%d %s' % (nbytes, unit)
+        nbytes /= 1024.0
+    return '%.1f GB' % nbytes
+
+
+class DictIDMap(dict):
+    """Map keys to IDs with a plain dictionary."""
+    def footprint(self):
+        """Return the (approximate) memory used, in bytes, and the size
+        of the files on disk."""
+        getsize = sys.getsizeof
+        size = getsize(self)
+        for k, v in self.iteritems():
+            size += getsize(k) + getsize(v)
+        return size, 0
+
+
+class _MappedArray(object):
+    """Read-only array of longs stored in a file mapped in memory."""
+    # Every INDEX_STEP items, a value is kept in memory to speed up
+    # the binary search of sorted arrays.
+    INDEX_STEP = 512
+
+    def __init__(self, fname):
+        import mmap
+        self.fname = fname
+        self._itemsize = array('l').itemsize
+        self._len = os.path.getsize(fname) / self._itemsize
+        if self._len:
+            fd = open(fname, 'rb')
+            self._mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            fd.close()
+        else:
+            self._mm = ''
+        self._index = None
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, idx):
+        size = self._itemsize
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self._len)
+            return array('l', self._mm[start*size:stop*size])
+        if idx < 0:
+            idx += self._len
+        if not 0 <= idx < self._len:
+            raise IndexError('index out of range')
+        return struct.unpack_from('l', self._mm, idx*size)[0]
+
+    def bisect_left(self, x, lo=0):
+        """Like bisect.bisect_left, for a sorted array."""
+        if self._index is None:
+            self._index = array('l', [self[i] for i in
+                                    xrange(0, self._len, self.INDEX_STEP)])
+        block = bisect_left(self._index, x)
+        if block == 0:
+            return lo
+        start = (block - 1) * self.INDEX_STEP
+        idx = start + bisect_left(self[start:start+self.INDEX_STEP], x)
+        return max(lo, idx)
+
+    def close(self):
+        if self._len:
+            self._mm.close()
+
+
+class CompactIDMap(object):
+    """Map keys to IDs, keeping only a 64 bit hash of every key.
+
+    New entries are collected in a dictionary, merged from time to time
+    in two sorted arrays of hashes and IDs; if spillDir is given, the
+    arrays are written in files of this directory and mapped in memory."""
+    # Minimum number of new entries that triggers a merge; a merge
+    # takes place also when the new entries are more than 1/MERGE_RATIO
+    # of the merged ones.
+    MERGE_MIN = 65536
+    MERGE_RATIO = 8
+
+    def __init__(self, name, spillDir=None):
+        self.name = name
+        self.spillDir = spillDir
+        self._recent = {}
+        self._generation = 0
+        self._hashes = self._ids = None
+        self.clear()
+
+    def __len__(self):
+        return len(self._recent) + len(self._hashes)
+
+    def __nonzero__(self):
+        return bool(self._recent) or len(self._hashes) > 0
+
+    def get(self, key, default=None):
+        h = _unpackHash(md5(key).digest()[:8])[0]
+        value = self._recent.get(h)
+        if value is not None:
+            return value
+        hashes = self._hashes
+        if self.spillDir: idx = hashes.bisect_left(h)
+        else: idx = bisect_left(hashes, h)
+        if idx < len(hashes) and hashes[idx] == h:
+            return self._ids[idx]
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, value):
+        recent = self._recent
+        recent[_keyHash(key)] = value
+        if len(recent) >= self._mergeAt:
+            self._merge()
+
+    def _merge(self):
+        """Merge the new entries in the sorted arrays; a new entry
+        replaces a merged one with the same hash."""
+        oldHashes = self._hashes
+        oldIDs = self._ids
+        if self.spillDir:
+            hashesFD, idsFD = self._newFiles()
+        newHashes = array('l')
+        newIDs = array('l')
+        nextIdx = 0
+        nrOld = len(oldHashes)
+        for h, value in sorted(self._recent.iteritems()):
+            if self.spillDir: idx = oldHashes.bisect_left(h, nextIdx)
+            else: idx = bisect_left(oldHashes, h, nextIdx)
+            if idx > nextIdx:
+                newHashes.extend(oldHashes[nextIdx:idx])
+                newIDs.extend(oldIDs[nextIdx:idx])
+            newHashes.append(h)
+            newIDs.append(value)
+            if idx < nrOld and oldHashes[idx] == h:
+                idx += 1
+            nextIdx = idx
+            if self.spillDir and len(newHashes) >= self.MERGE_MIN:
+                newHashes.tofile(hashesFD)
+                newIDs.tofile(idsFD)
+                del newHashes[:], newIDs[:]
+        newHashes.extend(oldHashes[nextIdx:])
+        newIDs.extend(oldIDs[nextIdx:])
+        self._recent.clear()
+        if self.spillDir:
+            newHashes.tofile(hashesFD)
+            newIDs.tofile(idsFD)
+            newHashes, newIDs = self._mapFiles(hashesFD, idsFD)
+        self._hashes = newHashes
+        self._ids = newIDs
+        self._mergeAt = max(self.MERGE_MIN, len(newHashes) / self.MERGE_RATIO)
+
+    def _newFiles(self):
+        """Open a new pair of files for the hashes and the IDs."""
+        self._generation += 1
+        base = os.path.join(self.spillDir, '%s-%d' % (self.name,
+                                                    self._generation))
+        return open(base + '.hashes', 'wb'), open(base + '.ids', 'wb')
+
+    def _mapFiles(self, hashesFD, idsFD):
+        """Close the given files and map them in memory, replacing (and
+        removing) the previous ones."""
+        hashesFD.close()
+        idsFD.close()
+        for arr in self._hashes, self._ids:
+            if isinstance(arr, _MappedArray):
+                arr.close()
+                os.unlink(arr.fname)
+        return _MappedArray(hashesFD.name), _MappedArray(idsFD.name)
+
+    def clear(self):
+        self._recent.clear()
+        self._mergeAt = self.MERGE_MIN
+        if self.spillDir:
+            self._hashes, self._ids = self._mapFiles(*self._newFiles())
+        else:
+            self._hashes = array('l')
+            self._ids = array('l')
+
+    def footprint(self):
+        """Return the (approximate) memory used, in bytes, and the size
+        of the files on disk."""
+        getsize = sys.getsizeof
+        # Every new entry is a key and a value (two int objects).
+        size = getsize(self._recent) + len(self._recent) * 2 * getsize(0)
+        onDisk = 0
+        for arr in self._hashes, self._ids:
+            arrSize = len(arr) * array('l').itemsize
+            if isinstance(arr, _MappedArray): onDisk += arrSize
+            else: size += arrSize
+        return size, onDisk
+
+
+def newIDMap(name):
+    """Return a new mapping from keys to IDs, of the kind selected
+    with --id-cache."""
+    global _ID_CACHE_DIR
+    if ID_CACHE == 'compact':
+        return CompactIDMap(name)
+    elif ID_CACHE == 'disk':
+        if _ID_CACHE_DIR is None:
+            _ID_CACHE_DIR = tempfile.mkdtemp(prefix='imdbpy2sql-ids-')
+        return CompactIDMap(name, spillDir=_ID_CACHE_DIR)
+    return DictIDMap()
+
+
+def reportCachesFootprint():
+    """Print the memory used by the ID caches."""
+    for cache in (CACHE_MID, CACHE_PID, CACHE_CID, CACHE_COMPID,
+                CACHE_KWRDID, CACHE_MID_AKAS):
+        inMemory, onDisk = cache.footprint()
+        print ' * MEMORY USED BY %s: %d entries, %s' % (cache.className,
+                                            len(cache), _formatSize(inMemory)),
+        if onDisk:
+            print '(%s on disk)' % _formatSize(onDisk)
+        else:
+            print
+
+
+def removeIDCacheDir():
+    """Remove the directory used by --id-cache disk."""
+    global _ID_CACHE_DIR
+    if _ID_CACHE_DIR is not None:
+        shutil.rmtree(_ID_CACHE_DIR, ignore_errors=True)
+        _ID_CACHE_DIR = None
+
+
+# Adaptive batch sizes (--adaptive-batches).
+
+# Limits of the number of rows flushed at once: the upper one is
+# computed for every table, so that the rows waiting to be flushed
+# use no more than about BATCH_MEMORY bytes.
+BATCH_MIN = 1000
+BATCH_MEMORY = 128 * 1024 * 1024
+# Number of rows sampled to estimate the memory used by a row.
+BATCH_SAMPLE = 100
+# Every change multiplies or divides the size by this factor.
+BATCH_STEP = 1.5
+_BATCH_SIZERS = {}
+
+class BatchSizer(object):
+    """Tune the number of rows flushed at once to a table: the size
+    is changed at every flush, in the same direction as long as the
+    throughput (rows per second) improves."""
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.direction = 1
+        self.lastRate = None
+
+    def observe(self, nrRows, seconds, rowSize):
+        """Record a flush of rows using rowSize bytes each, and return
+        the new batch size."""
+        # Partial batches (at the end of a file) are not meaningful.
+        if nrRows < self.size / 2 or seconds <= 0:
+            return self.size
+        maxSize = max(BATCH_MIN, BATCH_MEMORY / max(rowSize, 1))
+        rate = nrRows / seconds
+        if self.lastRate is not None and rate < self.lastRate:
+            self.direction = -self.direction
+        self.lastRate = rate
+        if self.direction > 0: size = int(self.size * BATCH_STEP)
+        else: size = int(self.size / BATCH_STEP)
+        size = max(BATCH_MIN, min(maxSize, size))
+        if size != self.size:
+            print ' * BATCH SIZE of %s: %d -> %d (%d rows/sec, %.2f sec' \
+                    ' per flush, %d bytes per row)' % (self.name, self.size,
+                    size, rate, seconds, rowSize)
+            metric('batch', table=self.name, size=size, previous=self.size,
+                    rows_per_sec=int(rate), seconds=round(seconds, 3),
+                    row_bytes=rowSize, max_size=maxSize)
+            self.size = size
+        return size
+
+
+def _rowSize(rows):
+    """Return the (approximate) memory used by a row, in bytes,
+    sampling the first BATCH_SAMPLE rows of the given iterable."""
+    getsize = sys.getsizeof
+    total = nrRows = 0
+    for row in islice(rows, BATCH_SAMPLE):
+        total += getsize(row)
+        if isinstance(row, (tuple, list)):
+            for item in row: total += getsize(item)
+        nrRows += 1
+    return total / max(nrRows, 1)
+
+
+def adaptBatchSize(name, size, nrRows, seconds, rows):
+    """Return the number of rows to be flushed next time to a table (or
+    by a cache), after a flush of nrRows rows in the given seconds;
+    rows is an iterable of the flushed rows."""
+    if not ADAPTIVE_BATCHES or _WRITER is not None:
+        # With the background writer, the time of the flush is the time
+        # needed to put the rows in the queue.
+        return size
+    sizer = _BATCH_SIZERS.get(name)
+    if sizer is None:
+        sizer = _BATCH_SIZERS[name] = BatchSizer(name, size)
+    return sizer.observe(nrRows, seconds, _rowSize(rows))
+
+
+class _BaseCache(object):
     """Base class for Movie and Person basic information."""
     def __init__(self, d=None, flushEvery=100000):
-        dict.__init__(self)
+        # Map keys to IDs.
+        self._ids = newIDMap(self.className)
         # Flush data into the SQL database every flushEvery entries.
         self.flushEvery = flushEvery
         self._tmpDict = {}
         self._flushing = 0
         self._deferredData = {}
-        self._recursionLevel = 0
+        # Lookups of keys already in the cache, and of new keys.
+        self.hits = 0
+        self.misses = 0
         self._table_name = ''
         self._id_for_custom_q = ''
         if d is not None:
             for k, v in d.iteritems(): self[k] = v
 
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __getitem__(self, key):
+        return self._ids[key]
+
+    def get(self, key, default=None):
+        return self._ids.get(key, default)
+
+    def clear(self):
+        self._ids.clear()
+
+    def footprint(self):
+        """Return the (approximate) memory used by the IDs, in bytes,
+        and the size of the files on disk."""
+        return self._ids.footprint()
+
     def __setitem__(self, key, counter):
         """Every time a key is set, its value is the counter;
-        every flushEvery, the temporary dictionary is
+        every flushEvery new keys, the temporary dictionary is
         flushed to the database, and then zeroed."""
-        if counter % self.flushEvery == 0:
+        if len(self._tmpDict) >= self.flushEvery:
             self.flush()
-        dict.__setitem__(self, key, counter)
+        self._ids[key] = counter
         if not self._flushing:
             self._tmpDict[key] = counter
         else:
             self._deferredData[key] = counter
 
-    def flush(self, quiet=0, _recursionLevel=0):
+    def flush(self, quiet=0):
         """Flush to the database."""
         if self._flushing: return
         self._flushing = 1
-        if _recursionLevel >= MAX_RECURSION:
-            print 'WARNING recursion level exceded trying to flush data'
-            print 'WARNING this batch of data is lost (%s).' % self.className
-            self._tmpDict.clear()
-            return
         if self._tmpDict:
-            # Horrible hack to know if AFTER_%s_TODB has run.
-            _after_has_run = False
             keys = {'table': self._table_name}
             try:
-                executeCustomQueries('BEFORE_%s_TODB' % self._id_for_custom_q,
-                                    _keys=keys, _timeit=False)
+                dbWrite(executeCustomQueries,
+                        'BEFORE_%s_TODB' % self._id_for_custom_q,
+                        _keys=keys, _timeit=False)
+                nrRows = len(self._tmpDict)
+                flushStart = time.time()
                 self._toDB(quiet)
-                executeCustomQueries('AFTER_%s_TODB' % self._id_for_custom_q,
-                                    _keys=keys, _timeit=False)
-                _after_has_run = True
-                self._tmpDict.clear()
-            except OperationalError, e:
-                # XXX: I'm not sure this is the right thing (and way)
-                #      to proceed.
-                if not _after_has_run:
-                    executeCustomQueries('AFTER_%s_TODB'%self._id_for_custom_q,
-                                        _keys=keys, _timeit=False)
-                # Dataset too large; split it in two and retry.
-                # XXX: new code!
-                # the same class instance (self) is used, instead of
-                # creating two separated objects.
-                _recursionLevel += 1
-                self._flushing = 0
-                firstHalf = {}
-                poptmpd = self._tmpDict.popitem
-                originalLength = len(self._tmpDict)
-                for x in xrange(1, 1 + originalLength/2):
-                    k, v = poptmpd()
-                    firstHalf[k] = v
-                self._secondHalf = self._tmpDict
-                self._tmpDict = firstHalf
-                print ' * TOO MANY DATA (%s items in %s), recursion: %s' % \
-                                                        (originalLength,
-                                                        self.className,
-                                                        _recursionLevel)
-                print '   * SPLITTING (run 1 of 2), recursion: %s' % \
-                                                        _recursionLevel
-                self.flush(quiet=quiet, _recursionLevel=_recursionLevel)
-                self._tmpDict = self._secondHalf
-                print '   * SPLITTING (run 2 of 2), recursion: %s' % \
-                                                        _recursionLevel
-                self.flush(quiet=quiet, _recursionLevel=_recursionLevel)
+                seconds = time.time() - flushStart
+                countFlush(self.className, seconds)
+                self.flushEvery = adaptBatchSize(self.className,
+                                            self.flushEvery, nrRows, seconds,
+                                            self._tmpDict.iteritems())
+                dbWrite(executeCustomQueries,
+                        'AFTER_%s_TODB' % self._id_for_custom_q,
+                        _keys=keys, _timeit=False)
                 self._tmpDict.clear()
+            except WriterError:
+                raise
             except Exception, e:
                 if isinstance(e, KeyboardInterrupt):
                     raise
@@ -974,7 +2415,7 @@ class _BaseCache(dict):
             self._tmpDict = self._deferredData
             self.flush(quiet=1)
             self._deferredData = {}
-        connectObject.commit()
+        dbWrite(connectObject.commit)
 
     def populate(self):
         """Populate the dictionary from the database."""
@@ -987,6 +2428,7 @@ class _BaseCache(dict):
     def add(self, key, miscData=None):
         """Insert a new key and return its value."""
         c = self.counter.next()
+        self.misses += 1
         # miscData=[('a_dict', 'value')] will set self.a_dict's c key
         # to 'value'.
         if miscData is not None:
@@ -998,8 +2440,10 @@ class _BaseCache(dict):
     def addUnique(self, key, miscData=None):
         """Insert a new key and return its value; if the key is already
         in the dictionary, its previous  value is returned."""
-        if key in self: return self[key]
-        else: return self.add(key, miscData)
+        value = self._ids.get(key)
+        if value is None: return self.add(key, miscData)
+        self.hits += 1
+        return value
 
 
 def fetchsome(curs, size=20000):
@@ -1037,13 +2481,18 @@ class MoviesCache(_BaseCache):
         episodeofidCol = colName(Title, 'episodeOfID')
         seasonNrCol = colName(Title, 'seasonNr')
         episodeNrCol = colName(Title, 'episodeNr')
-        sqlPop = 'SELECT %s, %s, %s, %s, %s, %s, %s, %s FROM %s;' % \
-                (movieidCol, titleCol, kindidCol, yearCol, imdbindexCol,
-                episodeofidCol, seasonNrCol, episodeNrCol, titleTbl)
-        CURS.execute(sqlPop)
-        _oldcacheValues = Title.sqlmeta.cacheValues
-        Title.sqlmeta.cacheValues = False
-        for x in fetchsome(CURS, self.flushEvery):
+        # The series of every episode is read by the same query.
+        sqlPop = 'SELECT t.%s, t.%s, t.%s, t.%s, t.%s, t.%s, t.%s, t.%s, ' \
+                's.%s, s.%s, s.%s, s.%s FROM %s t LEFT OUTER JOIN %s s ' \
+                'ON t.%s = s.%s;' % (movieidCol, titleCol, kindidCol,
+                yearCol, imdbindexCol, episodeofidCol, seasonNrCol,
+                episodeNrCol, titleCol, kindidCol, yearCol, imdbindexCol,
+                titleTbl, titleTbl, episodeofidCol, movieidCol)
+        curs = streamingCursor()
+        curs.execute(sqlPop)
+        # Series, by ID: built once for all their episodes.
+        series = {}
+        for x in fetchsome(curs, self.flushEvery):
             mdict = {'title': x[1], 'kind': KIND_STRS[x[2]],
                     'year': x[3], 'imdbIndex': x[4]}
             if mdict['imdbIndex'] is None: del mdict['imdbIndex']
@@ -1051,25 +2500,33 @@ class MoviesCache(_BaseCache):
             else: mdict['year'] = str(mdict['year'])
             episodeOfID = x[5]
             if episodeOfID is not None:
-                s = Title.get(episodeOfID)
-                series_d = {'title': s.title,
-                            'kind': str(KIND_STRS[s.kindID]),
-                            'year': s.productionYear, 'imdbIndex': s.imdbIndex}
-                if series_d['imdbIndex'] is None: del series_d['imdbIndex']
-                if series_d['year'] is None: del series_d['year']
-                else: series_d['year'] = str(series_d['year'])
+                series_d = series.get(episodeOfID)
+                if series_d is None:
+                    series_d = {'title': x[8],
+                                'kind': str(KIND_STRS[x[9]]),
+                                'year': x[10], 'imdbIndex': x[11]}
+                    if series_d['imdbIndex'] is None:
+                        del series_d['imdbIndex']
+                    if series_d['year'] is None: del series_d['year']
+                    else: series_d['year'] = str(series_d['year'])
+                    series[episodeOfID] = series_d
                 mdict['episode of'] = series_d
+                if x[6] is not None: mdict['season'] = x[6]
+                if x[7] is not None: mdict['episode'] = x[7]
             title = build_title(mdict, ptdf=1, _emptyString='')
-            dict.__setitem__(self, title, x[0])
-        self.counter = counter(Title.select().count() + 1)
-        Title.sqlmeta.cacheValues = _oldcacheValues
+            self._ids[title] = x[0]
+        if curs is not CURS:
+            curs.close()
+        self.counter = counter(_countRows(tableName(Title)) + 1)
 
     def _toDB(self, quiet=0):
         if not quiet:
             print ' * FLUSHING %s...' % self.className
             sys.stdout.flush()
-        l = []
-        lapp = l.append
+        insertRows(self.sqlstr, self.converter, self._rows())
+
+    def _rows(self):
+        """Yield the rows to be stored, for the new titles."""
         tmpDictiter = self._tmpDict.iteritems
         for k, v in tmpDictiter():
             try:
@@ -1095,17 +2552,10 @@ class MoviesCache(_BaseCache):
                 t['series years'] = self.movieYear.get(v)
             title = tget('title')
             soundex = title_soundex(title)
-            lapp((v, title, tget('imdbIndex'), KIND_IDS[kind],
+            yield (v, title, tget('imdbIndex'), KIND_IDS[kind],
                     tget('year'), None, soundex, episodeOf,
                     tget('season'), tget('episode'), tget('series years'),
-                    md5(k).hexdigest()))
-        self._runCommand(l)
-
-    def _runCommand(self, dataList):
-        if not CSV_DIR:
-            CURS.executemany(self.sqlstr, self.converter(dataList))
-        else:
-            CSV_CURS.executemany(self.sqlstr, dataList)
+                    md5(k).hexdigest())
 
     def addUnique(self, key, miscData=None):
         """Insert a new key and return its value; if the key is already
@@ -1116,8 +2566,10 @@ class MoviesCache(_BaseCache):
         #if FIX_OLD_STYLE_TITLES:
         #    key = build_title(analyze_title(key, canonical=False,
         #                    _emptyString=''), ptdf=1, _emptyString='')
-        if key in self: return self[key]
-        else: return self.add(key, miscData)
+        value = self._ids.get(key)
+        if value is None: return self.add(key, miscData)
+        self.hits += 1
+        return value
 
 
 class PersonsCache(_BaseCache):
@@ -1148,16 +2600,18 @@ class PersonsCache(_BaseCache):
             nd = {'name': x[1]}
             if x[2]: nd['imdbIndex'] = x[2]
             name = build_name(nd)
-            dict.__setitem__(self, name, x[0])
-        self.counter = counter(Name.select().count() + 1)
+            self._ids[name] = x[0]
+        self.counter = counter(_countRows(tableName(Name)) + 1)
         Name.sqlmeta.cacheValues = _oldcacheValues
 
     def _toDB(self, quiet=0):
         if not quiet:
             print ' * FLUSHING PersonsCache...'
             sys.stdout.flush()
-        l = []
-        lapp = l.append
+        insertRows(self.sqlstr, self.converter, self._rows())
+
+    def _rows(self):
+        """Yield the rows to be stored, for the new names."""
         tmpDictiter = self._tmpDict.iteritems
         for k, v in tmpDictiter():
             try:
@@ -1170,13 +2624,9 @@ class PersonsCache(_BaseCache):
             name = tget('name')
             namePcodeCf, namePcodeNf, surnamePcode = name_soundexes(name)
             gender = self.personGender.get(v)
-            lapp((v, name, tget('imdbIndex'), None, gender,
+            yield (v, name, tget('imdbIndex'), None, gender,
                 namePcodeCf, namePcodeNf, surnamePcode,
-                md5(k).hexdigest()))
-        if not CSV_DIR:
-            CURS.executemany(self.sqlstr, self.converter(l))
-        else:
-            CSV_CURS.executemany(self.sqlstr, l)
+                md5(k).hexdigest())
 
 
 class CharactersCache(_BaseCache):
@@ -1206,16 +2656,18 @@ class CharactersCache(_BaseCache):
             nd = {'name': x[1]}
             if x[2]: nd['imdbIndex'] = x[2]
             name = build_name(nd)
-            dict.__setitem__(self, name, x[0])
-        self.counter = counter(CharName.select().count() + 1)
+            self._ids[name] = x[0]
+        self.counter = counter(_countRows(tableName(CharName)) + 1)
         CharName.sqlmeta.cacheValues = _oldcacheValues
 
     def _toDB(self, quiet=0):
         if not quiet:
             print ' * FLUSHING CharactersCache...'
             sys.stdout.flush()
-        l = []
-        lapp = l.append
+        insertRows(self.sqlstr, self.converter, self._rows())
+
+    def _rows(self):
+        """Yield the rows to be stored, for the new characters."""
         tmpDictiter = self._tmpDict.iteritems
         for k, v in tmpDictiter():
             try:
@@ -1228,12 +2680,8 @@ class CharactersCache(_BaseCache):
             name = tget('name')
             namePcodeCf, namePcodeNf, surnamePcode = name_soundexes(name,
                                                                 character=True)
-            lapp((v, name, tget('imdbIndex'), None,
-                namePcodeCf, surnamePcode, md5(k).hexdigest()))
-        if not CSV_DIR:
-            CURS.executemany(self.sqlstr, self.converter(l))
-        else:
-            CSV_CURS.executemany(self.sqlstr, l)
+            yield (v, name, tget('imdbIndex'), None,
+                namePcodeCf, surnamePcode, md5(k).hexdigest())
 
 
 class CompaniesCache(_BaseCache):
@@ -1250,7 +2698,7 @@ class CompaniesCache(_BaseCache):
                                 'namePcodeSf', 'md5sum'])
 
     def populate(self):
-        print ' * POPULATING CharactersCache...'
+        print ' * POPULATING CompaniesCache...'
         nameTbl = tableName(CompanyName)
         companyidCol = colName(CompanyName, 'id')
         nameCol = colName(CompanyName, 'name')
@@ -1263,16 +2711,18 @@ class CompaniesCache(_BaseCache):
             nd = {'name': x[1]}
             if x[2]: nd['country'] = x[2]
             name = build_company_name(nd)
-            dict.__setitem__(self, name, x[0])
-        self.counter = counter(CompanyName.select().count() + 1)
+            self._ids[name] = x[0]
+        self.counter = counter(_countRows(tableName(CompanyName)) + 1)
         CompanyName.sqlmeta.cacheValues = _oldcacheValues
 
     def _toDB(self, quiet=0):
         if not quiet:
             print ' * FLUSHING CompaniesCache...'
             sys.stdout.flush()
-        l = []
-        lapp = l.append
+        insertRows(self.sqlstr, self.converter, self._rows())
+
+    def _rows(self):
+        """Yield the rows to be stored, for the new companies."""
         tmpDictiter = self._tmpDict.iteritems
         for k, v in tmpDictiter():
             try:
@@ -1288,12 +2738,8 @@ class CompaniesCache(_BaseCache):
             country = tget('country')
             if k != name:
                 namePcodeSf = soundex(k)
-            lapp((v, name, country, None, namePcodeNf, namePcodeSf,
-                    md5(k).hexdigest()))
-        if not CSV_DIR:
-            CURS.executemany(self.sqlstr, self.converter(l))
-        else:
-            CSV_CURS.executemany(self.sqlstr, l)
+            yield (v, name, country, None, namePcodeNf, namePcodeSf,
+                    md5(k).hexdigest())
 
 
 class KeywordsCache(_BaseCache):
@@ -1311,32 +2757,24 @@ class KeywordsCache(_BaseCache):
 
     def populate(self):
         print ' * POPULATING KeywordsCache...'
-        nameTbl = tableName(CompanyName)
+        nameTbl = tableName(Keyword)
         keywordidCol = colName(Keyword, 'id')
-        keyCol = colName(Keyword, 'name')
+        keyCol = colName(Keyword, 'keyword')
         CURS.execute('SELECT %s, %s FROM %s;' % (keywordidCol, keyCol,
                                                     nameTbl))
         _oldcacheValues = Keyword.sqlmeta.cacheValues
         Keyword.sqlmeta.cacheValues = False
         for x in fetchsome(CURS, self.flushEvery):
-            dict.__setitem__(self, x[1], x[0])
-        self.counter = counter(Keyword.select().count() + 1)
+            self._ids[x[1]] = x[0]
+        self.counter = counter(_countRows(tableName(Keyword)) + 1)
         Keyword.sqlmeta.cacheValues = _oldcacheValues
 
     def _toDB(self, quiet=0):
         if not quiet:
             print ' * FLUSHING KeywordsCache...'
             sys.stdout.flush()
-        l = []
-        lapp = l.append
-        tmpDictiter = self._tmpDict.iteritems
-        for k, v in tmpDictiter():
-            keySoundex = soundex(k)
-            lapp((v, k, keySoundex))
-        if not CSV_DIR:
-            CURS.executemany(self.sqlstr, self.converter(l))
-        else:
-            CSV_CURS.executemany(self.sqlstr, l)
+        insertRows(self.sqlstr, self.converter,
+                ((v, k, soundex(k)) for k, v in self._tmpDict.iteritems()))
 
 
 class SQLData(dict):
@@ -1356,7 +2794,6 @@ class SQLData(dict):
         self.flushEvery = flushEvery
         self.sqlString = sqlString
         self.converter = converter
-        self._recursionLevel = 1
         self._table = table
         self._table_name = tableName(table)
         for k, v in d.items(): self[k] = v
@@ -1364,70 +2801,40 @@ class SQLData(dict):
     def __setitem__(self, key, value):
         """The value is discarded, the counter is used as the 'real' key
         and the user's 'key' is used as its values."""
-        counter = self.counter
-        if counter % self.flushEvery == 0:
+        if len(self) >= self.flushEvery:
             self.flush()
+        counter = self.counter
         dict.__setitem__(self, counter, key)
         self.counter += 1
 
     def add(self, key):
         self[key] = None
 
-    def flush(self, _resetRecursion=1):
+    def flush(self):
         if not self: return
         # XXX: it's safer to flush MoviesCache and PersonsCache, to preserve
         #      consistency of ForeignKey, but it can also slow down everything
         #      a bit...
-        CACHE_MID.flush(quiet=1)
-        CACHE_PID.flush(quiet=1)
-        if _resetRecursion: self._recursionLevel = 1
-        if self._recursionLevel >= MAX_RECURSION:
-            print 'WARNING recursion level exceded trying to flush data'
-            print 'WARNING this batch of data is lost.'
-            self.clear()
-            self.counter = self.counterInit
-            return
+        if CACHE_MID._tmpDict: CACHE_MID.flush(quiet=1)
+        if CACHE_PID._tmpDict: CACHE_PID.flush(quiet=1)
         keys = {'table': self._table_name}
-        _after_has_run = False
         try:
-            executeCustomQueries('BEFORE_SQLDATA_TODB', _keys=keys,
-                                _timeit=False)
+            dbWrite(executeCustomQueries, 'BEFORE_SQLDATA_TODB', _keys=keys,
+                    _timeit=False)
+            nrRows = len(self)
+            flushStart = time.time()
             self._toDB()
-            executeCustomQueries('AFTER_SQLDATA_TODB', _keys=keys,
-                                _timeit=False)
-            _after_has_run = True
-            self.clear()
-            self.counter = self.counterInit
-        except OperationalError, e:
-            if not _after_has_run:
-                executeCustomQueries('AFTER_SQLDATA_TODB', _keys=keys,
-                                    _timeit=False)
-            print ' * TOO MANY DATA (%s items), SPLITTING (run #%d)...' % \
-                    (len(self), self._recursionLevel)
-            self._recursionLevel += 1
-            newdata = self.__class__(table=self._table,
-                                    sqlString=self.sqlString,
-                                    converter=self.converter)
-            newdata._recursionLevel = self._recursionLevel
-            newflushEvery = self.flushEvery / 2
-            if newflushEvery < 1:
-                print 'WARNING recursion level exceded trying to flush data'
-                print 'WARNING this batch of data is lost.'
-                self.clear()
-                self.counter = self.counterInit
-                return
-            self.flushEvery = newflushEvery
-            newdata.flushEvery = newflushEvery
-            popitem = self.popitem
-            dsi = dict.__setitem__
-            for x in xrange(len(self)/2):
-                k, v = popitem()
-                dsi(newdata, k, v)
-            newdata.flush(_resetRecursion=0)
-            del newdata
-            self.flush(_resetRecursion=0)
+            seconds = time.time() - flushStart
+            countFlush(self._table_name, seconds)
+            self.flushEvery = adaptBatchSize(self._table_name,
+                                            self.flushEvery, nrRows, seconds,
+                                            self.itervalues())
+            dbWrite(executeCustomQueries, 'AFTER_SQLDATA_TODB', _keys=keys,
+                    _timeit=False)
             self.clear()
             self.counter = self.counterInit
+        except WriterError:
+            raise
         except Exception, e:
             if isinstance(e, KeyboardInterrupt):
                 raise
@@ -1435,14 +2842,11 @@ class SQLData(dict):
             print 'WARNING: to the database; report this as a bug, since'
             print 'WARNING: many data (%d items) were lost: %s' % \
                     (len(self), e)
-        connectObject.commit()
+        dbWrite(connectObject.commit)
 
     def _toDB(self):
         print ' * FLUSHING SQLData...'
-        if not CSV_DIR:
-            CURS.executemany(self.sqlString, self.converter(self.values()))
-        else:
-            CSV_CURS.executemany(self.sqlString, self.values())
+        insertRows(self.sqlString, self.converter, self.itervalues())
 
 
 # Miscellaneous functions.
@@ -1499,33 +2903,333 @@ def _parseColonList(lines, replaceKeys):
     return out
 
 
-# Functions used to manage data files.
+# Parallel parsing of the data files.
+#
+# Parsers are generators that receive an open SourceFile and yield
+# records with titles and names as strings; resolving them to IDs
+# is left to the main process, through the CACHE_* instances.
+# With NR_JOBS > 1 the files are parsed in advance by a pool of worker
+# processes, that spool the records on disk; otherwise the parser
+# is run by the main process, when the records are requested.
 
-def readMovieList():
-    """Read the movies.list.gz file."""
-    try: mdbf = SourceFile(MOVIES, start=MOVIES_START, stop=MOVIES_STOP)
-    except IOError: return
-    count = 0
-    for line in mdbf:
-        line_d = unpack(line, ('title', 'year'))
-        title = line_d['title']
-        yearData = None
-        # Collect 'year' column for tv "series years" and episodes' year.
-        if title[0] == '"':
-            yearData = [('movieYear', line_d['year'])]
-        mid = CACHE_MID.addUnique(title, yearData)
-        if mid is None:
-            continue
-        if count % 10000 == 0:
-            print 'SCANNING movies:', _(title),
-            print '(movieID: %s)' % mid
-        count += 1
-    CACHE_MID.flush()
-    CACHE_MID.movieYear.clear()
-    mdbf.close()
+_PARSE_POOL = None
+_SPOOL_DIR = None
+# Lists of AsyncResult instances (more than one if the file is split
+# in shards), keyed by (parser name, file name).
+_PARSED_FILES = {}
+# Number of records written in a single marshal.dump call.
+SPOOL_BATCH = 10000
 
 
-def doCast(fp, roleid, rolename):
+def _closeAfter(records, fp):
+    """Yield the records, closing fp at the end."""
+    try:
+        for record in records:
+            yield record
+    finally:
+        fp.close()
+
+
+def _initWorker():
+    """Worker processes leave the handling of SIGINT to the main process."""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _spoolParsed(parser, fname, start, stop, extra):
+    """Parse a data file in a worker process and write its records in
+    a spool file; return the name of the file, or None if the data file
+    can't be read."""
+    try:
+        fp = SourceFile(fname, start=start, stop=stop)
+    except IOError:
+        return None
+    spoolFD, spoolName = tempfile.mkstemp(suffix='.spool', dir=_SPOOL_DIR,
+                prefix='%s-%s-' % (parser.__name__, os.path.basename(fname)))
+    spoolFD = os.fdopen(spoolFD, 'wb')
+    batch = []
+    batchapp = batch.append
+    for record in _closeAfter(parser(fp, *extra), fp):
+        batchapp(record)
+        if len(batch) >= SPOOL_BATCH:
+            marshal.dump(batch, spoolFD)
+            batch[:] = []
+    if batch:
+        marshal.dump(batch, spoolFD)
+    spoolFD.close()
+    return spoolName
+
+
+def _readSpool(spoolName):
+    """Yield the records stored in a spool file, removing it at the end."""
+    spoolFD = open(spoolName, 'rb')
+    try:
+        while 1:
+            try:
+                batch = marshal.load(spoolFD)
+            except EOFError:
+                break
+            for record in batch:
+                yield record
+    finally:
+        spoolFD.close()
+        os.remove(spoolName)
+
+
+def _mergeShards(spoolNames):
+    """Yield the records of a file parsed in shards: every shard
+    contains a chunk out of len(spoolNames), and chunks end with None."""
+    shards = [_readSpool(spoolName) for spoolName in spoolNames]
+    try:
+        while 1:
+            for shard in shards:
+                for record in shard:
+                    if record is None: break
+                    yield record
+                else:
+                    # There are no more chunks.
+                    return
+    finally:
+        for shard in shards:
+            shard.close()
+
+
+def startParsers(tasks):
+    """Start parsing the given list of (parser, fname, start, stop, extra)
+    tasks in NR_JOBS worker processes."""
+    global _PARSE_POOL, _SPOOL_DIR
+    import multiprocessing
+    _SPOOL_DIR = tempfile.mkdtemp(prefix='imdbpy2sql-', dir=CSV_DIR)
+    print 'STARTING %d parsing processes (spooling to %s)...' % (NR_JOBS,
+                                                                _SPOOL_DIR)
+    sys.stdout.flush()
+    _PARSE_POOL = multiprocessing.Pool(NR_JOBS, _initWorker)
+    for parser, fname, start, stop, extra in tasks:
+        _PARSED_FILES.setdefault((parser.__name__, fname), []).append(
+                _PARSE_POOL.apply_async(_spoolParsed,
+                                        (parser, fname, start, stop, extra)))
+
+
+def stopParsers():
+    """Wait for the worker processes and remove the spool directory."""
+    global _PARSE_POOL, _SPOOL_DIR
+    if _PARSE_POOL is None:
+        return
+    _PARSE_POOL.close()
+    _PARSE_POOL.join()
+    _PARSE_POOL = None
+    _PARSED_FILES.clear()
+    shutil.rmtree(_SPOOL_DIR, ignore_errors=True)
+    _SPOOL_DIR = None
+
+
+# The parsed cache (--parsed-cache) keeps the records of every parsed
+# file in a file made of: a header with the version of the format and
+# the size and modification time of the data file, then batches of
+# records stored in columns (when all the records of the batch are
+# tuples of the same length; otherwise as a list of records).
+
+# To be increased every time the records yielded by a parser change.
+PARSED_CACHE_VERSION = 1
+
+
+def _parsedCacheName(parser, fname, extra=()):
+    """Return the name of the parsed cache file for a task."""
+    name = [parser.__name__, os.path.basename(fname)]
+    name += [getattr(x, '__name__', str(x)) for x in extra]
+    return os.path.join(PARSED_CACHE_DIR, '-'.join(name) + '.parsed')
+
+
+def _parsedCacheHeader(fname):
+    """Return the header identifying the current content of a data file,
+    or None if it's missing."""
+    try:
+        st = os.stat(os.path.join(IMDB_PTDF_DIR, fname))
+    except OSError:
+        return None
+    return (PARSED_CACHE_VERSION, st.st_size, int(st.st_mtime))
+
+
+def parsedCacheValid(parser, fname, extra=()):
+    """Return True if the records of a task can be read from the
+    parsed cache."""
+    if PARSED_CACHE_DIR is None:
+        return False
+    header = _parsedCacheHeader(fname)
+    if header is None:
+        return False
+    try:
+        fd = open(_parsedCacheName(parser, fname, extra), 'rb')
+    except IOError:
+        return False
+    try:
+        try:
+            return tuple(marshal.load(fd)) == header
+        except (EOFError, ValueError, TypeError):
+            return False
+    finally:
+        fd.close()
+
+
+def _readParsedCache(cacheName):
+    """Yield the records stored in a parsed cache file."""
+    fd = open(cacheName, 'rb')
+    try:
+        # Skip the header.
+        marshal.load(fd)
+        while 1:
+            try:
+                columns, batch = marshal.load(fd)
+            except EOFError:
+                break
+            if columns:
+                batch = zip(*batch)
+            for record in batch:
+                yield record
+    finally:
+        fd.close()
+
+
+def _writeParsedCache(records, cacheName, header):
+    """Yield the records, storing them in a parsed cache file; the file
+    is kept only if all the records were read."""
+    tmpName = cacheName + '.tmp'
+    fd = open(tmpName, 'wb')
+    marshal.dump(header, fd)
+    batch = []
+    batchapp = batch.append
+    def _dump():
+        if batch[0] and type(batch[0]) is tuple and \
+                all(type(r) is tuple for r in batch) and \
+                len(set(map(len, batch))) == 1:
+            marshal.dump((1, zip(*batch)), fd)
+        else:
+            marshal.dump((0, batch), fd)
+        batch[:] = []
+    complete = False
+    try:
+        for record in records:
+            batchapp(record)
+            if len(batch) >= SPOOL_BATCH:
+                _dump()
+            yield record
+        if batch:
+            _dump()
+        complete = True
+    finally:
+        fd.close()
+        if complete:
+            os.rename(tmpName, cacheName)
+        else:
+            os.remove(tmpName)
+
+
+def parsedRecords(parser, fname, start=(), stop=None, extra=()):
+    """Return an iterator over the records of the given data file,
+    or None if the file can't be read."""
+    if PARSED_CACHE_DIR is None:
+        return _parsedRecords(parser, fname, start, stop, extra)
+    cacheName = _parsedCacheName(parser, fname, extra)
+    if parsedCacheValid(parser, fname, extra):
+        print 'READING parsed records of %s from %s' % (fname, cacheName)
+        return _readParsedCache(cacheName)
+    records = _parsedRecords(parser, fname, start, stop, extra)
+    if records is None:
+        return None
+    if not os.path.isdir(PARSED_CACHE_DIR):
+        os.makedirs(PARSED_CACHE_DIR)
+    return _writeParsedCache(records, cacheName, _parsedCacheHeader(fname))
+
+
+def _parsedRecords(parser, fname, start=(), stop=None, extra=()):
+    """Return an iterator over the records of the given data file,
+    parsing it (or reading them from the spool files of the worker
+    processes), or None if the file can't be read."""
+    pending = _PARSED_FILES.pop((parser.__name__, fname), None)
+    if pending is not None:
+        spoolNames = [x.get() for x in pending]
+        if None in spoolNames:
+            for spoolName in spoolNames:
+                if spoolName is not None: os.remove(spoolName)
+            return None
+        if len(spoolNames) == 1:
+            return _readSpool(spoolNames[0])
+        return _mergeShards(spoolNames)
+    try:
+        fp = SourceFile(fname, start=start, stop=stop)
+    except IOError:
+        return None
+    return _closeAfter(parser(fp, *extra), fp)
+
+
+# Functions used to manage data files.
+
+# IDs of the titles in movies.list.gz (only collected in delta mode).
+LISTED_MOVIE_IDS = set()
+
+def readMovieList():
+    """Read the movies.list.gz file."""
+    try: mdbf = SourceFile(MOVIES, start=MOVIES_START, stop=MOVIES_STOP)
+    except IOError: return
+    count = 0
+    for line in mdbf:
+        title, year = splitFields(line, 2)
+        yearData = None
+        # Collect 'year' column for tv "series years" and episodes' year.
+        if title[0] == '"':
+            yearData = [('movieYear', year)]
+        mid = CACHE_MID.addUnique(title, yearData)
+        if mid is None:
+            continue
+        if DELTA:
+            LISTED_MOVIE_IDS.add(mid)
+        if count % 10000 == 0:
+            print 'SCANNING movies:', _(title),
+            print '(movieID: %s)' % mid
+        count += 1
+    CACHE_MID.flush()
+    CACHE_MID.movieYear.clear()
+    mdbf.close()
+
+
+# Number of persons in a chunk of a cast list parsed in shards.
+CAST_SHARD_BLOCKS = 5000
+# Roles whose (huge) cast lists are parsed in shards, with NR_JOBS > 1.
+SHARDED_CAST_ROLES = ('actor', 'actress')
+
+def _parseCast(fp, shard=0, nrShards=1):
+    """Yield (name, title, role, note, order) records for a cast list;
+    name is None for the lines that don't start with a new person.
+    With nrShards > 1 the persons are split in chunks of CAST_SHARD_BLOCKS
+    and only chunks whose number modulo nrShards is shard are parsed;
+    None is yielded at the end of every one of them."""
+    blocks = 0
+    chunk = 0
+    owned = shard == 0
+    for line in fp:
+        name = None
+        if line and line[0] != '\t':
+            if line[0] == '\n': continue
+            sl = filter(None, line.split('\t'))
+            if len(sl) != 2: continue
+            if nrShards > 1:
+                blocks += 1
+                if blocks == CAST_SHARD_BLOCKS:
+                    blocks = 0
+                    if owned: yield None
+                    chunk += 1
+                    owned = chunk % nrShards == shard
+            if not owned: continue
+            name, line = sl
+            name = name.strip()
+        elif not owned: continue
+        title, role, note, order = splitCastLine(line.strip())
+        yield name, title, role, note, order
+    if owned and nrShards > 1:
+        yield None
+
+
+def doCast(records, roleid, rolename):
     """Populate the cast table."""
     pid = None
     count = 0
@@ -1534,55 +3238,11 @@ def doCast(fp, roleid, rolename):
     sqldata = SQLData(table=CastInfo, cols=['personID', 'movieID',
                         'personRoleID', 'note', 'nrOrder', roleidVal])
     if rolename == 'miscellaneous crew': sqldata.flushEvery = 10000
-    for line in fp:
-        if line and line[0] != '\t':
-            if line[0] == '\n': continue
-            sl = filter(None, line.split('\t'))
-            if len(sl) != 2: continue
-            name, line = sl
-            miscData = None
-            if rolename == 'actor':
-                miscData = [('personGender', 'm')]
-            elif rolename == 'actress':
-                miscData = [('personGender', 'f')]
-            pid = CACHE_PID.addUnique(name.strip(), miscData)
-        line = line.strip()
-        ll = line.split('  ')
-        title = ll[0]
-        note = None
-        role = None
-        order = None
-        for item in ll[1:]:
-            if not item: continue
-            if item[0] == '[':
-                # Quite inefficient, but there are some very strange
-                # cases of garbage in the plain text data files to handle...
-                role = item[1:]
-                if role[-1:] == ']':
-                    role = role[:-1]
-                if role[-1:] == ')':
-                    nidx = role.find('(')
-                    if nidx != -1:
-                        note = role[nidx:]
-                        role = role[:nidx].rstrip()
-                        if not role: role = None
-            elif item[0] == '(':
-                if note is None:
-                    note = item
-                else:
-                    note = '%s %s' % (note, item)
-            elif item[0] == '<':
-                textor = item[1:-1]
-                try:
-                    order = long(textor)
-                except ValueError:
-                    os = textor.split(',')
-                    if len(os) == 3:
-                        try:
-                            order = ((long(os[2])-1) * 1000) + \
-                                    ((long(os[1])-1) * 100) + (long(os[0])-1)
-                        except ValueError:
-                            pass
+    miscData = _personGender(rolename)
+    for newName, title, role, note, order in records:
+        if newName is not None:
+            name = newName
+            pid = CACHE_PID.addUnique(name, miscData)
         movieid = CACHE_MID.addUnique(title)
         if movieid is None:
             continue
@@ -1603,48 +3263,107 @@ def doCast(fp, roleid, rolename):
     print 'CLOSING %s...' % rolename
 
 
+def castFileName(rolename):
+    """Return the name of the data file with the cast for a role."""
+    fname = rolename
+    fname = fname.replace(' ', '-')
+    if fname == 'actress': fname = 'actresses.list.gz'
+    elif fname == 'miscellaneous-crew': fname = 'miscellaneous.list.gz'
+    else: fname = fname + 's.list.gz'
+    return fname
+
+
+def castList(roleid, rolename):
+    """Read the data file of a single role."""
+    fname = castFileName(rolename)
+    print 'DOING', fname
+    records = parsedRecords(_parseCast, fname, CAST_START, CAST_STOP)
+    if records is None:
+        if rolename == 'actress':
+            CACHE_CID.flush()
+            if not CSV_DIR:
+                CACHE_CID.clear()
+        return
+    doCast(records, roleid, rolename)
+    if rolename == 'actress':
+        CACHE_CID.flush()
+        if not CSV_DIR:
+            CACHE_CID.clear()
+    t('castLists(%s)' % rolename)
+
+
+def _personGender(rolename):
+    """Return the miscData used to set the gender of a new person."""
+    if rolename == 'actor':
+        return [('personGender', 'm')]
+    elif rolename == 'actress':
+        return [('personGender', 'f')]
+    return None
+
+
+def prescanCast(fp, rolename):
+    """Add the names and the titles of a cast list to the caches;
+    lines are skipped exactly as in doCast, so that the same IDs
+    are assigned."""
+    miscData = _personGender(rolename)
+    addPerson = CACHE_PID.addUnique
+    addMovie = CACHE_MID.addUnique
+    for line in fp:
+        if line and line[0] != '\t':
+            if line[0] == '\n': continue
+            sl = filter(None, line.split('\t'))
+            if len(sl) != 2: continue
+            name, line = sl
+            addPerson(name.strip(), miscData)
+        addMovie(line.strip().split('  ')[0])
+
+
+def prescanCastLists(rolenames):
+    """Read every cast list, collecting titles and names; they are
+    stored at the end, in a single flush."""
+    caches = (CACHE_MID, CACHE_PID)
+    flushEvery = [c.flushEvery for c in caches]
+    for c in caches:
+        c.flushEvery = sys.maxint
+    try:
+        for rolename in rolenames:
+            fname = castFileName(rolename)
+            print 'PRESCANNING', fname
+            try:
+                f = SourceFile(fname, start=CAST_START, stop=CAST_STOP,
+                                pwarning=0)
+            except IOError:
+                continue
+            prescanCast(f, rolename)
+            f.close()
+    finally:
+        for c, fe in zip(caches, flushEvery):
+            c.flushEvery = fe
+    for c in caches:
+        c.flush()
+    CACHE_PID.personGender.clear()
+    t('prescanCastLists()')
+
+
 def castLists():
     """Read files listed in the 'role' column of the 'roletypes' table."""
     rt = [(x.id, x.role) for x in RoleType.select()]
+    if PRESCAN_CAST:
+        runStage('prescanCast', prescanCastLists,
+                [rolename for roleid, rolename in rt if rolename != 'guest'])
     for roleid, rolename in rt:
         if rolename == 'guest':
             continue
-        fname = rolename
-        fname = fname.replace(' ', '-')
-        if fname == 'actress': fname = 'actresses.list.gz'
-        elif fname == 'miscellaneous-crew': fname = 'miscellaneous.list.gz'
-        else: fname = fname + 's.list.gz'
-        print 'DOING', fname
-        try:
-            f = SourceFile(fname, start=CAST_START, stop=CAST_STOP)
-        except IOError:
-            if rolename == 'actress':
-                CACHE_CID.flush()
-                if not CSV_DIR:
-                    CACHE_CID.clear()
-            continue
-        doCast(f, roleid, rolename)
-        f.close()
-        if rolename == 'actress':
-            CACHE_CID.flush()
-            if not CSV_DIR:
-                CACHE_CID.clear()
-        t('castLists(%s)' % rolename)
+        runStage('castLists(%s)' % rolename, castList, roleid, rolename)
 
 
-def doAkaNames():
-    """People's akas."""
-    pid = None
-    count = 0
-    try: fp = SourceFile('aka-names.list.gz', start=AKAN_START)
-    except IOError: return
-    sqldata = SQLData(table=AkaName, cols=['personID', 'name', 'imdbIndex',
-                            'namePcodeCf', 'namePcodeNf', 'surnamePcode',
-                            'md5sum'])
+def _parseAkaNames(fp):
+    """Yield (person, None) for every person and (None, akaData)
+    for every aka name."""
     for line in fp:
         if line and line[0] != ' ':
             if line[0] == '\n': continue
-            pid = CACHE_PID.addUnique(line.strip())
+            yield line.strip(), None
         else:
             line = line.strip()
             if line[:5] == '(aka ': line = line[5:]
@@ -1656,14 +3375,29 @@ def doAkaNames():
                 continue
             name = name_dict.get('name')
             namePcodeCf, namePcodeNf, surnamePcode = name_soundexes(name)
-            sqldata.add((pid, name, name_dict.get('imdbIndex'),
+            yield None, (name, name_dict.get('imdbIndex'),
                         namePcodeCf, namePcodeNf, surnamePcode,
-                        md5(line).hexdigest()))
-            if count % 10000 == 0:
-                print 'SCANNING akanames:', _(line)
-            count += 1
+                        md5(line).hexdigest())
+
+
+def doAkaNames():
+    """People's akas."""
+    pid = None
+    count = 0
+    records = parsedRecords(_parseAkaNames, 'aka-names.list.gz', AKAN_START)
+    if records is None: return
+    sqldata = SQLData(table=AkaName, cols=['personID', 'name', 'imdbIndex',
+                            'namePcodeCf', 'namePcodeNf', 'surnamePcode',
+                            'md5sum'])
+    for person, akaData in records:
+        if akaData is None:
+            pid = CACHE_PID.addUnique(person)
+            continue
+        sqldata.add((pid,) + akaData)
+        if count % 10000 == 0:
+            print 'SCANNING akanames:', _(akaData[0])
+        count += 1
     sqldata.flush()
-    fp.close()
 
 
 class AkasMoviesCache(MoviesCache):
@@ -1689,43 +3423,33 @@ class AkasMoviesCache(MoviesCache):
         CACHE_MID.flush(quiet=1)
         super(AkasMoviesCache, self).flush(*args, **kwds)
 
-    def _runCommand(self, dataList):
-        new_dataList = []
-        new_dataListapp = new_dataList.append
-        while dataList:
-            item = list(dataList.pop())
-            # Remove the imdbID.
-            del item[5]
+    def _rows(self):
+        """Yield the rows to be stored, for the new aka titles."""
+        for item in MoviesCache._rows(self):
             # id used to store this entry.
             the_id = item[0]
             # id of the referred title.
             original_title_id = self.ids.get(the_id) or 0
-            new_item = [the_id, original_title_id]
-            md5sum = item[-1]
-            new_item += item[1:-2]
-            new_item.append(self.notes.get(the_id))
-            new_item.append(md5sum)
-            new_dataListapp(tuple(new_item))
-        new_dataList.reverse()
-        if not CSV_DIR:
-            CURS.executemany(self.sqlstr, self.converter(new_dataList))
-        else:
-            CSV_CURS.executemany(self.sqlstr, new_dataList)
+            # Remove the imdbID and the series years.
+            yield (the_id, original_title_id) + item[1:5] + item[6:-2] + \
+                    (self.notes.get(the_id), item[-1])
 CACHE_MID_AKAS = AkasMoviesCache()
 
 
-def doAkaTitles():
-    """Movies' akas."""
-    mid = None
-    count = 0
-    for fname, start in (('aka-titles.list.gz',AKAT_START),
+AKA_TITLES_FILES = (('aka-titles.list.gz',AKAT_START),
                     ('italian-aka-titles.list.gz',AKAT_IT_START),
                     ('german-aka-titles.list.gz',AKAT_DE_START),
                     ('iso-aka-titles.list.gz',AKAT_ISO_START),
                     (os.path.join('contrib','hungarian-aka-titles.list.gz'),
                         AKAT_HU_START),
                     (os.path.join('contrib','norwegian-aka-titles.list.gz'),
-                        AKAT_NO_START)):
+                        AKAT_NO_START))
+
+def doAkaTitles():
+    """Movies' akas."""
+    mid = None
+    count = 0
+    for fname, start in AKA_TITLES_FILES:
         incontrib = 0
         pwarning = 1
         # Looks like that the only up-to-date AKA file is aka-titles.
@@ -1796,14 +3520,13 @@ def doAkaTitles():
                 # Reading an aka title.
                 if obsolete and doNotAdd:
                     continue
-                res = unpack(line.strip(), ('title', 'note'))
-                note = res.get('note')
+                akat, note = splitFields(line.strip(), 2)
                 if incontrib:
-                    if res.get('note'): note += ' '
+                    if note: note += ' '
                     else: note = ''
                     if start == AKAT_HU_START: note += '(Hungary)'
                     elif start == AKAT_NO_START: note += '(Norway)'
-                akat = res.get('title', '')
+                if akat is None: akat = ''
                 if akat[:5] == '(aka ': akat = akat[5:]
                 if akat[-2:] in ('))', '})'): akat = akat[:-1]
                 akat = akat.strip()
@@ -1890,7 +3613,13 @@ def doMovieLinks():
     fp.close()
 
 
-def minusHashFiles(fp, funct, defaultid, descr):
+def _parseMinusHash(fp, funct):
+    """Yield (title, list of information) for every section."""
+    for title, text in fp.getByHashSections():
+        yield title.strip(), funct(text.split('\n'))
+
+
+def minusHashFiles(records, defaultid, descr):
     """A file with lines starting with '# ' and '- '."""
     sqldata = SQLData(table=MovieInfo,
                         cols=['movieID', 'infoTypeID', 'info', 'note'])
@@ -1899,9 +3628,7 @@ def minusHashFiles(fp, funct, defaultid, descr):
     elif descr == 'soundtracks': sqldata.flushEvery = 3000
     elif descr == 'trivia': sqldata.flushEvery = 3000
     count = 0
-    for title, text in fp.getByHashSections():
-        title = title.strip()
-        d = funct(text.split('\n'))
+    for title, d in records:
         if not d:
             print 'WARNING skipping empty information about title:',
             print _(title)
@@ -1922,48 +3649,53 @@ def minusHashFiles(fp, funct, defaultid, descr):
     sqldata.flush()
 
 
+MINUSHASH_FILES = [('alternate versions',AV_START),
+                   ('goofs',GOOFS_START), ('crazy credits',CC_START),
+                   ('quotes',QUOTES_START),
+                   ('soundtracks',SNDT_START),
+                   ('trivia',TRIV_START)]
+
 def doMinusHashFiles():
     """Files with lines starting with '# ' and '- '."""
-    for fname, start in [('alternate versions',AV_START),
-                         ('goofs',GOOFS_START), ('crazy credits',CC_START),
-                         ('quotes',QUOTES_START),
-                         ('soundtracks',SNDT_START),
-                         ('trivia',TRIV_START)]:
-        try:
-            fp = SourceFile(fname.replace(' ', '-')+'.list.gz', start=start,
-                        stop=MINHASH_STOP)
-        except IOError:
-            continue
+    for fname, start in MINUSHASH_FILES:
         funct = _parseMinusList
         if fname == 'quotes': funct = getQuotes
+        records = parsedRecords(_parseMinusHash,
+                                fname.replace(' ', '-')+'.list.gz',
+                                start, MINHASH_STOP, (funct,))
+        if records is None:
+            continue
         index = fname
         if index == 'soundtracks': index = 'soundtrack'
-        minusHashFiles(fp, funct, INFO_TYPES[index], fname)
-        fp.close()
+        minusHashFiles(records, INFO_TYPES[index], fname)
+
+
+def _parseTaglines(fp):
+    """Yield (title, list of taglines) for every section."""
+    for title, text in fp.getByHashSections():
+        tags = [tag.strip() for tag in text.split('\n')]
+        yield title.strip(), [tag for tag in tags if tag]
 
 
 def getTaglines():
     """Movie's taglines."""
-    try: fp = SourceFile('taglines.list.gz', start=TAGL_START, stop=TAGL_STOP)
-    except IOError: return
+    records = parsedRecords(_parseTaglines, 'taglines.list.gz',
+                            TAGL_START, TAGL_STOP)
+    if records is None: return
     sqldata = SQLData(table=MovieInfo,
                 cols=['movieID', 'infoTypeID', 'info', 'note'],
                 flushEvery=10000)
     count = 0
-    for title, text in fp.getByHashSections():
-        title = title.strip()
+    for title, tags in records:
         mid = CACHE_MID.addUnique(title)
         if mid is None:
             continue
-        for tag in text.split('\n'):
-            tag = tag.strip()
-            if not tag: continue
+        for tag in tags:
             if count % 10000 == 0:
                 print 'SCANNING taglines:', _(title)
             sqldata.add((mid, INFO_TYPES['taglines'], tag, None))
         count += 1
     sqldata.flush()
-    fp.close()
 
 
 def getQuotes(lines):
@@ -2097,9 +3829,34 @@ def getMPAA(lines):
     return d
 
 
+def getPlot(lines):
+    """Movie's plot."""
+    plotl = []
+    plotlappend = plotl.append
+    plotltmp = []
+    plotltmpappend = plotltmp.append
+    for line in lines:
+        linestart = line[:4]
+        if linestart == 'PL: ':
+            plotltmpappend(line[4:])
+        elif linestart == 'BY: ':
+            plotlappend('%s::%s' % (' '.join(plotltmp), line[4:].strip()))
+            plotltmp[:] = []
+    return {'plot': plotl}
+
+
 re_nameImdbIndex = re.compile(r'\(([IVXLCDM]+)\)')
 
-def nmmvFiles(fp, funct, fname):
+def _parseNMMV(fp, funct):
+    """Yield (title or name, dictionary of information) for every
+    section."""
+    for ton, text in fp.getByNMMVSections():
+        ton = ton.strip()
+        if not ton: continue
+        yield ton, funct(text.split('\n'))
+
+
+def nmmvFiles(records, fname):
     """Files with sections separated by 'MV: ' or 'NM: '."""
     count = 0
     sqlsP = (PersonInfo, ['personID', 'infoTypeID', 'info', 'note'])
@@ -2108,6 +3865,7 @@ def nmmvFiles(fp, funct, fname):
     if fname == 'biographies.list.gz':
         datakind = 'person'
         sqls = sqlsP
+        waitWriter()
         guestid = RoleType.select(RoleType.q.role == 'guest')[0].id
         roleid = str(guestid)
         guestdata = SQLData(table=CastInfo,
@@ -2130,9 +3888,7 @@ def nmmvFiles(fp, funct, fname):
     if fname == 'laserdisc.list.gz':
         islaserdisc = True
     _ltype = type([])
-    for ton, text in fp.getByNMMVSections():
-        ton = ton.strip()
-        if not ton: continue
+    for ton, d in records:
         note = None
         if datakind == 'movie':
             if islaserdisc:
@@ -2150,7 +3906,6 @@ def nmmvFiles(fp, funct, fname):
         if count % 6000 == 0:
             print 'SCANNING %s:' % fname[:-8].replace('-', ' '),
             print _(ton)
-        d = funct(text.split('\n'))
         for k, v in d.iteritems():
             if k != 'notable tv guest appearances':
                 theid = INFO_TYPES.get(k)
@@ -2351,83 +4106,88 @@ def _parseBiography(biol):
 # ============
 
 
+NMMV_FILES = [('biographies.list.gz', BIO_START, None, _parseBiography),
+            ('business.list.gz', BUS_START, BUS_STOP, getBusiness),
+            ('laserdisc.list.gz', LSD_START, None, getLaserDisc),
+            ('literature.list.gz', LIT_START, LIT_STOP, getLiterature),
+            ('mpaa-ratings-reasons.list.gz', MPAA_START, None, getMPAA),
+            ('plot.list.gz', PLOT_START, None, getPlot)]
+
 def doNMMVFiles():
     """Files with large sections, about movies and persons."""
-    for fname, start, funct in [
-            ('biographies.list.gz', BIO_START, _parseBiography),
-            ('business.list.gz', BUS_START, getBusiness),
-            ('laserdisc.list.gz', LSD_START, getLaserDisc),
-            ('literature.list.gz', LIT_START, getLiterature),
-            ('mpaa-ratings-reasons.list.gz', MPAA_START, getMPAA),
-            ('plot.list.gz', PLOT_START, getPlot)]:
-    ##for fname, start, funct in [('business.list.gz',BUS_START,getBusiness)]:
-        try:
-            fp = SourceFile(fname, start=start)
-        except IOError:
+    for fname, start, stop, funct in NMMV_FILES:
+        records = parsedRecords(_parseNMMV, fname, start, stop, (funct,))
+        if records is None:
             continue
-        if fname == 'literature.list.gz': fp.set_stop(LIT_STOP)
-        elif fname == 'business.list.gz': fp.set_stop(BUS_STOP)
-        nmmvFiles(fp, funct, fname)
-        fp.close()
+        nmmvFiles(records, fname)
         t('doNMMVFiles(%s)' % fname[:-8].replace('-', ' '))
 
 
+MOVIE_COMPANIES_FILES = (('distributors.list.gz', DIS_START),
+                        ('miscellaneous-companies.list.gz', MIS_START),
+                        ('production-companies.list.gz', PRO_START),
+                        ('special-effects-companies.list.gz', SFX_START))
+
+def _parseMovieCompanies(fp):
+    """Yield (title, company, note) for every line."""
+    for line in fp:
+        title, company, note = splitFields(line.strip(), 3)
+        if company is None: continue
+        yield title, company, note
+
+
 def doMovieCompaniesInfo():
     """Files with information on a single line about movies,
     concerning companies."""
     sqldata = SQLData(table=MovieCompanies,
                 cols=['movieID', 'companyID', 'companyTypeID', 'note'])
-    for dataf in (('distributors.list.gz', DIS_START),
-                    ('miscellaneous-companies.list.gz', MIS_START),
-                    ('production-companies.list.gz', PRO_START),
-                    ('special-effects-companies.list.gz', SFX_START)):
-        try:
-            fp = SourceFile(dataf[0], start=dataf[1])
-        except IOError:
+    for dataf in MOVIE_COMPANIES_FILES:
+        records = parsedRecords(_parseMovieCompanies, dataf[0], dataf[1])
+        if records is None:
             continue
         typeindex = dataf[0][:-8].replace('-', ' ')
         infoid =  COMP_TYPES[typeindex]
         count = 0
-        for line in fp:
-            data = unpack(line.strip(), ('title', 'company', 'note'))
-            if 'title' not in data: continue
-            if 'company' not in data: continue
-            title = data['title']
-            company = data['company']
+        for title, company, note in records:
             mid = CACHE_MID.addUnique(title)
             if mid is None:
                 continue
             cid = CACHE_COMPID.addUnique(company)
-            note = None
-            if 'note' in data:
-                note = data['note']
             if count % 10000 == 0:
                 print 'SCANNING %s:' % dataf[0][:-8].replace('-', ' '),
-                print _(data['title'])
+                print _(title)
             sqldata.add((mid, cid, infoid, note))
             count += 1
         sqldata.flush()
         CACHE_COMPID.flush()
-        fp.close()
         t('doMovieCompaniesInfo(%s)' % dataf[0][:-8].replace('-', ' '))
 
 
+MISC_MOVIE_INFO_FILES = (('certificates.list.gz',CER_START),
+                        ('color-info.list.gz',COL_START),
+                        ('countries.list.gz',COU_START),
+                        ('genres.list.gz',GEN_START),
+                        ('keywords.list.gz',KEY_START),
+                        ('language.list.gz',LAN_START),
+                        ('locations.list.gz',LOC_START),
+                        ('running-times.list.gz',RUN_START),
+                        ('sound-mix.list.gz',SOU_START),
+                        ('technical.list.gz',TCN_START),
+                        ('release-dates.list.gz',RELDATE_START))
+
+def _parseMiscMovieInfo(fp):
+    """Yield (title, info, note) for every line."""
+    for line in fp:
+        title, info, note = splitFields(line.strip(), 3)
+        if info is None: continue
+        yield title, info, note
+
+
 def doMiscMovieInfo():
     """Files with information on a single line about movies."""
-    for dataf in (('certificates.list.gz',CER_START),
-                    ('color-info.list.gz',COL_START),
-                    ('countries.list.gz',COU_START),
-                    ('genres.list.gz',GEN_START),
-                    ('keywords.list.gz',KEY_START),
-                    ('language.list.gz',LAN_START),
-                    ('locations.list.gz',LOC_START),
-                    ('running-times.list.gz',RUN_START),
-                    ('sound-mix.list.gz',SOU_START),
-                    ('technical.list.gz',TCN_START),
-                    ('release-dates.list.gz',RELDATE_START)):
-        try:
-            fp = SourceFile(dataf[0], start=dataf[1])
-        except IOError:
+    for dataf in MISC_MOVIE_INFO_FILES:
+        records = parsedRecords(_parseMiscMovieInfo, dataf[0], dataf[1])
+        if records is None:
             continue
         typeindex = dataf[0][:-8].replace('-', ' ')
         if typeindex == 'running times': typeindex = 'runtimes'
@@ -2445,21 +4205,13 @@ def doMiscMovieInfo():
             sqldata.flushEvery = 10000
         else:
             sqldata.flushEvery = 20000
-        for line in fp:
-            data = unpack(line.strip(), ('title', 'info', 'note'))
-            if 'title' not in data: continue
-            if 'info' not in data: continue
-            title = data['title']
+        for title, info, note in records:
             mid = CACHE_MID.addUnique(title)
             if mid is None:
                 continue
-            note = None
-            if 'note' in data:
-                note = data['note']
             if count % 10000 == 0:
                 print 'SCANNING %s:' % dataf[0][:-8].replace('-', ' '),
-                print _(data['title'])
-            info = data['info']
+                print _(title)
             if typeindex == 'keywords':
                 keywordID = CACHE_KWRDID.addUnique(info)
                 sqldata.add((mid, keywordID))
@@ -2470,34 +4222,38 @@ def doMiscMovieInfo():
         if typeindex == 'keywords':
             CACHE_KWRDID.flush()
             CACHE_KWRDID.clear()
-        fp.close()
         t('doMiscMovieInfo(%s)' % dataf[0][:-8].replace('-', ' '))
 
 
+def _parseRating(fp):
+    """Yield (title, votes distribution, votes, rating) for every line."""
+    for line in fp:
+        data = splitRating(line)
+        if data is None: continue
+        votesDistribution, votes, rating, title = data
+        yield title, votesDistribution, votes, rating
+
+
 def getRating():
     """Movie's rating."""
-    try: fp = SourceFile('ratings.list.gz', start=RAT_START, stop=RAT_STOP)
-    except IOError: return
+    records = parsedRecords(_parseRating, 'ratings.list.gz',
+                            RAT_START, RAT_STOP)
+    if records is None: return
     sqldata = SQLData(table=MovieInfoIdx, cols=['movieID', 'infoTypeID',
                                                 'info', 'note'])
     count = 0
-    for line in fp:
-        data = unpack(line, ('votes distribution', 'votes', 'rating', 'title'),
-                        sep='  ')
-        if 'title' not in data: continue
-        title = data['title'].strip()
+    for title, votesDistribution, votes, rating in records:
         mid = CACHE_MID.addUnique(title)
         if mid is None:
             continue
         if count % 10000 == 0:
             print 'SCANNING rating:', _(title)
         sqldata.add((mid, INFO_TYPES['votes distribution'],
-                    data.get('votes distribution'), None))
-        sqldata.add((mid, INFO_TYPES['votes'], data.get('votes'), None))
-        sqldata.add((mid, INFO_TYPES['rating'], data.get('rating'), None))
+                    votesDistribution, None))
+        sqldata.add((mid, INFO_TYPES['votes'], votes, None))
+        sqldata.add((mid, INFO_TYPES['rating'], rating, None))
         count += 1
     sqldata.flush()
-    fp.close()
 
 
 def getTopBottomRating():
@@ -2514,10 +4270,9 @@ def getTopBottomRating():
         count = 1
         print 'SCANNING %s...' % what
         for line in fp:
-            data = unpack(line, ('votes distribution', 'votes', 'rank',
-                                'title'), sep='  ')
-            if 'title' not in data: continue
-            title = data['title'].strip()
+            data = splitRating(line)
+            if data is None: continue
+            title = data[3]
             mid = CACHE_MID.addUnique(title)
             if mid is None:
                 continue
@@ -2529,20 +4284,15 @@ def getTopBottomRating():
         fp.close()
 
 
-def getPlot(lines):
-    """Movie's plot."""
-    plotl = []
-    plotlappend = plotl.append
-    plotltmp = []
-    plotltmpappend = plotltmp.append
-    for line in lines:
-        linestart = line[:4]
-        if linestart == 'PL: ':
-            plotltmpappend(line[4:])
-        elif linestart == 'BY: ':
-            plotlappend('%s::%s' % (' '.join(plotltmp), line[4:].strip()))
-            plotltmp[:] = []
-    return {'plot': plotl}
+COMPLETE_CAST_FILES = [('complete-cast.list.gz',COMPCAST_START),
+                       ('complete-crew.list.gz',COMPCREW_START)]
+
+def _parseCompleteCast(fp):
+    """Yield (title, status) for every line."""
+    for line in fp:
+        ll = [x for x in line.split('\t') if x]
+        if len(ll) != 2: continue
+        yield ll[0], ll[1].lower().strip()
 
 
 def completeCast():
@@ -2551,11 +4301,9 @@ def completeCast():
     cckinds = [(x.id, x.kind) for x in CompCastType.select()]
     for k, v in cckinds:
         CCKind[v] = k
-    for fname, start in [('complete-cast.list.gz',COMPCAST_START),
-                        ('complete-crew.list.gz',COMPCREW_START)]:
-        try:
-            fp = SourceFile(fname, start=start, stop=COMP_STOP)
-        except IOError:
+    for fname, start in COMPLETE_CAST_FILES:
+        records = parsedRecords(_parseCompleteCast, fname, start, COMP_STOP)
+        if records is None:
             continue
         if fname == 'complete-cast.list.gz': obj = 'cast'
         else: obj = 'crew'
@@ -2564,22 +4312,72 @@ def completeCast():
                 cols=['movieID', RawValue('subjectID', subID),
                 'statusID'])
         count = 0
-        for line in fp:
-            ll = [x for x in line.split('\t') if x]
-            if len(ll) != 2: continue
-            title = ll[0]
+        for title, status in records:
             mid = CACHE_MID.addUnique(title)
             if mid is None:
                 continue
             if count % 10000 == 0:
                 print 'SCANNING %s:' % fname[:-8].replace('-', ' '),
                 print _(title)
-            sqldata.add((mid, CCKind[ll[1].lower().strip()]))
+            sqldata.add((mid, CCKind[status]))
             count += 1
-        fp.close()
         sqldata.flush()
 
 
+# Stage of run() that reads the records of each parser.
+PARSER_STAGES = {'_parseMovieCompanies': 'doMovieCompaniesInfo',
+                '_parseAkaNames': 'doAkaNames',
+                '_parseMinusHash': 'doMinusHashFiles',
+                '_parseNMMV': 'doNMMVFiles',
+                '_parseMiscMovieInfo': 'doMiscMovieInfo',
+                '_parseRating': 'getRating',
+                '_parseTaglines': 'getTaglines',
+                '_parseCompleteCast': 'completeCast'}
+
+def taskStage(task):
+    """Return the stage of run() that reads the records of a task."""
+    parser, fname = task[:2]
+    if parser is _parseCast:
+        for rolename in SHARDED_CAST_ROLES:
+            if castFileName(rolename) == fname:
+                return 'castLists(%s)' % rolename
+    return PARSER_STAGES[parser.__name__]
+
+def taskCached(task):
+    """Return True if the records of a task are in the parsed cache."""
+    parser, fname, start, stop, extra = task
+    if parser is _parseCast:
+        # Shards are merged before being stored.
+        extra = ()
+    return parsedCacheValid(parser, fname, extra)
+
+def parseTasks():
+    """Return the list of (parser, fname, start, stop, extra) tasks
+    that can be run in worker processes, in the order used by run();
+    the biggest cast lists come first, split in NR_JOBS shards."""
+    tasks = [(_parseCast, castFileName(rolename), CAST_START, CAST_STOP,
+            (shard, NR_JOBS)) for rolename in SHARDED_CAST_ROLES
+            for shard in xrange(NR_JOBS)]
+    tasks += [(_parseMovieCompanies, fname, start, None, ())
+            for fname, start in MOVIE_COMPANIES_FILES]
+    tasks.append((_parseAkaNames, 'aka-names.list.gz', AKAN_START, None, ()))
+    for fname, start in MINUSHASH_FILES:
+        funct = _parseMinusList
+        if fname == 'quotes': funct = getQuotes
+        tasks.append((_parseMinusHash, fname.replace(' ', '-')+'.list.gz',
+                    start, MINHASH_STOP, (funct,)))
+    tasks += [(_parseNMMV, fname, start, stop, (funct,))
+            for fname, start, stop, funct in NMMV_FILES]
+    tasks += [(_parseMiscMovieInfo, fname, start, None, ())
+            for fname, start in MISC_MOVIE_INFO_FILES]
+    tasks.append((_parseRating, 'ratings.list.gz', RAT_START, RAT_STOP, ()))
+    tasks.append((_parseTaglines, 'taglines.list.gz', TAGL_START, TAGL_STOP,
+                ()))
+    tasks += [(_parseCompleteCast, fname, start, COMP_STOP, ())
+            for fname, start in COMPLETE_CAST_FILES]
+    return tasks
+
+
 # global instances
 CACHE_MID = MoviesCache()
 CACHE_PID = PersonsCache()
@@ -2675,29 +4473,70 @@ def storeNotNULLimdbIDs(cls):
             CURS.execute('CREATE INDEX %s_imdbid_idx ON %s_extract (%s)' % (table_name, table_name, imdbID_col))
             rows = _countRows('%s_extract' % table_name)
             print 'DONE! (%d entries using a temporary table)' % rows
+            if not CSV_DIR:
+                # The temporary table doesn't survive an interrupted run.
+                print 'SAVING imdbID values for %s for --resume...' % cname,
+                sys.stdout.flush()
+                _dumpImdbIDs(_dbmFileName(cname), table_name, md5sum_col,
+                            imdbID_col)
             return
         except Exception, e:
             print 'WARNING: unable to store imdbIDs in a temporary table (falling back to dbm): %s' % e
+    _dumpImdbIDs(_dbmFileName(cname), table_name, md5sum_col, imdbID_col)
+
+
+def _dbmFileName(cname):
+    """Return the name of the dbm file used to store the imdbIDs of
+    movies, people, characters or companies; with the 'table' method,
+    it's saved along with the checkpoint, for --resume."""
+    if _get_imdbids_method() == 'table' and not CSV_DIR:
+        return _checkpointIDsFileName(cname)
+    return _imdbIDsFileName('%s_imdbIDs.db' % cname)
+
+
+def _dumpImdbIDs(fname, table_name, md5sum_col, imdbID_col):
+    """Store the (md5sum, imdbID) pairs of a table in a dbm database."""
     try:
-        db = anydbm.open(_imdbIDsFileName('%s_imdbIDs.db' % cname), 'c')
+        db = anydbm.open(fname, 'c')
     except Exception, e:
         print 'WARNING: unable to store imdbIDs: %s' % str(e)
         return
+    curs = streamingCursor()
     try:
-        CURS.execute('SELECT %s, %s FROM %s WHERE %s IS NOT NULL' %
-                    (md5sum_col, imdbID_col, table_name, imdbID_col))
-        res = CURS.fetchmany(10000)
-        while res:
-            db.update(dict((str(x[0]), str(x[1])) for x in res))
-            res = CURS.fetchmany(10000)
-    except Exception, e:
-        print 'SKIPPING: unable to retrieve data: %s' % e
-        return
+        try:
+            curs.execute('SELECT %s, %s FROM %s WHERE %s IS NOT NULL' %
+                        (md5sum_col, imdbID_col, table_name, imdbID_col))
+            for md5sum, imdbID in fetchsome(curs, 10000):
+                db[str(md5sum)] = str(imdbID)
+        except Exception, e:
+            print 'SKIPPING: unable to retrieve data: %s' % e
+            return
+    finally:
+        if curs is not CURS:
+            try: curs.close()
+            except Exception: pass
     print 'DONE! (%d entries)' % len(db)
     db.close()
     return
 
 
+def streamingCursor():
+    """Return a cursor that fetches the rows of a query while they
+    are read (a server-side cursor, where supported), instead of
+    loading the whole result in memory; CURS, if not available."""
+    try:
+        if DB_NAME == 'postgres':
+            curs = connectObject.cursor('imdbpy2sql_stream')
+            curs.itersize = 10000
+            return curs
+        elif DB_NAME == 'mysql':
+            import MySQLdb.cursors
+            return connectObject.cursor(MySQLdb.cursors.SSCursor)
+    except Exception, e:
+        print 'WARNING: unable to create a server-side cursor: %s' % e
+    return CURS
+
+
 def iterbatch(iterable, size):
     """Process an iterable 'size' items at a time."""
     sourceiter = iter(iterable)
@@ -2722,43 +4561,33 @@ def restoreImdbIDs(cls):
     md5sum_col = colName(cls, 'md5sum')
     imdbID_col = colName(cls, 'imdbID')
 
-    if _get_imdbids_method() == 'table':
+    # With --resume, the temporary table was lost with the interrupted run.
+    if _get_imdbids_method() == 'table' and not RESUME:
         try:
             try:
                 CURS.execute('SELECT * FROM %s_extract LIMIT 1' % table_name)
             except Exception, e:
                 raise Exception('missing "%s_extract" table (ok if this is the first run)' % table_name)
-
-            if DB_NAME == 'mysql':
-                query = 'UPDATE %s INNER JOIN %s_extract USING (%s) SET %s.%s = %s_extract.%s' % \
-                        (table_name, table_name, md5sum_col,
-                        table_name, imdbID_col, table_name, imdbID_col)
-            else:
-                query = 'UPDATE %s SET %s = %s_extract.%s FROM %s_extract WHERE %s.%s = %s_extract.%s' % \
-                        (table_name, imdbID_col, table_name,
-                        imdbID_col, table_name, table_name,
-                        md5sum_col, table_name, md5sum_col)
-            CURS.execute(query)
-            affected_rows = 'an unknown number of'
-            try:
-                CURS.execute('SELECT COUNT(*) FROM %s WHERE %s IS NOT NULL' %
-                        (table_name, imdbID_col))
-                affected_rows = (CURS.fetchone() or [0])[0]
-            except Exception, e:
-                pass
-            rows = _countRows('%s_extract' % table_name)
-            print 'DONE! (restored %s entries out of %d)' % (affected_rows, rows)
-            t('restore %s' % cname)
-            try: CURS.execute('DROP TABLE %s_extract' % table_name)
-            except: pass
+            _restoreFromExtract(table_name, md5sum_col, imdbID_col, cname)
             return
         except Exception, e:
             print 'WARNING: unable to restore imdbIDs using the temporary table (falling back to dbm): %s' % e
     try:
-        db = anydbm.open(_imdbIDsFileName('%s_imdbIDs.db' % cname), 'r')
+        db = anydbm.open(_dbmFileName(cname), 'r')
     except Exception, e:
         print 'WARNING: unable to restore imdbIDs (ok if this is the first run)'
         return
+    try:
+        # Bulk load the dbm content in a staging table, and restore
+        # the imdbIDs with a single join.
+        _loadExtract(table_name, md5sum_col, imdbID_col, db.iteritems())
+        _restoreFromExtract(table_name, md5sum_col, imdbID_col, cname)
+        db.close()
+        return
+    except Exception, e:
+        print 'WARNING: unable to restore imdbIDs using a staging table (falling back to batches of updates): %s' % e
+        try: CURS.execute('DROP TABLE %s_extract' % table_name)
+        except: pass
     count = 0
     sql = "UPDATE " + table_name + " SET " + imdbID_col + \
             " = CASE " + md5sum_col + " %s END WHERE " + \
@@ -2779,6 +4608,46 @@ def restoreImdbIDs(cls):
     db.close()
     return
 
+def _loadExtract(table_name, md5sum_col, imdbID_col, items):
+    """Store (md5sum, imdbID) pairs in the (indexed) temporary table
+    used to restore the imdbIDs, using the bulk loader of the db."""
+    extract = '%s_extract' % table_name
+    CURS.execute('CREATE TEMPORARY TABLE %s (%s CHAR(32), %s INTEGER)' %
+                (extract, md5sum_col, imdbID_col))
+    sqlstr, converter = createRawSQLstr(extract, [md5sum_col, imdbID_col])
+    bulkWriter(sqlstr, converter).write((k, int(v)) for k, v in items)
+    CURS.execute('CREATE INDEX %s_md5sum_idx ON %s (%s)' % (table_name,
+                extract, md5sum_col))
+    connectObject.commit()
+
+
+def _restoreFromExtract(table_name, md5sum_col, imdbID_col, cname):
+    """Restore the imdbIDs stored in the temporary table, joining it
+    on the md5sum column, and drop it."""
+    if DB_NAME == 'mysql':
+        query = 'UPDATE %s INNER JOIN %s_extract USING (%s) SET %s.%s = %s_extract.%s' % \
+                (table_name, table_name, md5sum_col,
+                table_name, imdbID_col, table_name, imdbID_col)
+    else:
+        query = 'UPDATE %s SET %s = %s_extract.%s FROM %s_extract WHERE %s.%s = %s_extract.%s' % \
+                (table_name, imdbID_col, table_name,
+                imdbID_col, table_name, table_name,
+                md5sum_col, table_name, md5sum_col)
+    CURS.execute(query)
+    affected_rows = 'an unknown number of'
+    try:
+        CURS.execute('SELECT COUNT(*) FROM %s WHERE %s IS NOT NULL' %
+                (table_name, imdbID_col))
+        affected_rows = (CURS.fetchone() or [0])[0]
+    except Exception, e:
+        pass
+    rows = _countRows('%s_extract' % table_name)
+    print 'DONE! (restored %s entries out of %d)' % (affected_rows, rows)
+    t('restore %s' % cname)
+    try: CURS.execute('DROP TABLE %s_extract' % table_name)
+    except: pass
+
+
 def restoreAll_imdbIDs():
     """Restore imdbIDs for movies, persons, companies and characters."""
     # Restoring imdbIDs for movies and persons (moved after the
@@ -2805,8 +4674,9 @@ def runSafely(funct, fmsg, default, *args, **kwds):
     return default
 
 
-def _executeQuery(query):
-    """Execute a query on the CURS object."""
+def _executeQuery(query, curs=None):
+    """Execute a query on the CURS object (or on the given cursor)."""
+    if curs is None: curs = CURS
     if len(query) > 60:
         s_query = query[:60] + '...'
     else:
@@ -2814,7 +4684,7 @@ def _executeQuery(query):
     print 'EXECUTING "%s"...' % (s_query),
     sys.stdout.flush()
     try:
-        CURS.execute(query)
+        curs.execute(query)
         print 'DONE!'
         return True
     except Exception, e:
@@ -2822,21 +4692,22 @@ def _executeQuery(query):
         return False
 
 
-def executeCustomQueries(when, _keys=None, _timeit=True):
+def executeCustomQueries(when, _keys=None, _timeit=True, _curs=None):
     """Run custom queries as specified on the command line."""
     if _keys is None: _keys = {}
+    if _curs is None: _curs = CURS
     for query in CUSTOM_QUERIES.get(when, []):
         print 'EXECUTING "%s:%s"...' % (when, query)
         sys.stdout.flush()
         if query.startswith('FOR_EVERY_TABLE:'):
             query = query[16:]
-            CURS.execute('SHOW TABLES;')
-            tables = [x[0] for x in CURS.fetchall()]
+            _curs.execute('SHOW TABLES;')
+            tables = [x[0] for x in _curs.fetchall()]
             for table in tables:
                 try:
                     keys = {'table': table}
                     keys.update(_keys)
-                    _executeQuery(query % keys)
+                    _executeQuery(query % keys, _curs)
                     if _timeit:
                         t('%s command' % when)
                 except Exception, e:
@@ -2844,7 +4715,7 @@ def executeCustomQueries(when, _keys=None, _timeit=True):
                     continue
         else:
             try:
-                _executeQuery(query % _keys)
+                _executeQuery(query % _keys, _curs)
             except Exception, e:
                 print 'FAILED (%s)!' % e
                 continue
@@ -2858,9 +4729,19 @@ def buildIndexesAndFK():
     print 'building database indexes (this may take a while)'
     sys.stdout.flush()
     # Build database indexes.
-    idx_errors = createIndexes(DB_TABLES)
-    for idx_error in idx_errors:
-        print 'ERROR caught exception creating an index: %s' % idx_error
+    if NR_JOBS > 1 and DB_NAME != 'sqlite':
+        # SQLite can't write more than a table at a time.
+        def _createIndexes(table):
+            since = _timeMark()
+            for idx_error in createIndexes([table]):
+                _log('ERROR caught exception creating an index: %s' % \
+                        idx_error)
+            t('createIndexes(%s)' % tableName(table), since=since)
+        runParallel(DB_TABLES, _createIndexes)
+    else:
+        idx_errors = createIndexes(DB_TABLES)
+        for idx_error in idx_errors:
+            print 'ERROR caught exception creating an index: %s' % idx_error
     t('createIndexes()')
     print 'adding foreign keys (this may take a while)'
     sys.stdout.flush()
@@ -2886,42 +4767,634 @@ def restoreCSV():
     t('FINAL', sinceBegin=True)
 
 
+# Checkpoints.
+
+# Stages completed, next values of the caches' counters and the highest
+# id of every table, as saved at the end of the last completed stage.
+CHECKPOINT = {'stages': [], 'counters': {}, 'maxIDs': {}}
+
+
+def _checkpointCaches():
+    """Return the list of caches whose counters are saved."""
+    return [CACHE_MID, CACHE_PID, CACHE_CID, CACHE_COMPID, CACHE_KWRDID,
+            CACHE_MID_AKAS]
+
+
+def _peekCounter(cache):
+    """Return the next value of the counter of a cache, without
+    consuming it."""
+    value = cache.counter.next()
+    cache.counter = counter(value)
+    return value
+
+
+def _maxIDs():
+    """Return a dictionary with the name of the id column and the
+    highest id of every table."""
+    maxIDs = {}
+    for table in DB_TABLES:
+        tName = tableName(table)
+        idCol = table.sqlmeta.idName
+        try:
+            CURS.execute('SELECT MAX(%s) FROM %s' % (idCol, tName))
+            maxIDs[tName] = (idCol, (CURS.fetchone() or [None])[0])
+        except Exception, e:
+            print 'WARNING: unable to read the max id of table %s: %s' % \
+                    (tName, e)
+    return maxIDs
+
+
+def saveCheckpoint(stage):
+    """Flush the caches and durably record that the given stage
+    is complete."""
+    if CSV_DIR:
+        return
+    for cache in _checkpointCaches():
+        cache.flush(quiet=1)
+    # Stages nested in another one (e.g. castLists) share the writer
+    # of the outer stage: its rows must be stored before the commit.
+    waitWriter()
+    commitStage()
+    CHECKPOINT['stages'].append(stage)
+    CHECKPOINT['counters'] = dict([(cache.className, _peekCounter(cache))
+                                    for cache in _checkpointCaches()])
+    CHECKPOINT['maxIDs'] = _maxIDs()
+    fname = _imdbIDsFileName(CHECKPOINT_FILE)
+    tmpName = fname + '.tmp'
+    fd = open(tmpName, 'w')
+    json.dump(CHECKPOINT, fd)
+    fd.flush()
+    os.fsync(fd.fileno())
+    fd.close()
+    os.rename(tmpName, fname)
+
+
+def _checkpointIDsFileName(cname):
+    """Return the name of the dbm file where the imdbIDs of movies,
+    people, characters or companies are saved for --resume, when
+    they are stored in temporary tables."""
+    return _imdbIDsFileName('%s.%s_imdbIDs.db' % (CHECKPOINT_FILE, cname))
+
+
+def removeCheckpoint():
+    """Remove the checkpoint file (and the imdbIDs saved along with it),
+    at the end of a complete run."""
+    fnames = [_imdbIDsFileName(CHECKPOINT_FILE)]
+    for cname in ('movies', 'people', 'characters', 'companies'):
+        fname = _checkpointIDsFileName(cname)
+        # The files created by the different dbm modules.
+        fnames += [fname + ext for ext in ('', '.db', '.dat', '.dir',
+                                            '.bak', '.pag')]
+    for fname in fnames:
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+
+
+def stageDone(stage):
+    """Return True if the given stage was completed by a previous run."""
+    if stage in CHECKPOINT['stages']:
+        print 'SKIPPING %s (completed by a previous run)' % stage
+        return True
+    return False
+
+
+def stageWanted(stage):
+    """Return True if a stage is going to be run."""
+    if stage in CHECKPOINT['stages']:
+        return False
+    if DELTA and stageFiles(stage) is not None:
+        return deltaChanged(stage)
+    return True
+
+
+def runStage(stage, funct, *args, **kwds):
+    """Run a stage of the import, unless it was completed by a
+    previous run or - in delta mode - its data files are unchanged,
+    and save a checkpoint."""
+    if stageDone(stage):
+        return
+    files = stageFiles(stage)
+    before = None
+    if files is not None and not CSV_DIR:
+        # The database is read here: the writer of an outer stage must
+        # be idle.
+        waitWriter()
+        if DELTA:
+            if not deltaChanged(stage):
+                print 'SKIPPING %s (data files unchanged)' % stage
+                return
+            deltaLoadRows(stage)
+        before = _maxIDs()
+        deltaMarkDirty(stage, before)
+    mark = _metricsMark()
+    started = startWriter()
+    beginStage()
+    try:
+        funct(*args, **kwds)
+    finally:
+        if started: stopWriter()
+        else: waitWriter()
+    removed = {}
+    if before is not None:
+        removed = deltaRemoveRows(stage)
+    stageMetrics(stage, mark)
+    saveCheckpoint(stage)
+    if before is not None:
+        deltaRecordStage(stage, CHECKPOINT['maxIDs'], removed)
+
+
+def resumeCheckpoint():
+    """Load the last checkpoint, remove the data of the stage that was
+    not completed and restore the caches."""
+    global CHECKPOINT
+    fname = _imdbIDsFileName(CHECKPOINT_FILE)
+    try:
+        fd = open(fname)
+        CHECKPOINT = json.load(fd)
+        fd.close()
+    except (IOError, ValueError), e:
+        raise IMDbError('unable to read the checkpoint file %s: %s' % \
+                        (fname, e))
+    CHECKPOINT['stages'] = [str(x) for x in CHECKPOINT['stages']]
+    loadDeltaState(required=False)
+    if not CHECKPOINT['stages']:
+        print 'RESUMING from the beginning (no stage was completed)'
+    else:
+        print 'RESUMING after %s' % CHECKPOINT['stages'][-1]
+    # Remove what was stored by the stage that was not completed.
+    for tName, (idCol, maxID) in CHECKPOINT['maxIDs'].iteritems():
+        if maxID is None:
+            _executeQuery('DELETE FROM %s' % tName)
+        else:
+            _executeQuery('DELETE FROM %s WHERE %s > %d' % (tName, idCol,
+                                                            maxID))
+    connectObject.commit()
+    CACHE_MID.populate()
+    CACHE_PID.populate()
+    if 'castLists(actress)' not in CHECKPOINT['stages']:
+        CACHE_CID.populate()
+    for cache in _checkpointCaches():
+        nextID = CHECKPOINT['counters'].get(cache.className)
+        if nextID is not None:
+            cache.counter = counter(nextID)
+    t('resumeCheckpoint()')
+
+
+# Delta updates.
+
+# For every stage owning rows of the dependent tables (cast_info,
+# movie_info, ...): the checksums of its data files and, for every
+# table, the ranges of ids (first and last) of the rows it stored;
+# a last id of None marks a stage that was not completed.
+DELTA_STATE = {}
+# Checksums of the data files, computed once.
+_CHECKSUMS = {}
+# For every table of the stage being updated: the name of the id
+# column and a dictionary mapping the checksums of the rows stored
+# by the last run to their ids (a list, for duplicated rows).
+_DELTA_ROWS = {}
+# Number of rows of the last run found again, for every table.
+_DELTA_KEPT = {}
+# Functions computing the checksum of the rows of an INSERT statement.
+_DELTA_ROW_KEYS = {}
+# Names of the columns of the tables, but the id.
+_DELTA_COLUMNS = {}
+
+
+def stageFiles(stage):
+    """Return the list of data files read by a stage, or None if the
+    stage only stores titles, names and the like."""
+    if stage.startswith('castLists('):
+        return [castFileName(stage[10:-1])]
+    return {'doMovieCompaniesInfo': [x[0] for x in MOVIE_COMPANIES_FILES],
+            'doAkaNames': ['aka-names.list.gz'],
+            'doAkaTitles': [x[0] for x in AKA_TITLES_FILES],
+            'doMinusHashFiles': [x[0].replace(' ', '-')+'.list.gz'
+                                for x in MINUSHASH_FILES],
+            'doNMMVFiles': [x[0] for x in NMMV_FILES],
+            'doMiscMovieInfo': [x[0] for x in MISC_MOVIE_INFO_FILES],
+            'doMovieLinks': ['movie-links.list.gz'],
+            'getRating': ['ratings.list.gz'],
+            'getTaglines': ['taglines.list.gz'],
+            'getTopBottomRating': ['ratings.list.gz'],
+            'completeCast': [x[0] for x in COMPLETE_CAST_FILES]}.get(stage)
+
+
+def _fileChecksum(fname):
+    """Return the md5 checksum of a data file, or None if it's missing."""
+    if fname in _CHECKSUMS:
+        return _CHECKSUMS[fname]
+    checksum = None
+    try:
+        fd = open(os.path.join(IMDB_PTDF_DIR, fname), 'rb')
+        m = md5()
+        while 1:
+            data = fd.read(1024*1024)
+            if not data: break
+            m.update(data)
+        fd.close()
+        checksum = m.hexdigest()
+    except IOError:
+        pass
+    _CHECKSUMS[fname] = checksum
+    return checksum
+
+
+def _entityTables():
+    """Names of the tables managed by the caches."""
+    return [tableName(x) for x in (Title, Name, CharName, CompanyName,
+                                    Keyword)]
+
+
+def saveDeltaState():
+    """Atomically write the delta state file."""
+    fname = _imdbIDsFileName(DELTA_FILE)
+    tmpName = fname + '.tmp'
+    fd = open(tmpName, 'w')
+    json.dump(DELTA_STATE, fd)
+    fd.flush()
+    os.fsync(fd.fileno())
+    fd.close()
+    os.rename(tmpName, fname)
+
+
+def loadDeltaState(required=True):
+    """Read the delta state file."""
+    global DELTA_STATE
+    fname = _imdbIDsFileName(DELTA_FILE)
+    try:
+        fd = open(fname)
+        DELTA_STATE = json.load(fd)
+        fd.close()
+    except (IOError, ValueError), e:
+        if required:
+            raise IMDbError('unable to read the delta file %s (a previous '
+                            'complete run is required): %s' % (fname, e))
+        DELTA_STATE = {}
+    for data in DELTA_STATE.values():
+        for tName, value in data['ranges'].items():
+            # Files written before the ranges were lists.
+            if len(value) == 3:
+                data['ranges'][tName] = (value[0], [value[1:]])
+
+
+def removeDeltaState():
+    """Remove the delta state file, before a complete run."""
+    DELTA_STATE.clear()
+    try:
+        os.remove(_imdbIDsFileName(DELTA_FILE))
+    except OSError:
+        pass
+
+
+def deltaChanged(stage):
+    """Return True if the data files of a stage changed since the
+    last run."""
+    old = DELTA_STATE.get(stage)
+    if not old or not old['files']:
+        return True
+    for fname in stageFiles(stage):
+        if old['files'].get(fname) != _fileChecksum(fname):
+            return True
+    return False
+
+
+def deltaMarkDirty(stage, before):
+    """Record that a stage is starting to store rows after the ids
+    in 'before'; the rows stored by the last run, if any, are still
+    owned by the stage."""
+    entities = _entityTables()
+    old = DELTA_STATE.get(stage) or {'ranges': {}}
+    ranges = {}
+    for tName, (idCol, maxID) in before.iteritems():
+        if tName in entities:
+            continue
+        intervals = list(old['ranges'].get(tName, (idCol, []))[1])
+        intervals.append([(maxID or 0) + 1, None])
+        ranges[tName] = (idCol, intervals)
+    DELTA_STATE[stage] = {'files': {}, 'ranges': ranges}
+    saveDeltaState()
+
+
+def _cutIDs(first, last, ids):
+    """Return the ranges of ids from first to last, without the
+    given (sorted) ids."""
+    ranges = []
+    if ids:
+        for idx in xrange(bisect_left(ids, first), len(ids)):
+            if ids[idx] > last:
+                break
+            if ids[idx] > first:
+                ranges.append([first, ids[idx] - 1])
+            first = ids[idx] + 1
+    if first <= last:
+        ranges.append([first, last])
+    return ranges
+
+
+def deltaRecordStage(stage, after, removed):
+    """Record the checksums of the data files of a completed stage,
+    and the ids of the rows it stored; the (sorted) ids of the rows
+    removed by deltaRemoveRows are excluded."""
+    ranges = {}
+    for tName, (idCol, intervals) in DELTA_STATE[stage]['ranges'].iteritems():
+        last = after.get(tName, (idCol, None))[1]
+        newIntervals = []
+        for first, end in intervals:
+            if end is None:
+                if last is not None and last >= first:
+                    newIntervals.append([first, last])
+            else:
+                newIntervals += _cutIDs(first, end, removed.get(tName))
+        if newIntervals:
+            ranges[tName] = (idCol, newIntervals)
+    DELTA_STATE[stage] = {'ranges': ranges, 'files': dict(
+            [(fname, _fileChecksum(fname)) for fname in stageFiles(stage)])}
+    saveDeltaState()
+
+
+def deltaRemoveStage(stage):
+    """Remove the rows stored by a stage."""
+    old = DELTA_STATE.get(stage)
+    if not old:
+        return
+    for tName, (idCol, intervals) in old['ranges'].iteritems():
+        for first, last in intervals:
+            if last is None:
+                _executeQuery('DELETE FROM %s WHERE %s >= %d' % (tName,
+                            idCol, first))
+            else:
+                _executeQuery('DELETE FROM %s WHERE %s BETWEEN %d AND %d' %
+                            (tName, idCol, first, last))
+    old['ranges'] = {}
+    old['files'] = {}
+    connectObject.commit()
+    saveDeltaState()
+
+
+def _deltaColumns(tName):
+    """Return the (sorted) names of the columns of a table, but the id."""
+    columns = _DELTA_COLUMNS.get(tName)
+    if columns is None:
+        for table in DB_TABLES:
+            if tableName(table) == tName:
+                break
+        columns = [col.dbName for col in table.sqlmeta.columns.values()
+                    if col.dbName != table.sqlmeta.idName]
+        columns.sort()
+        _DELTA_COLUMNS[tName] = columns
+    return columns
+
+
+def _deltaValue(value):
+    """Return a value as it's compared with the content of the
+    database: numbers and strings are stored in their columns with the
+    same representation, whatever their type."""
+    if value is None:
+        return None
+    if isinstance(value, UnicodeType):
+        return value.encode('utf_8')
+    return str(value)
+
+
+def _rowChecksum(values):
+    """Return the checksum of the values of a row, in the order
+    of _deltaColumns."""
+    return _keyHash(repr([_deltaValue(value) for value in values]))
+
+
+def _deltaRowKey(sqlstr):
+    """Return the function computing the checksum of a row (a tuple
+    of parameters) of the given INSERT statement."""
+    rowKey = _DELTA_ROW_KEYS.get(sqlstr)
+    if rowKey is not None:
+        return rowKey
+    tName, colNames, rawValues = _BULK_SPECS[sqlstr]
+    rawValues = dict(rawValues)
+    # For every column, the index of the parameter or the raw value.
+    getters = {}
+    idx = 0
+    for position, col in enumerate(colNames):
+        if position in rawValues:
+            getters[col] = (None, rawValues[position])
+        else:
+            getters[col] = (idx, None)
+            idx += 1
+    getters = [getters.get(col, (None, None)) for col in _deltaColumns(tName)]
+    def rowKey(row):
+        values = []
+        for idx, value in getters:
+            if idx is not None:
+                value = row[idx]
+            values.append(value)
+        return _rowChecksum(values)
+    _DELTA_ROW_KEYS[sqlstr] = rowKey
+    return rowKey
+
+
+def deltaLoadRows(stage):
+    """Read the checksums of the rows stored by a stage in the last run;
+    until deltaRemoveRows is called, the rows found again are not stored
+    a second time."""
+    _DELTA_ROWS.clear()
+    _DELTA_KEPT.clear()
+    old = DELTA_STATE.get(stage)
+    if not old:
+        return
+    for tName, (idCol, intervals) in old['ranges'].iteritems():
+        rows = {}
+        columns = _deltaColumns(tName)
+        for first, last in intervals:
+            CURS.execute('SELECT %s, %s FROM %s WHERE %s BETWEEN %d AND %d' %
+                        (idCol, ', '.join(columns), tName, idCol, first, last))
+            for row in fetchsome(CURS, 10000):
+                key = _rowChecksum(row[1:])
+                ids = rows.get(key)
+                if ids is None:
+                    rows[key] = row[0]
+                elif isinstance(ids, list):
+                    ids.append(row[0])
+                else:
+                    rows[key] = [ids, row[0]]
+        _DELTA_ROWS[tName] = (idCol, rows)
+        _DELTA_KEPT[tName] = 0
+
+
+def deltaNewRows(sqlstr, rows):
+    """Yield the rows not stored by the last run of the current stage."""
+    tName = _BULK_SPECS[sqlstr][0]
+    if tName not in _DELTA_ROWS:
+        for row in rows:
+            yield row
+        return
+    oldRows = _DELTA_ROWS[tName][1]
+    rowKey = _deltaRowKey(sqlstr)
+    kept = 0
+    try:
+        for row in rows:
+            key = rowKey(row)
+            ids = oldRows.get(key)
+            if ids is None:
+                yield row
+            elif isinstance(ids, list):
+                ids.pop()
+                if len(ids) == 1:
+                    oldRows[key] = ids[0]
+                kept += 1
+            else:
+                del oldRows[key]
+                kept += 1
+    finally:
+        _DELTA_KEPT[tName] += kept
+
+
+def deltaRemoveRows(stage):
+    """Remove the rows stored by the last run of a stage, and not found
+    again; return their (sorted) ids, for every table."""
+    removed = {}
+    for tName, (idCol, rows) in _DELTA_ROWS.iteritems():
+        ids = []
+        for value in rows.itervalues():
+            if isinstance(value, list):
+                ids += value
+            else:
+                ids.append(value)
+        ids.sort()
+        for batch in iterbatch(ids, 10000):
+            CURS.execute('DELETE FROM %s WHERE %s IN (%s)' % (tName, idCol,
+                        ', '.join([str(x) for x in batch])))
+        removed[tName] = ids
+        print 'DELTA %s: %d rows of %s kept, %d removed' % (stage,
+                _DELTA_KEPT[tName], tName, len(ids))
+        metric('delta', stage=stage, table=tName, kept=_DELTA_KEPT[tName],
+                removed=len(ids))
+    _DELTA_ROWS.clear()
+    _DELTA_KEPT.clear()
+    return removed
+
+
+def deltaStart():
+    """Prepare the update of an existing database: remove the rows of
+    the stages not completed by the last run and fill the caches."""
+    loadDeltaState()
+    for stage, data in DELTA_STATE.items():
+        if [x for idCol, intervals in data['ranges'].values()
+                for x in intervals if x[1] is None]:
+            print 'REMOVING the data of %s (not completed)' % stage
+            deltaRemoveStage(stage)
+    CACHE_MID.populate()
+    CACHE_PID.populate()
+    CACHE_CID.populate()
+    CACHE_COMPID.populate()
+    CACHE_KWRDID.populate()
+    # Ids are not contiguous, after some updates.
+    maxIDs = _maxIDs()
+    for cache, table in ((CACHE_MID, Title), (CACHE_PID, Name),
+                        (CACHE_CID, CharName), (CACHE_COMPID, CompanyName),
+                        (CACHE_KWRDID, Keyword), (CACHE_MID_AKAS, AkaTitle)):
+        maxID = maxIDs.get(tableName(table), (None, None))[1]
+        cache.counter = counter((maxID or 0) + 1)
+    t('deltaStart()')
+
+
+def deltaRemoveOrphans():
+    """Remove titles, names, characters, companies and keywords not
+    referenced anymore; titles listed in movies.list.gz are kept."""
+    for table, refs in ((Title, ((CastInfo, 'movieID'),
+                                (MovieInfo, 'movieID'),
+                                (MovieInfoIdx, 'movieID'),
+                                (MovieCompanies, 'movieID'),
+                                (MovieKeyword, 'movieID'),
+                                (MovieLink, 'movieID'),
+                                (MovieLink, 'linkedMovieID'),
+                                (AkaTitle, 'movieID'),
+                                (CompleteCast, 'movieID'),
+                                (Title, 'episodeOfID'))),
+                        (Name, ((CastInfo, 'personID'),
+                                (PersonInfo, 'personID'),
+                                (AkaName, 'personID'))),
+                        (CharName, ((CastInfo, 'personRoleID'),)),
+                        (CompanyName, ((MovieCompanies, 'companyID'),)),
+                        (Keyword, ((MovieKeyword, 'keywordID'),))):
+        tName = tableName(table)
+        idCol = colName(table, 'id')
+        conds = []
+        for refTable, refCol in refs:
+            refTName = tableName(refTable)
+            # An alias is needed for self-references.
+            conds.append('NOT EXISTS (SELECT 1 FROM %s r WHERE r.%s = %s.%s)'
+                        % (refTName, colName(refTable, refCol), tName, idCol))
+        CURS.execute('SELECT %s FROM %s WHERE %s' % (idCol, tName,
+                    ' AND '.join(conds)))
+        orphans = [x[0] for x in fetchsome(CURS)]
+        if table is Title:
+            orphans = [x for x in orphans if x not in LISTED_MOVIE_IDS]
+        for batch in iterbatch(orphans, 10000):
+            CURS.execute('DELETE FROM %s WHERE %s IN (%s)' % (tName, idCol,
+                        ', '.join([str(x) for x in batch])))
+        connectObject.commit()
+        print 'REMOVED %d unreferenced rows from %s' % (len(orphans), tName)
+    t('deltaRemoveOrphans()')
+
+
 # begin the iterations...
 def run():
     print 'RUNNING imdbpy2sql.py using the %s ORM' % USED_ORM
 
     executeCustomQueries('BEGIN')
 
-    # Storing imdbIDs for movies and persons.
-    runSafely(storeNotNULLimdbIDs, 'failed to read imdbIDs for movies',
-            None, Title)
-    runSafely(storeNotNULLimdbIDs, 'failed to read imdbIDs for people',
-            None, Name)
-    runSafely(storeNotNULLimdbIDs, 'failed to read imdbIDs for characters',
-            None, CharName)
-    runSafely(storeNotNULLimdbIDs, 'failed to read imdbIDs for companies',
-            None, CompanyName)
+    if RESUME:
+        readConstants()
+        resumeCheckpoint()
+    elif DELTA:
+        readConstants()
+        deltaStart()
+    else:
+        removeCheckpoint()
+        removeDeltaState()
+
+    if not DELTA and not stageDone('createTables'):
+        # Storing imdbIDs for movies and persons.
+        runSafely(storeNotNULLimdbIDs, 'failed to read imdbIDs for movies',
+                None, Title)
+        runSafely(storeNotNULLimdbIDs, 'failed to read imdbIDs for people',
+                None, Name)
+        runSafely(storeNotNULLimdbIDs, 'failed to read imdbIDs for characters',
+                None, CharName)
+        runSafely(storeNotNULLimdbIDs, 'failed to read imdbIDs for companies',
+                None, CompanyName)
+
+        # Truncate the current database.
+        print 'DROPPING current database...',
+        sys.stdout.flush()
+        dropTables(DB_TABLES)
+        print 'DONE!'
 
-    # Truncate the current database.
-    print 'DROPPING current database...',
-    sys.stdout.flush()
-    dropTables(DB_TABLES)
-    print 'DONE!'
+        executeCustomQueries('BEFORE_CREATE')
+        # Rebuild the database structure.
+        print 'CREATING new tables...',
+        sys.stdout.flush()
+        createTables(DB_TABLES)
+        print 'DONE!'
+        t('dropping and recreating the database')
+        executeCustomQueries('AFTER_CREATE')
 
-    executeCustomQueries('BEFORE_CREATE')
-    # Rebuild the database structure.
-    print 'CREATING new tables...',
-    sys.stdout.flush()
-    createTables(DB_TABLES)
-    print 'DONE!'
-    t('dropping and recreating the database')
-    executeCustomQueries('AFTER_CREATE')
+        # Read the constants.
+        readConstants()
+        saveCheckpoint('createTables')
 
-    # Read the constants.
-    readConstants()
+    if NR_JOBS > 1:
+        # Independent data files are parsed while the movies list
+        # and the cast are stored.
+        tasks = [task for task in parseTasks()
+                if stageWanted(taskStage(task)) and not taskCached(task)]
+        if tasks:
+            startParsers(tasks)
 
     # Populate the CACHE_MID instance.
-    readMovieList()
+    runStage('readMovieList', readMovieList)
     # Comment readMovieList() and uncomment the following two lines
     # to keep the current info in the name and title tables.
     ##CACHE_MID.populate()
@@ -2932,7 +5405,7 @@ def run():
     # distributors, miscellaneous-companies, production-companies,
     # special-effects-companies.
     ##CACHE_COMPID.populate()
-    doMovieCompaniesInfo()
+    runStage('doMovieCompaniesInfo', doMovieCompaniesInfo)
     # Do this now, and free some memory.
     CACHE_COMPID.flush()
     CACHE_COMPID.clear()
@@ -2942,77 +5415,96 @@ def run():
     # actors, actresses, producers, writers, cinematographers, composers,
     # costume-designers, directors, editors, miscellaneous,
     # production-designers.
-    castLists()
+    runStage('castLists', castLists)
     ##CACHE_PID.populate()
     ##CACHE_CID.populate()
+    reportCachesFootprint()
 
     # Aka names and titles.
-    doAkaNames()
+    runStage('doAkaNames', doAkaNames)
     t('doAkaNames()')
-    doAkaTitles()
+    runStage('doAkaTitles', doAkaTitles)
     t('doAkaTitles()')
 
     # alternate-versions, goofs, crazy-credits, quotes, soundtracks, trivia.
-    doMinusHashFiles()
+    runStage('doMinusHashFiles', doMinusHashFiles)
     t('doMinusHashFiles()')
 
     # biographies, business, laserdisc, literature, mpaa-ratings-reasons, plot.
-    doNMMVFiles()
+    runStage('doNMMVFiles', doNMMVFiles)
 
     # certificates, color-info, countries, genres, keywords, language,
     # locations, running-times, sound-mix, technical, release-dates.
-    doMiscMovieInfo()
+    runStage('doMiscMovieInfo', doMiscMovieInfo)
     # movie-links.
-    doMovieLinks()
+    runStage('doMovieLinks', doMovieLinks)
     t('doMovieLinks()')
 
     # ratings.
-    getRating()
+    runStage('getRating', getRating)
     t('getRating()')
     # taglines.
-    getTaglines()
+    runStage('getTaglines', getTaglines)
     t('getTaglines()')
     # ratings (top 250 and bottom 10 movies).
-    getTopBottomRating()
+    runStage('getTopBottomRating', getTopBottomRating)
     t('getTopBottomRating()')
     # complete-cast, complete-crew.
-    completeCast()
+    runStage('completeCast', completeCast)
     t('completeCast()')
+    stopParsers()
 
     if CSV_DIR:
         CSV_CURS.closeAll()
 
+    reportCachesFootprint()
     # Flush caches.
+    mark = _metricsMark()
     CACHE_MID.flush()
     CACHE_PID.flush()
     CACHE_CID.flush()
+    stageMetrics('flushCaches', mark)
     CACHE_MID.clear()
     CACHE_PID.clear()
     CACHE_CID.clear()
+    clearSoundexCaches()
+    removeIDCacheDir()
     t('fushing caches...')
 
     if CSV_ONLY_WRITE:
         t('TOTAL TIME TO WRITE CSV FILES', sinceBegin=True)
         executeCustomQueries('END')
         t('FINAL', sinceBegin=True)
+        runMetrics()
         return
 
     if CSV_DIR:
         print 'loading CSV files into the database'
         executeCustomQueries('BEFORE_CSV_LOAD')
+        mark = _metricsMark()
         loadCSVFiles()
+        stageMetrics('loadCSVFiles', mark)
         t('loadCSVFiles()')
         executeCustomQueries('BEFORE_RESTORE')
 
     t('TOTAL TIME TO INSERT/WRITE DATA', sinceBegin=True)
 
-    buildIndexesAndFK()
+    if DELTA:
+        # Indexes and imdbIDs are already in place.
+        deltaRemoveOrphans()
+    else:
+        runStage('buildIndexesAndFK', buildIndexesAndFK)
 
-    restoreAll_imdbIDs()
+        restoreAll_imdbIDs()
 
     executeCustomQueries('END')
+    if SQLITE_NATIVE:
+        connectObject.finish()
+
+    removeCheckpoint()
 
     t('FINAL', sinceBegin=True)
+    runMetrics()
 
 
 _HEARD = 0
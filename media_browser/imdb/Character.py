@@ -4,7 +4,8 @@ Character module (imdb package).
 
 from copy import deepcopy
 
-from imdb.utils import analyze_name, build_name, flatten, _Container, cmpPeople
+from imdb.utils import analyze_name, build_name, flatten, _Container, \
+                        cmpPeople, personSortKey
 
 
 class Character(_Container):
@@ -37,6 +38,7 @@ class Character(_Container):
     keys_tomodify_list = ('biography', 'quotes')
 
     cmpFunct = cmpPeople
+    sortKeyFunct = personSortKey
 
     def _init(self, **kwds):
         """Initialize a Character object.
@@ -5,7 +5,7 @@ company module (imdb package).
 from copy import deepcopy
 
 from imdb.utils import analyze_company_name, build_company_name, \
-                        flatten, _Container, cmpCompanies
+                        flatten, _Container, cmpCompanies, companySortKey
 
 
 class Company(_Container):
@@ -35,6 +35,7 @@ class Company(_Container):
     keys_tomodify_list = ()
 
     cmpFunct = cmpCompanies
+    sortKeyFunct = companySortKey
 
     def _init(self, **kwds):
         """Initialize a company object.
@@ -6,7 +6,7 @@ from copy import deepcopy
 
 from imdb import linguistics
 from imdb.utils import analyze_title, build_title, canonicalTitle, \
-                        flatten, _Container, cmpMovies
+                        flatten, _Container, cmpMovies, movieSortKey
 
 
 class Movie(_Container):
@@ -117,6 +117,7 @@ class Movie(_Container):
                         'video review', 'faqs')
 
     cmpFunct = cmpMovies
+    sortKeyFunct = movieSortKey
 
     def _init(self, **kwds):
         """Initialize a Movie object.
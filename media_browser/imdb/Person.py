@@ -5,7 +5,7 @@ Person module (imdb package).
 from copy import deepcopy
 
 from imdb.utils import analyze_name, build_name, normalizeName, \
-                        flatten, _Container, cmpPeople
+                        flatten, _Container, cmpPeople, personSortKey
 
 
 class Person(_Container):
@@ -72,6 +72,7 @@ class Person(_Container):
                         "biography from leonard maltin's movie encyclopedia")
 
     cmpFunct = cmpPeople
+    sortKeyFunct = personSortKey
 
     def _init(self, **kwds):
         """Initialize a Person object.
@@ -0,0 +1,93 @@
+"""
+ptdf module (imdb package).
+
+Tokenizers for the lines of the IMDb's plain text data files, used by
+the imdbpy2sql.py script: they return tuples, instead of building a
+dictionary for every line.
+"""
+
+def splitFields(line, nrFields, sep='\t'):
+    """Split a line in fields separated by one or more sep strings;
+    return a tuple of exactly nrFields (stripped) items: missing ones
+    are None and extra ones are dropped.
+    E.g.:
+        splitFields('Incredibles, The (2004)\\t\\t\\t2004\\n', 2)
+    returns ('Incredibles, The (2004)', '2004')."""
+    fields = [x.strip() for x in line.split(sep) if x]
+    nrItems = len(fields)
+    if nrItems == nrFields:
+        return tuple(fields)
+    elif nrItems > nrFields:
+        return tuple(fields[:nrFields])
+    return tuple(fields) + (None,) * (nrFields - nrItems)
+
+
+def splitRating(line):
+    """Split a line of the ratings list; return a tuple with the votes
+    distribution, the votes, the rating (or rank) and the title, or None
+    if the line has less than four fields."""
+    fields = [x for x in line.split('  ') if x]
+    if len(fields) < 4:
+        return None
+    return (fields[0].strip(), fields[1].strip(), fields[2].strip(),
+            fields[3].strip())
+
+
+def _castOrder(text):
+    """Return the position in the credits, from the text between < and >
+    (a number, or 'x,y,z' for episodes); None if it can't be parsed."""
+    if text.isdigit():
+        return long(text)
+    pos = text.split(',')
+    if len(pos) != 3:
+        try:
+            return long(text)
+        except ValueError:
+            return None
+    try:
+        return ((long(pos[2])-1) * 1000) + \
+                ((long(pos[1])-1) * 100) + (long(pos[0])-1)
+    except ValueError:
+        return None
+
+
+def splitCastLine(line):
+    """Split the (stripped) part of a line of a cast list that follows
+    the name of the person; return a tuple with the title, the role,
+    the notes and the position in the credits (None, if missing)."""
+    items = line.split('  ')
+    if len(items) == 1:
+        # Only the title.
+        return line, None, None, None
+    note = None
+    role = None
+    order = None
+    for item in items[1:]:
+        if not item: continue
+        first = item[0]
+        if first == '[':
+            # Quite inefficient, but there are some very strange
+            # cases of garbage in the plain text data files to handle...
+            role = item[1:]
+            if role[-1:] == ']':
+                role = role[:-1]
+            if role[-1:] == ')':
+                nidx = role.find('(')
+                if nidx != -1:
+                    note = role[nidx:]
+                    role = role[:nidx].rstrip()
+                    if not role: role = None
+        elif first == '(':
+            if note is None:
+                note = item
+            else:
+                note = '%s %s' % (note, item)
+        elif first == '<':
+            position = item[1:-1]
+            if position.isdigit():
+                order = long(position)
+            else:
+                position = _castOrder(position)
+                if position is not None:
+                    order = position
+    return items[0], role, note, order
@@ -25,6 +25,11 @@ _utils_logger = logging.getLogger('media_browser.utils')
 re_year_index = re.compile(r'\(([0-9\?]{4}(/[IVXLCDM]+)?)\)')
 re_extended_year_index = re.compile(r'\((TV episode|TV Series|TV mini-series|TV|Video|Video Game)? ?((?:[0-9\?]{4})(?:-[0-9\?]{4})?)(?:/([IVXLCDM]+)?)?\)')
 re_remove_kind = re.compile(r'\((TV episode|TV Series|TV mini-series|TV|Video|Video Game)? ?')
+# The most common format of titles, in a single pass: "title (year)",
+# with the optional imdbIndex and kind of show, like "(1986/II) (TV)".
+re_title_suffixes = re.compile(r'^(.*)(\(([0-9\?]{4})(?:/([IVXLCDM]+))?\))'
+        r'(?:\s*\((TV|TV Movie|V|Video|TV Short|TV Mini-Series|mini|VG|'
+        r'Video Game)\))?$')
 
 # Match only the imdbIndex (for name strings).
 re_index = re.compile(r'^\(([IVXLCDM]+)\)$')
@@ -281,79 +286,20 @@ def is_series_episode(title):
     return 0
 
 
-def analyze_title(title, canonical=None, canonicalSeries=None,
-                    canonicalEpisode=None, _emptyString=u''):
-    """Analyze the given title and return a dictionary with the
-    "stripped" title, the kind of the show ("movie", "tv series", etc.),
-    the year of production and the optional imdbIndex (a roman number
-    used to distinguish between movies with the same title and year).
+# Kinds of show matched by re_title_suffixes.
+_title_kinds = {'TV': u'tv movie', 'TV Movie': u'tv movie',
+                'V': u'video movie', 'Video': u'video movie',
+                'TV Short': u'tv short', 'TV Mini-Series': u'tv mini series',
+                'mini': u'tv mini series', 'VG': u'video game',
+                'Video Game': u'video game'}
 
-    If canonical is None (default), the title is stored in its own style.
-    If canonical is True, the title is converted to canonical style.
-    If canonical is False, the title is converted to normal format.
-
-    raise an IMDbParserError exception if the title is not valid.
-    """
-    # XXX: introduce the 'lang' argument?
-    if canonical is not None:
-        canonicalSeries = canonicalEpisode = canonical
-    original_t = title
-    result = {}
-    title = title.strip()
+def _title_suffixes(title, result, _emptyString=u''):
+    """Return the title without the kind of show, the year and the
+    imdbIndex, along with these three values; the information on the
+    series of episodes in the web format is stored in result."""
     year = _emptyString
     kind = _emptyString
     imdbIndex = _emptyString
-    series_title, episode_or_year = _split_series_episode(title)
-    if series_title:
-        # It's an episode of a series.
-        series_d = analyze_title(series_title, canonical=canonicalSeries)
-        oad = sen = ep_year = _emptyString
-        # Plain text data files format.
-        if episode_or_year[0:1] == '{' and episode_or_year[-1:] == '}':
-            match = re_episode_info.findall(episode_or_year)
-            if match:
-                # Episode title, original air date and #season.episode
-                episode_or_year, oad, sen = match[0]
-                episode_or_year = episode_or_year.strip()
-                if not oad:
-                    # No year, but the title is something like (2005-04-12)
-                    if episode_or_year and episode_or_year[0] == '(' and \
-                                    episode_or_year[-1:] == ')' and \
-                                    episode_or_year[1:2] != '#':
-                        oad = episode_or_year
-                        if oad[1:5] and oad[5:6] == '-':
-                            try:
-                                ep_year = int(oad[1:5])
-                            except (TypeError, ValueError):
-                                pass
-                if not oad and not sen and episode_or_year.startswith('(#'):
-                    sen = episode_or_year
-        elif episode_or_year.startswith('Episode dated'):
-            oad = episode_or_year[14:]
-            if oad[-4:].isdigit():
-                try:
-                    ep_year = int(oad[-4:])
-                except (TypeError, ValueError):
-                    pass
-        episode_d = analyze_title(episode_or_year, canonical=canonicalEpisode)
-        episode_d['kind'] = u'episode'
-        episode_d['episode of'] = series_d
-        if oad:
-            episode_d['original air date'] = oad[1:-1]
-            if ep_year and episode_d.get('year') is None:
-                episode_d['year'] = ep_year
-        if sen and sen[2:-1].find('.') != -1:
-            seas, epn = sen[2:-1].split('.')
-            if seas:
-                # Set season and episode.
-                try: seas = int(seas)
-                except: pass
-                try: epn = int(epn)
-                except: pass
-                episode_d['season'] = seas
-                if epn:
-                    episode_d['episode'] = epn
-        return episode_d
     # First of all, search for the kind of show.
     # XXX: Number of entries at 17 Apr 2008:
     #      movie:        379,871
@@ -396,7 +342,7 @@ def analyze_title(title, canonical=None, canonicalSeries=None,
         if epindex >= 0:
             # It's an episode of a series.
             kind = u'episode'
-            series_info = analyze_title(title[epindex + 15:])
+            series_info = dict(_cachedTitle(title[epindex + 15:]))
             result['episode of'] = series_info.get('title')
             result['series year'] = series_info.get('year')
             title = title[:epindex]
@@ -432,6 +378,99 @@ def analyze_title(title, canonical=None, canonicalSeries=None,
         i = title.rfind('(%s)' % last_yi[0])
         if i != -1:
             title = title[:i-1].rstrip()
+    return title, kind, year, imdbIndex
+
+
+class _TitleDict(dict):
+    """The dictionary built by _analyze_title; the keys are also listed
+    in the order they were first set (see _cachedTitle)."""
+    __slots__ = ('order',)
+
+    def __init__(self):
+        dict.__init__(self)
+        self.order = []
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.order.append(key)
+        dict.__setitem__(self, key, value)
+
+
+def _analyze_title(title, canonical=None, canonicalSeries=None,
+                    canonicalEpisode=None, _emptyString=u''):
+    """Analyze the given title; see analyze_title."""
+    # XXX: introduce the 'lang' argument?
+    if canonical is not None:
+        canonicalSeries = canonicalEpisode = canonical
+    original_t = title
+    result = _TitleDict()
+    title = title.strip()
+    series_title, episode_or_year = _split_series_episode(title)
+    if series_title:
+        # It's an episode of a series.
+        # The items of the series: see _titleDict.
+        series_d = _cachedTitle(series_title, canonicalSeries)
+        oad = sen = ep_year = _emptyString
+        # Plain text data files format.
+        if episode_or_year[0:1] == '{' and episode_or_year[-1:] == '}':
+            match = re_episode_info.findall(episode_or_year)
+            if match:
+                # Episode title, original air date and #season.episode
+                episode_or_year, oad, sen = match[0]
+                episode_or_year = episode_or_year.strip()
+                if not oad:
+                    # No year, but the title is something like (2005-04-12)
+                    if episode_or_year and episode_or_year[0] == '(' and \
+                                    episode_or_year[-1:] == ')' and \
+                                    episode_or_year[1:2] != '#':
+                        oad = episode_or_year
+                        if oad[1:5] and oad[5:6] == '-':
+                            try:
+                                ep_year = int(oad[1:5])
+                            except (TypeError, ValueError):
+                                pass
+                if not oad and not sen and episode_or_year.startswith('(#'):
+                    sen = episode_or_year
+        elif episode_or_year.startswith('Episode dated'):
+            oad = episode_or_year[14:]
+            if oad[-4:].isdigit():
+                try:
+                    ep_year = int(oad[-4:])
+                except (TypeError, ValueError):
+                    pass
+        episode_d = _analyze_title(episode_or_year, canonical=canonicalEpisode)
+        episode_d['kind'] = u'episode'
+        episode_d['episode of'] = series_d
+        if oad:
+            episode_d['original air date'] = oad[1:-1]
+            if ep_year and episode_d.get('year') is None:
+                episode_d['year'] = ep_year
+        if sen and sen[2:-1].find('.') != -1:
+            seas, epn = sen[2:-1].split('.')
+            if seas:
+                # Set season and episode.
+                try: seas = int(seas)
+                except: pass
+                try: epn = int(epn)
+                except: pass
+                episode_d['season'] = seas
+                if epn:
+                    episode_d['episode'] = epn
+        return episode_d
+    match = re_title_suffixes.match(title)
+    if match is not None:
+        # The common "title (year[/imdbIndex]) [(kind)]" format.
+        year, imdbIndex, kind = match.group(3, 4, 5)
+        kind = _title_kinds.get(kind, _emptyString)
+        if imdbIndex is None:
+            imdbIndex = _emptyString
+        # Like the general case, strip the (year) and the character
+        # before it.
+        i = match.start(2)
+        title = title[:match.end(2)][:i-1].rstrip()
+    else:
+        title, kind, year, imdbIndex = _title_suffixes(title, result,
+                                                    _emptyString)
     # This is a tv (mini) series: strip the '"' at the begin and at the end.
     # XXX: strip('"') is not used for compatibility with Python 2.0.
     if title and title[0] == title[-1] == '"':
@@ -464,6 +503,102 @@ def analyze_title(title, canonical=None, canonicalSeries=None,
     return result
 
 
+# Maximum number of analyzed titles kept in memory by analyze_title.
+TITLES_CACHE_SIZE = 100000
+
+class _BoundedCache(object):
+    """A cache of at most size items (e.g. the results of analyze_title,
+    by title and arguments); when more than half of size items were
+    added since the last time, the items not used in the meantime are
+    discarded (something close to a least recently used policy, without
+    keeping track of every access)."""
+    def __init__(self, size=TITLES_CACHE_SIZE):
+        self.size = size
+        self._recent = {}
+        self._old = {}
+
+    def get(self, key):
+        value = self._recent.get(key)
+        if value is None:
+            value = self._old.get(key)
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        recent = self._recent
+        if len(recent) >= self.size // 2:
+            self._old = recent
+            self._recent = recent = {}
+        recent[key] = value
+
+    def clear(self):
+        self._recent.clear()
+        self._old.clear()
+
+_titlesCache = _BoundedCache()
+
+
+def _titleDict(items):
+    """Return a new dictionary from the items of a title returned by
+    _cachedTitle.  The keys are set in the same order they were set by
+    _analyze_title, so that they are listed in the same order (a copy
+    of the dictionary could list them in a different order)."""
+    d = dict(items)
+    series = d.get('episode of')
+    if series.__class__ is tuple:
+        d['episode of'] = _titleDict(series)
+    return d
+
+
+def _cachedTitle(title, canonical=None, canonicalSeries=None,
+                canonicalEpisode=None, _emptyString=u''):
+    """Return the items (key, value) of the given title from the cache,
+    in the order the keys were set, analyzing it if it's not there."""
+    # Strings and unicode objects with the same value have the
+    # same hash, but the results are of a different type.
+    key = (title, title.__class__, canonical, canonicalSeries,
+            canonicalEpisode, _emptyString, _emptyString.__class__)
+    result = _titlesCache.get(key)
+    if result is None:
+        result = _analyze_title(title, canonical, canonicalSeries,
+                                canonicalEpisode, _emptyString)
+        result = tuple([(k, result[k]) for k in result.order])
+        _titlesCache.set(key, result)
+    return result
+
+
+def analyze_title(title, canonical=None, canonicalSeries=None,
+                    canonicalEpisode=None, _emptyString=u''):
+    """Analyze the given title and return a dictionary with the
+    "stripped" title, the kind of the show ("movie", "tv series", etc.),
+    the year of production and the optional imdbIndex (a roman number
+    used to distinguish between movies with the same title and year).
+
+    If canonical is None (default), the title is stored in its own style.
+    If canonical is True, the title is converted to canonical style.
+    If canonical is False, the title is converted to normal format.
+
+    The results are kept in a bounded cache (see TITLES_CACHE_SIZE);
+    a new dictionary is returned every time.
+
+    raise an IMDbParserError exception if the title is not valid.
+    """
+    return _titleDict(_cachedTitle(title, canonical, canonicalSeries,
+                                    canonicalEpisode, _emptyString))
+
+
+def analyze_titles(titles, canonical=None, canonicalSeries=None,
+                    canonicalEpisode=None, _emptyString=u''):
+    """Return a list with the dictionaries returned by analyze_title
+    for every title of the given iterable.
+
+    raise an IMDbParserError exception if a title is not valid.
+    """
+    return [analyze_title(title, canonical, canonicalSeries,
+                        canonicalEpisode, _emptyString) for title in titles]
+
+
 _web_format = '%d %B %Y'
 _ptdf_format = '(%Y-%m-%d)'
 def _convertTime(title, fromPTDFtoWEB=1, _emptyString=u''):
@@ -657,6 +792,64 @@ class _LastC:
 
 _last = _LastC()
 
+# Keys of values that are missing: they are bigger than any other key.
+_MISSING_KEY = (2,)
+
+def _reversedKey(value):
+    """Return a key to sort the given value in reverse order; None
+    is the smallest value, and it's sorted last."""
+    if value is None:
+        return _MISSING_KEY
+    if isinstance(value, basestring):
+        # Every character is negated; the final 1 puts a string before
+        # its prefixes.
+        return (0, tuple([-ord(c) for c in value]) + (1,))
+    if isinstance(value, (int, long, float)):
+        # In Python 2, numbers are smaller than strings.
+        return (1, -value)
+    return (1, value)
+
+def _missingLastKey(value, _missing=_last):
+    """Return a key to sort the given value, putting it after any other
+    value if it's missing."""
+    if value is _missing:
+        return _MISSING_KEY
+    return (0, value)
+
+def _movieDataKey(m):
+    """The part of the key of a movie that doesn't depend on its series."""
+    title = _missingLastKey(m.get('title', _last))
+    imdbIndex = m.get('imdbIndex', _last)
+    # A missing imdbIndex comes first.
+    if imdbIndex is _last: imdbIndex = (-1,)
+    else: imdbIndex = _reversedKey(imdbIndex)
+    movieID = _reversedKey(getattr(m, 'movieID', None))
+    if m.get('episode of') is not None:
+        return (_reversedKey(m.get('season')), _reversedKey(m.get('episode')),
+                title, imdbIndex, movieID)
+    try:
+        year = int(m.get('year', 0))
+    except (ValueError, TypeError):
+        year = 0
+    return (-year, title, imdbIndex, movieID)
+
+def movieSortKey(m):
+    """Return a key to sort movies by year, in reverse order; the title and
+    (in reverse order) the imdbIndex are checked for movies with the same
+    year of production.  Episodes of tv series are sorted by series
+    and then by season and episode number, in reverse order.
+
+    Lists of movies (or of episodes with a season) are sorted as with
+    cmpMovies; cmpMovies compares an episode with a movie (or an episode
+    without a season with another episode) by year and title, so it's
+    not a consistent order for lists mixing them: with this key, the
+    episodes of a series are kept together, after the series itself."""
+    key = _movieDataKey(m)
+    series = m.get('episode of')
+    if series is not None:
+        key = movieSortKey(series) + key
+    return key
+
 def cmpMovies(m1, m2):
     """Compare two movies by year, in reverse order; the imdbIndex is checked
     for movies with the same year of production and title."""
@@ -717,6 +910,20 @@ def cmpMovies(m1, m2):
     return 0
 
 
+def personSortKey(p):
+    """Return a key to sort people by billingPos, name and imdbIndex,
+    like cmpPeople."""
+    billingPos = getattr(p, 'billingPos', None)
+    if billingPos: billingPos = (0, billingPos)
+    else: billingPos = _MISSING_KEY
+    name = p.get('canonical name', _last)
+    if name is _last:
+        # After the people with a canonical name.
+        name = (1,) + _missingLastKey(p.get('name', _last))
+    else:
+        name = (0, name)
+    return (billingPos, name, _missingLastKey(p.get('imdbIndex', _last)))
+
 def cmpPeople(p1, p2):
     """Compare two people by billingPos, name and imdbIndex."""
     p1b = getattr(p1, 'billingPos', None) or _last
@@ -737,6 +944,16 @@ def cmpPeople(p1, p2):
     return 0
 
 
+def companySortKey(c):
+    """Return a key to sort companies by name and country, like
+    cmpCompanies."""
+    name = c.get('long imdb name', _last)
+    if name is _last:
+        name = (1,) + _missingLastKey(c.get('name', _last))
+    else:
+        name = (0, name)
+    return (name, _missingLastKey(c.get('country', _last)))
+
 def cmpCompanies(p1, p2):
     """Compare two companies."""
     p1n = p1.get('long imdb name', _last)
@@ -760,6 +977,26 @@ re_titleRef = re.compile(r'_(.+?(?: \([0-9\?]{4}(?:/[IVXLCDM]+)?\))?(?: \(mini\)
 re_nameRef = re.compile(r"'([^']+?)' \(qv\)")
 # XXX: good choice?  Are there characters with # in the name?
 re_characterRef = re.compile(r"#([^']+?)# \(qv\)")
+# Any of the above; the lastindex of a match is 1 for titles, 2 for names
+# and 3 for characters.
+re_anyRef = re.compile('|'.join([re_titleRef.pattern, re_nameRef.pattern,
+                                re_characterRef.pattern]))
+
+def _findRefs(s):
+    """Return the matches of re_anyRef in the given string, found with a
+    single scan; None is returned if some references are malformed or
+    nested, and re_titleRef, re_nameRef and re_characterRef applied one
+    after the other could give different results."""
+    matches = list(re_anyRef.finditer(s))
+    # Every '(qv)' must close a reference.
+    if s.count('(qv)') != len(matches):
+        return None
+    for match in matches:
+        kind = match.lastindex
+        ref = match.group(kind)
+        if '#' in ref or (kind != 1 and '_' in ref):
+            return None
+    return matches
 
 # Functions used to filter the text strings.
 def modNull(s, titlesRefs, namesRefs, charactersRefs):
@@ -780,9 +1017,21 @@ def modClearCharacterRefs(s, titlesRefs, namesRefs, charactersRefs):
 
 def modClearRefs(s, titlesRefs, namesRefs, charactersRefs):
     """Remove titles, names and characters references."""
-    s = modClearTitleRefs(s, {}, {}, {})
-    s = modClearCharacterRefs(s, {}, {}, {})
-    return modClearNameRefs(s, {}, {}, {})
+    if '(qv)' not in s:
+        return s
+    matches = _findRefs(s)
+    if matches is None:
+        s = modClearTitleRefs(s, {}, {}, {})
+        s = modClearCharacterRefs(s, {}, {}, {})
+        return modClearNameRefs(s, {}, {}, {})
+    chunks = []
+    last = 0
+    for match in matches:
+        chunks.append(s[last:match.start()])
+        chunks.append(match.group(match.lastindex))
+        last = match.end()
+    chunks.append(s[last:])
+    return ''.join(chunks)
 
 
 def modifyStrings(o, modFunct, titlesRefs, namesRefs, charactersRefs):
@@ -861,24 +1110,44 @@ def escape4xml(value):
     return value
 
 
-def _refsToReplace(value, modFunct, titlesRefs, namesRefs, charactersRefs):
+def _refsToReplace(value, modFunct, titlesRefs, namesRefs, charactersRefs,
+                    refsCache=None):
     """Return three lists - for movie titles, persons and characters names -
     with two items tuples: the first item is the reference once escaped
     by the user-provided modFunct function, the second is the same
-    reference un-escaped."""
+    reference un-escaped.  The refsCache dictionary, if given, stores
+    the tuples of every reference; it can be shared among calls with the
+    same modFunct and references dictionaries."""
+    if '(qv)' not in value:
+        return [[], [], []]
+    matches = _findRefs(value)
+    if matches is None:
+        found = [refRe.findall(value)
+                for refRe in (re_titleRef, re_nameRef, re_characterRef)]
+    else:
+        found = [[], [], []]
+        for match in matches:
+            kind = match.lastindex
+            found[kind-1].append(match.group(kind))
     mRefs = []
-    for refRe, refTemplate in [(re_titleRef, u'_%s_ (qv)'),
-                                (re_nameRef, u"'%s' (qv)"),
-                                (re_characterRef, u'#%s# (qv)')]:
+    # The same reference is escaped only once.
+    if refsCache is None:
+        refsCache = {}
+    for refTemplate, theseFound in zip([u'_%s_ (qv)', u"'%s' (qv)",
+                                        u'#%s# (qv)'], found):
         theseRefs = []
-        for theRef in refRe.findall(value):
+        for theRef in theseFound:
+            ref = refTemplate % theRef
+            if ref in refsCache:
+                if refsCache[ref] is not None:
+                    theseRefs.append(refsCache[ref])
+                continue
+            refsCache[ref] = None
             # refTemplate % theRef values don't change for a single
-            # _Container instance, so this is a good candidate for a
-            # cache or something - even if it's so rarely used that...
-            # Moreover, it can grow - ia.update(...) - and change if
-            # modFunct is modified.
-            goodValue = modFunct(refTemplate % theRef, titlesRefs, namesRefs,
-                                charactersRefs)
+            # _Container instance, while it's converted; they can
+            # grow - ia.update(...) - and change if modFunct is modified,
+            # so refsCache can't live any longer.
+            goodValue = modFunct(ref, titlesRefs, namesRefs, charactersRefs)
             # Prevents problems with crap in plain text data files.
             # We should probably exclude invalid chars and string that
             # are too long in the re_*Ref expressions.
@@ -887,7 +1156,11 @@ def _refsToReplace(value, modFunct, titlesRefs, namesRefs, charactersRefs):
             toReplace = escape4xml(goodValue)
             # Only the 'value' portion is replaced.
             replaceWith = goodValue.replace(theRef, escape4xml(theRef))
-            theseRefs.append((toReplace, replaceWith))
+            # Nothing to do (e.g.: the references were just removed).
+            if toReplace == replaceWith:
+                continue
+            refsCache[ref] = (toReplace, replaceWith)
+            theseRefs.append(refsCache[ref])
         mRefs.append(theseRefs)
     return mRefs
 
@@ -901,7 +1174,7 @@ def _handleTextNotes(s):
 
 
 def _normalizeValue(value, withRefs=False, modFunct=None, titlesRefs=None,
-                    namesRefs=None, charactersRefs=None):
+                    namesRefs=None, charactersRefs=None, refsCache=None):
     """Replace some chars that can't be present in a XML text."""
     # XXX: use s.encode(encoding, 'xmlcharrefreplace') ?  Probably not
     #      a great idea: after all, returning a unicode is safe.
@@ -911,7 +1184,7 @@ def _normalizeValue(value, withRefs=False, modFunct=None, titlesRefs=None,
         else:
             # Replace references that were accidentally escaped.
             replaceLists = _refsToReplace(value, modFunct, titlesRefs,
-                                        namesRefs, charactersRefs)
+                                        namesRefs, charactersRefs, refsCache)
             value = modFunct(value, titlesRefs or {}, namesRefs or {},
                             charactersRefs or {})
             value = _handleTextNotes(escape4xml(value))
@@ -1034,13 +1307,35 @@ def _tagAttr(key, fullpath):
     return tagName, u' '.join([u'%s="%s"' % i for i in attrs.items()])
 
 
-def _seq2xml(seq, _l=None, withRefs=False, modFunct=None,
+# Maximum number of tags kept in memory by _tags.
+TAGS_CACHE_SIZE = 10000
+
+_tagsCache = _BoundedCache(TAGS_CACHE_SIZE)
+
+def _tags(key, fullpath):
+    """Return the beginning of the open tag (without the final '>'), the
+    close tag and the full path of the children for the given key;
+    the results are cached, by key and fullpath."""
+    cacheKey = (key, key.__class__, fullpath)
+    tags = _tagsCache.get(cacheKey)
+    if tags is None:
+        tagName, attrs = _tagAttr(key, fullpath)
+        openTag = u'<%s' % tagName
+        if attrs:
+            openTag += u' %s' % attrs
+        tags = (openTag, u'</%s>' % tagName, '%s.%s' % (fullpath, tagName))
+        _tagsCache.set(cacheKey, tags)
+    return tags
+
+
+def _writeXML(seq, write, withRefs=False, modFunct=None,
             titlesRefs=None, namesRefs=None, charactersRefs=None,
-            _topLevel=True, key2infoset=None, fullpath=''):
-    """Convert a sequence or a dictionary to a list of XML
-    unicode strings."""
-    if _l is None:
-        _l = []
+            _topLevel=True, key2infoset=None, fullpath='', _refsCache=None):
+    """Convert a sequence or a dictionary to XML, calling write
+    with every unicode string produced."""
+    if _refsCache is None:
+        # The references don't change while the sequence is converted.
+        _refsCache = {}
     if isinstance(seq, dict):
         for key in seq:
             value = seq[key]
@@ -1049,12 +1344,10 @@ def _seq2xml(seq, _l=None, withRefs=False, modFunct=None,
                 # key (otherwise we should handle key2infoset).
                 openTag, closeTag = _tag4TON(key)
                 # So that fullpath will contains something meaningful.
-                tagName = key.__class__.__name__.lower()
+                childPath = '%s.%s' % (fullpath,
+                                        key.__class__.__name__.lower())
             else:
-                tagName, attrs = _tagAttr(key, fullpath)
-                openTag = u'<%s' % tagName
-                if attrs:
-                    openTag += ' %s' % attrs
+                openTag, closeTag, childPath = _tags(key, fullpath)
                 if _topLevel and key2infoset and key in key2infoset:
                     openTag += u' infoset="%s"' % key2infoset[key]
                 if isinstance(value, int):
@@ -1062,25 +1355,20 @@ def _seq2xml(seq, _l=None, withRefs=False, modFunct=None,
                 elif isinstance(value, float):
                     openTag += ' type="float"'
                 openTag += u'>'
-                closeTag = u'</%s>' % tagName
-            _l.append(openTag)
-            _seq2xml(value, _l, withRefs, modFunct, titlesRefs,
+            write(openTag)
+            _writeXML(value, write, withRefs, modFunct, titlesRefs,
                     namesRefs, charactersRefs, _topLevel=False,
-                    fullpath='%s.%s' % (fullpath, tagName))
-            _l.append(closeTag)
+                    fullpath=childPath, _refsCache=_refsCache)
+            write(closeTag)
     elif isinstance(seq, (list, tuple)):
-        tagName, attrs = _tagAttr('item', fullpath)
-        beginTag = u'<%s' % tagName
-        if attrs:
-            beginTag += u' %s' % attrs
-        #beginTag += u'>'
-        closeTag = u'</%s>' % tagName
+        beginTag, closeTag, childPath = _tags('item', fullpath)
         for item in seq:
             if isinstance(item, _Container):
-                _seq2xml(item, _l, withRefs, modFunct, titlesRefs,
+                _writeXML(item, write, withRefs, modFunct, titlesRefs,
                          namesRefs, charactersRefs, _topLevel=False,
                          fullpath='%s.%s' % (fullpath,
-                                    item.__class__.__name__.lower()))
+                                    item.__class__.__name__.lower()),
+                         _refsCache=_refsCache)
             else:
                 openTag = beginTag
                 if isinstance(item, int):
@@ -1088,21 +1376,35 @@ def _seq2xml(seq, _l=None, withRefs=False, modFunct=None,
                 elif isinstance(item, float):
                     openTag += ' type="float"'
                 openTag += u'>'
-                _l.append(openTag)
-                _seq2xml(item, _l, withRefs, modFunct, titlesRefs,
+                write(openTag)
+                _writeXML(item, write, withRefs, modFunct, titlesRefs,
                         namesRefs, charactersRefs, _topLevel=False,
-                        fullpath='%s.%s' % (fullpath, tagName))
-                _l.append(closeTag)
+                        fullpath=childPath, _refsCache=_refsCache)
+                write(closeTag)
     else:
         if isinstance(seq, _Container):
-            _l.extend(_tag4TON(seq))
+            openTag, closeTag = _tag4TON(seq)
+            write(openTag)
+            write(closeTag)
         else:
             # Text, ints, floats and the like.
-            _l.append(_normalizeValue(seq, withRefs=withRefs,
-                                        modFunct=modFunct,
-                                        titlesRefs=titlesRefs,
-                                        namesRefs=namesRefs,
-                                        charactersRefs=charactersRefs))
+            write(_normalizeValue(seq, withRefs=withRefs,
+                                    modFunct=modFunct,
+                                    titlesRefs=titlesRefs,
+                                    namesRefs=namesRefs,
+                                    charactersRefs=charactersRefs,
+                                    refsCache=_refsCache))
+
+
+def _seq2xml(seq, _l=None, withRefs=False, modFunct=None,
+            titlesRefs=None, namesRefs=None, charactersRefs=None,
+            _topLevel=True, key2infoset=None, fullpath='', _refsCache=None):
+    """Convert a sequence or a dictionary to a list of XML
+    unicode strings."""
+    if _l is None:
+        _l = []
+    _writeXML(seq, _l.append, withRefs, modFunct, titlesRefs, namesRefs,
+            charactersRefs, _topLevel, key2infoset, fullpath, _refsCache)
     return _l
 
 
@@ -1128,6 +1430,15 @@ class _Container(object):
     # Function used to compare two instances of this class.
     cmpFunct = None
 
+    # Function used to build the key to sort instances of this class;
+    # see the sortKey method.
+    sortKeyFunct = None
+
+    # Values of the keys in keys_tomodify, already modified; see
+    # __getitem__ and _checkModCache.
+    _modCache = None
+    _modCacheState = None
+
     # Regular expression used to build the 'full-size (headshot|cover url)'.
     _re_fullsizeURL = re.compile(r'\._V1\._SX(\d+)_SY(\d+)_')
 
@@ -1263,6 +1574,7 @@ class _Container(object):
         self.infoset2keys = {}
         self.key2infoset = {}
         self.__role = None
+        self._modCacheState = None
         self._reset()
 
     def _reset(self): pass
@@ -1278,6 +1590,7 @@ class _Container(object):
         self.infoset2keys = {}
         self.key2infoset = {}
         self.__role = None
+        self._modCacheState = None
         self._clear()
 
     def _clear(self): pass
@@ -1317,10 +1630,12 @@ class _Container(object):
         """Set the fuction used to modify the strings."""
         if modFunct is None: modFunct = modClearRefs
         self.modFunct = modFunct
+        self._modCacheState = None
 
     def update_titlesRefs(self, titlesRefs):
         """Update the dictionary with the references to movies."""
         self.titlesRefs.update(titlesRefs)
+        self._modCacheState = None
 
     def get_titlesRefs(self):
         """Return the dictionary with the references to movies."""
@@ -1329,6 +1644,7 @@ class _Container(object):
     def update_namesRefs(self, namesRefs):
         """Update the dictionary with the references to names."""
         self.namesRefs.update(namesRefs)
+        self._modCacheState = None
 
     def get_namesRefs(self):
         """Return the dictionary with the references to names."""
@@ -1337,6 +1653,7 @@ class _Container(object):
     def update_charactersRefs(self, charactersRefs):
         """Update the dictionary with the references to characters."""
         self.charactersRefs.update(charactersRefs)
+        self._modCacheState = None
 
     def get_charactersRefs(self):
         """Return the dictionary with the references to characters."""
@@ -1351,11 +1668,18 @@ class _Container(object):
             self.data.update(data)
         else:
             self.data = data
+        self._modCacheState = None
 
     def getID(self):
         """Return movieID, personID, characterID or companyID."""
         raise NotImplementedError('override this method')
 
+    def sortKey(self):
+        """Return a key to sort Movie, Person, Character or Company
+        objects, e.g.: movies.sort(key=Movie.sortKey); it's faster than
+        sorting with cmpFunct."""
+        return self.sortKeyFunct()
+
     def __cmp__(self, other):
         """Compare two Movie, Person, Character or Company objects."""
         # XXX: raise an exception?
@@ -1388,10 +1712,18 @@ class _Container(object):
         """Number of items in the data dictionary."""
         return len(self.data)
 
-    def getAsXML(self, key, _with_add_keys=True):
+    def getAsXML(self, key, _with_add_keys=True, _refsCache=None):
         """Return a XML representation of the specified key, or None
         if empty.  If _with_add_keys is False, dinamically generated
         keys are excluded."""
+        _l = []
+        if not self._writeKeyXML(key, _l.append, _with_add_keys, _refsCache):
+            return None
+        return u''.join(_l)
+
+    def _writeKeyXML(self, key, write, _with_add_keys=True, _refsCache=None):
+        """Write the XML representation of the specified key, calling
+        write with every unicode string; return False if it's empty."""
         # Prevent modifyStrings in __getitem__ to be called; if needed,
         # it will be called by the _normalizeValue function.
         origModFunct = self.modFunct
@@ -1403,7 +1735,7 @@ class _Container(object):
         key = self.keys_alias.get(key, key)
         if (not _with_add_keys) and  (key in self._additional_keys()):
             self.modFunct = origModFunct
-            return None
+            return False
         try:
             withRefs = False
             if key in self.keys_tomodify and \
@@ -1411,37 +1743,82 @@ class _Container(object):
                 withRefs = True
             value = self.get(key)
             if value is None:
-                return None
+                return False
             tag = self.__class__.__name__.lower()
-            return u''.join(_seq2xml({key: value}, withRefs=withRefs,
-                                        modFunct=origModFunct,
-                                        titlesRefs=self.titlesRefs,
-                                        namesRefs=self.namesRefs,
-                                        charactersRefs=self.charactersRefs,
-                                        key2infoset=self.key2infoset,
-                                        fullpath=tag))
+            _writeXML({key: value}, write, withRefs=withRefs,
+                        modFunct=origModFunct,
+                        titlesRefs=self.titlesRefs,
+                        namesRefs=self.namesRefs,
+                        charactersRefs=self.charactersRefs,
+                        key2infoset=self.key2infoset,
+                        fullpath=tag, _refsCache=_refsCache)
+            return True
         finally:
             self.modFunct = origModFunct
 
     def asXML(self, _with_add_keys=True):
         """Return a XML representation of the whole object.
         If _with_add_keys is False, dinamically generated keys are excluded."""
+        _l = []
+        self._writeAllXML(_l.append, _with_add_keys)
+        return u''.join(_l)
+
+    def writeXML(self, fd, _with_add_keys=True):
+        """Write the XML representation of the whole object (the same
+        returned by asXML) to the fd file-like object, a piece at a time,
+        without building the whole document in memory."""
+        self._writeAllXML(fd.write, _with_add_keys)
+
+    def _writeAllXML(self, write, _with_add_keys=True):
+        """Write the XML representation of the whole object, calling
+        write with every unicode string."""
         beginTag, endTag = _tag4TON(self, addAccessSystem=True,
                                     _containerOnly=True)
-        resList = [beginTag]
+        write(_xmlHead % self.__class__.__name__.lower())
+        write(beginTag)
+        # Shared by all the keys: the same references are escaped once.
+        refsCache = {}
         for key in self.keys():
-            value = self.getAsXML(key, _with_add_keys=_with_add_keys)
-            if not value:
-                continue
-            resList.append(value)
-        resList.append(endTag)
-        head = _xmlHead % self.__class__.__name__.lower()
-        return head + u''.join(resList)
+            self._writeKeyXML(key, write, _with_add_keys=_with_add_keys,
+                            _refsCache=refsCache)
+        write(endTag)
+
+    def iterXML(self, _with_add_keys=True):
+        """Return an iterator over the XML representation of the whole
+        object (the same returned by asXML), as unicode strings: one for
+        every key, plus the beginning and the end of the document."""
+        beginTag, endTag = _tag4TON(self, addAccessSystem=True,
+                                    _containerOnly=True)
+        yield (_xmlHead % self.__class__.__name__.lower()) + beginTag
+        refsCache = {}
+        for key in self.keys():
+            _l = []
+            if self._writeKeyXML(key, _l.append,
+                                _with_add_keys=_with_add_keys,
+                                _refsCache=refsCache):
+                yield u''.join(_l)
+        yield endTag
 
     def _getitem(self, key):
         """Handle special keys."""
         return None
 
+    def _checkModCache(self, modFunct):
+        """Empty the cache of the modified values, if the modFunct or the
+        references were changed since it was filled, also directly."""
+        state = self._modCacheState
+        if state is not None and state[0] is modFunct and \
+                state[1] is self.titlesRefs and state[4] == self.titlesRefs \
+                and state[2] is self.namesRefs and \
+                state[5] == self.namesRefs and \
+                state[3] is self.charactersRefs and \
+                state[6] == self.charactersRefs:
+            return
+        self._modCache = {}
+        self._modCacheState = (modFunct, self.titlesRefs, self.namesRefs,
+                            self.charactersRefs, copy(self.titlesRefs),
+                            copy(self.namesRefs), copy(self.charactersRefs))
+
     def __getitem__(self, key):
         """Return the value for a given key, checking key aliases;
         a KeyError exception is raised if the key is not found.
@@ -1451,11 +1828,26 @@ class _Container(object):
         # Handle key aliases.
         key = self.keys_alias.get(key, key)
         rawData = self.data[key]
-        if key in self.keys_tomodify and \
-                self.modFunct not in (None, modNull):
+        modFunct = self.modFunct
+        if key in self.keys_tomodify and modFunct not in (None, modNull):
+            # The modified values are cached, until the data, the
+            # references or the modFunct are changed; a copy is returned,
+            # so that the cached value can't be modified by the caller.
+            self._checkModCache(modFunct)
+            cached = self._modCache.get(key)
+            if cached is not None and cached[0] is rawData and \
+                    cached[1] == rawData:
+                value = cached[2]
+                if value is not rawData and isinstance(value, (list, dict)):
+                    value = copy(value)
+                return value
             try:
-                return modifyStrings(rawData, self.modFunct, self.titlesRefs,
+                value = modifyStrings(rawData, modFunct, self.titlesRefs,
                                     self.namesRefs, self.charactersRefs)
+                self._modCache[key] = (rawData, copy(rawData), value)
+                if value is not rawData and isinstance(value, (list, dict)):
+                    value = copy(value)
+                return value
             except RuntimeError, e:
                 # Symbian/python 2.2 has a poor regexp implementation.
                 import warnings
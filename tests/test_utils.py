@@ -0,0 +1,532 @@
+#!/usr/bin/python2.7
+# Copyright 2018
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unittest for the imdb.utils module."""
+
+import os
+import sys
+import random
+import unittest
+
+if sys.version_info[0] >= 3:
+    raise unittest.SkipTest('the imdb package requires Python 2')
+
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'media_browser'))
+
+from imdb import utils
+from imdb.utils import analyze_title, analyze_titles, cmpMovies, \
+                        cmpPeople, cmpCompanies, modClearRefs, re_titleRef, \
+                        re_nameRef, re_characterRef, escape4xml, \
+                        _handleTextNotes, _normalizeValue
+from imdb.Movie import Movie
+from imdb.Person import Person
+from imdb.Company import Company
+from imdb.Character import Character
+
+
+# Titles, keys and keys of the series, as listed by the analyze_title
+# function before its results were cached.
+TITLES_KEYS = [
+    ('"Show" (2001)', ['kind', 'year', 'title'], None),
+    ('Movie (1999)', ['kind', 'year', 'title'], None),
+    ('Movie (1999/II) (TV)', ['kind', 'year', 'imdbIndex', 'title'], None),
+    ('"Show" (2001-2005)', ['kind', 'year', 'series years', 'title'], None),
+    ('Foo (????)', ['kind', 'title'], None),
+    ('"Show" (2001) {Ep (#1.2)}',
+        ['episode of', 'season', 'kind', 'episode', 'title'],
+        ['kind', 'year', 'title']),
+    ('"Show" (2001) {(2005-04-12)}',
+        ['episode of', 'kind', 'year', 'original air date', 'title'],
+        ['kind', 'year', 'title']),
+    ('Ep (TV Episode) - Show (2001) (TV Series)',
+        ['episode of', 'kind', 'series year', 'title'], None),
+    ('Game (2004) (VG)', ['kind', 'year', 'title'], None),
+    ('"Show" (2001) {Ep (#1.2)} {Other (#3.4)}',
+        ['episode of', 'season', 'kind', 'episode', 'title'],
+        ['episode of', 'season', 'kind', 'episode', 'title'])]
+
+# The XML of a Movie, as written before the results of analyze_title
+# were cached.
+_XML_HEAD = u'<?xml version="1.0"?>\n<!DOCTYPE movie SYSTEM ' \
+            u'"http://media_browser.sf.net/dtd/media_browser51.dtd">\n\n'
+TITLES_XML = [
+    ('Movie (1999/II) (TV)', _XML_HEAD + u'<movie id="0000001">'
+        u'<kind>tv movie</kind><title>Movie</title>'
+        u'<imdbindex key="imdbIndex">II</imdbindex>'
+        u'<year type="int">1999</year>'
+        u'<canonical-title key="canonical title">Movie</canonical-title>'
+        u'<long-imdb-title key="long imdb title">Movie (II) (1999) (TV)'
+        u'</long-imdb-title><long-imdb-canonical-title key="long imdb '
+        u'canonical title">Movie (II) (1999) (TV)'
+        u'</long-imdb-canonical-title><smart-canonical-title key="smart '
+        u'canonical title">Movie</smart-canonical-title>'
+        u'<smart-long-imdb-canonical-title key="smart long imdb canonical '
+        u'title">Movie (II) (1999) (TV)</smart-long-imdb-canonical-title>'
+        u'</movie>'),
+    ('"Show" (2001) {Ep (#1.2)}', _XML_HEAD + u'<movie id="0000001">'
+        u'<episode-of key="episode of"><kind>tv series</kind>'
+        u'<year type="int">2001</year><title>Show</title></episode-of>'
+        u'<season type="int">1</season><kind>episode</kind>'
+        u'<episode type="int">2</episode><title>Ep</title>'
+        u'<canonical-title key="canonical title">Ep</canonical-title>'
+        u'<long-imdb-title key="long imdb title">&quot;Show&quot; Ep (????)'
+        u'</long-imdb-title><long-imdb-canonical-title key="long imdb '
+        u'canonical title">&quot;Show&quot; Ep (????)'
+        u'</long-imdb-canonical-title><smart-canonical-title key="smart '
+        u'canonical title">Ep</smart-canonical-title>'
+        u'<smart-long-imdb-canonical-title key="smart long imdb canonical '
+        u'title">&quot;Show&quot; Ep (????)'
+        u'</smart-long-imdb-canonical-title><long-imdb-episode-title '
+        u'key="long imdb episode title">&quot;Show&quot; Ep (????)'
+        u'</long-imdb-episode-title><series-title key="series title">Show'
+        u'</series-title><canonical-series-title key="canonical series '
+        u'title">Show</canonical-series-title><episode-title key="episode '
+        u'title">Ep</episode-title><canonical-episode-title key="canonical '
+        u'episode title">Ep</canonical-episode-title>'
+        u'<smart-canonical-series-title key="smart canonical series title">'
+        u'Show</smart-canonical-series-title><smart-canonical-episode-title '
+        u'key="smart canonical episode title">Ep'
+        u'</smart-canonical-episode-title></movie>')]
+
+# Strings with mixed, nested and adjacent references, and the result of
+# the old modClearRefs, that applied re_titleRef, re_characterRef and
+# re_nameRef one after the other.
+REFS_STRINGS = [
+    (u"_Foo (2000)_ (qv)'Smith, John' (qv)#Joe# (qv)",
+        u'Foo (2000)Smith, JohnJoe'),
+    (u"_The 'Smith, John' (qv) story (2000)_ (qv)",
+        u'The Smith, John story (2000)'),
+    (u"'Joe's #Bar# (qv) friend' (qv)", u"'Joes Bar friend"),
+    (u"_a_ (qv)_b_ (qv) and 'x_y' (qv)", u'ab and x_y'),
+    (u'#A_B# (qv) _C#D (2000)_ (qv)', u'AB _C#D (2000)'),
+    (u"'A' (qv) (qv)", u'A (qv)'),
+    (u'_Foo_ (qv) & <b> :: notes', u'Foo & <b> :: notes')]
+
+
+def _oldModClearRefs(s, titlesRefs, namesRefs, charactersRefs):
+    """modClearRefs, as it was before references were found with
+    a single scan."""
+    s = re_titleRef.sub(r'\1', s)
+    s = re_characterRef.sub(r'\1', s)
+    return re_nameRef.sub(r'\1', s)
+
+
+def _oldNormalizeValue(value, modFunct, titlesRefs, namesRefs,
+                        charactersRefs):
+    """_normalizeValue with references, as it was before references
+    were found with a single scan."""
+    replaceLists = []
+    for refRe, refTemplate in [(re_titleRef, u'_%s_ (qv)'),
+                                (re_nameRef, u"'%s' (qv)"),
+                                (re_characterRef, u'#%s# (qv)')]:
+        theseRefs = []
+        for theRef in refRe.findall(value):
+            goodValue = modFunct(refTemplate % theRef, titlesRefs, namesRefs,
+                                charactersRefs)
+            if '_' in goodValue or len(goodValue) > 128:
+                continue
+            theseRefs.append((escape4xml(goodValue),
+                            goodValue.replace(theRef, escape4xml(theRef))))
+        replaceLists.append(theseRefs)
+    value = modFunct(value, titlesRefs, namesRefs, charactersRefs)
+    value = _handleTextNotes(escape4xml(value))
+    for replaceList in replaceLists:
+        for toReplace, replaceWith in replaceList:
+            value = value.replace(toReplace, replaceWith)
+    return value
+
+
+def _modLinks(s, titlesRefs, namesRefs, charactersRefs):
+    """Replace references with links, like imdb.helpers.modHtmlLinks."""
+    def _replaceMovie(match):
+        item = titlesRefs.get(match.group(1))
+        if item is None: return match.group(1)
+        return u'<a href="/title/tt%s">%s</a>' % (item.movieID,
+                                                match.group(1))
+    def _replacePerson(match):
+        item = namesRefs.get(match.group(1))
+        if item is None: return match.group(1)
+        return u'<a href="/name/nm%s">%s</a>' % (item.personID,
+                                                match.group(1))
+    s = s.replace('<', '&lt;').replace('>', '&gt;')
+    s = re_titleRef.sub(_replaceMovie, s)
+    s = re_nameRef.sub(_replacePerson, s)
+    return re_characterRef.sub(r'\1', s)
+
+
+class AnalyzeTitle_UnitTest(unittest.TestCase):
+    """Results of analyze_title and analyze_titles, also when they
+    are taken from the cache."""
+
+    def test_values(self):
+        self.assertEqual(analyze_title('"Show" (2001) {Ep (#1.2)}'),
+                {'episode of': {'kind': u'tv series', 'year': 2001,
+                                'title': 'Show'},
+                'season': 1, 'kind': u'episode', 'episode': 2,
+                'title': 'Ep'})
+        self.assertEqual(
+                analyze_title('Ep (TV Episode) - Show (2001) (TV Series)'),
+                {'episode of': 'Show', 'kind': u'episode',
+                'series year': 2001, 'title': 'Ep '})
+        self.assertEqual(analyze_title('"Show" (2001-2005)'),
+                {'kind': u'tv series', 'year': 2001,
+                'series years': '2001-2005', 'title': 'Show'})
+        d = analyze_title('Foo (1999)', _emptyString='')
+        self.assertEqual(d, {'kind': 'movie', 'year': 1999, 'title': 'Foo'})
+        self.assertEqual(type(d['kind']), str)
+        self.assertEqual(type(analyze_title(u'Foo (1999)')['title']),
+                        unicode)
+
+    def _checkKeys(self, d, keys, seriesKeys):
+        self.assertEqual(d.keys(), keys)
+        if seriesKeys is None:
+            self.assertFalse(isinstance(d.get('episode of'), dict))
+        else:
+            self.assertEqual(d['episode of'].keys(), seriesKeys)
+
+    def test_keys_order(self):
+        # The second time, the results come from the cache.
+        for i in xrange(2):
+            for title, keys, seriesKeys in TITLES_KEYS:
+                self._checkKeys(analyze_title(title), keys, seriesKeys)
+
+    def test_analyze_titles(self):
+        titles = [x[0] for x in TITLES_KEYS]
+        results = analyze_titles(titles)
+        self.assertEqual(results, [analyze_title(t) for t in titles])
+        for d, (title, keys, seriesKeys) in zip(results, TITLES_KEYS):
+            self._checkKeys(d, keys, seriesKeys)
+
+    def test_new_dictionaries(self):
+        title = '"Show" (2001) {Ep (#1.2)}'
+        d = analyze_title(title)
+        d['title'] = 'Changed'
+        d['episode of']['title'] = 'Changed'
+        self.assertEqual(analyze_title(title)['title'], 'Ep')
+        self.assertEqual(analyze_title(title)['episode of']['title'], 'Show')
+
+    def test_asXML(self):
+        for i in xrange(2):
+            for title, xml in TITLES_XML:
+                self.assertEqual(Movie(title=title, movieID='0000001').asXML(),
+                                xml)
+
+
+class SortKey_UnitTest(unittest.TestCase):
+    """Sort keys of movies, people and companies, compared with the
+    cmpMovies, cmpPeople and cmpCompanies functions."""
+
+    def setUp(self):
+        self.rnd = random.Random(0)
+
+    def _title(self):
+        return ' '.join([self.rnd.choice(['a', 'ab', 'b', 'The b', 'A',
+                        u'\xe8t\xe9']) for i in xrange(self.rnd.randint(1, 2))])
+
+    def _movie(self):
+        rnd = self.rnd
+        m = Movie(movieID=rnd.choice(['%07d' % rnd.randint(0, 20), None]))
+        m['title'] = self._title()
+        if rnd.random() < 0.9:
+            m['year'] = rnd.choice([1999, 2000, '2001', '????'])
+        if rnd.random() < 0.5:
+            m['imdbIndex'] = rnd.choice(['I', 'II', 'IV', u'III'])
+        return m
+
+    def _checkOrder(self, items, cmpFunct, keyFunct):
+        byCmp = sorted(items, cmp=cmpFunct)
+        byKey = sorted(items, key=keyFunct)
+        self.assertEqual([id(x) for x in byCmp], [id(x) for x in byKey])
+
+    def test_movies(self):
+        self._checkOrder([self._movie() for i in xrange(500)], cmpMovies,
+                        Movie.sortKey)
+
+    def test_episodes(self):
+        series = [self._movie() for i in xrange(4)]
+        episodes = []
+        for i in xrange(500):
+            m = self._movie()
+            m['episode of'] = self.rnd.choice(series)
+            m['season'] = self.rnd.randint(1, 3)
+            m['episode'] = self.rnd.choice([1, 2, None])
+            episodes.append(m)
+        self._checkOrder(episodes, cmpMovies, Movie.sortKey)
+
+    def test_people(self):
+        rnd = self.rnd
+        people = []
+        for i in xrange(500):
+            p = Person(name=rnd.choice(['Smith, John', 'John Smith', 'Ada',
+                        u'M\xfcller, Hans', 'van Dyke, Dick']),
+                        billingPos=rnd.choice([None, 1, 2, 3]))
+            if rnd.random() < 0.3:
+                p['imdbIndex'] = rnd.choice(['I', 'II'])
+            people.append(p)
+        self._checkOrder(people, cmpPeople, Person.sortKey)
+
+    def test_companies(self):
+        rnd = self.rnd
+        companies = [Company(name=rnd.choice(['Foo', 'Bar [us]', 'Bar [it]',
+                            'Baz Inc.'])) for i in xrange(200)]
+        self._checkOrder(companies, cmpCompanies, Company.sortKey)
+
+    def test_cmp(self):
+        # The comparison of an episode with a movie is by year and title.
+        movie = Movie(title='Movie (2000)', movieID='0000001')
+        episode = Movie(title='"Show" (2000) {Ep (#1.1)}', movieID='0000002')
+        self.assertEqual(cmpMovies(episode, movie), -1)
+        self.assertEqual(cmpMovies(movie, episode), 1)
+        self.assertTrue(Movie(title='Foo (2000)') == Movie(title='Foo (2000)'))
+        self.assertFalse(Movie(title='Foo (2000)') == movie)
+
+    def test_mixed_order(self):
+        # Episodes are kept after their series, ordered by season and
+        # episode, in reverse order; cmpMovies is not consistent here.
+        titles = ['Movie (2000)', '"Show" (2000)', '"Show" (2000) {Ep (#1.1)}',
+                '"Show" (2000) {Last (#2.1)}', '"Show" (2000) {Pilot (#1.2)}',
+                'Alpha (1999)', 'Zeta (2000)', '"Show" (2000) {Special}']
+        movies = [Movie(title=t) for t in titles]
+        self.assertEqual([m['title'] for m in sorted(movies,
+                                                    key=Movie.sortKey)],
+                ['Movie', 'Show', 'Last', 'Pilot', 'Ep', 'Special', 'Zeta',
+                'Alpha'])
+
+    def test_modified_data(self):
+        first = Movie(title='First (2000)')
+        second = Movie(title='Second (2000)')
+        self.assertTrue(first.sortKey() < second.sortKey())
+        first.data['year'] = 1990
+        self.assertTrue(first.sortKey() > second.sortKey())
+        second['title'] = 'A'
+        second.data['year'] = 1980
+        self.assertTrue(first.sortKey() < second.sortKey())
+
+
+class ModifiedValues_UnitTest(unittest.TestCase):
+    """Cache of the modified values returned by _Container.__getitem__."""
+
+    def setUp(self):
+        self.calls = 0
+        self.movie = Movie(title='Foo (2000)', movieID='0000001')
+        self.movie['trivia'] = [u"_Bar (1999)_ (qv) with 'Smith, John' (qv)",
+                                u'#Joe# (qv)']
+
+    def modRefs(self, s, titlesRefs, namesRefs, charactersRefs):
+        # Also show the number of references.
+        self.calls += 1
+        return u'%s %d/%d/%d' % (modClearRefs(s, titlesRefs, namesRefs,
+                                            charactersRefs), len(titlesRefs),
+                                len(namesRefs), len(charactersRefs))
+
+    def test_cached(self):
+        m = self.movie
+        m.set_mod_funct(self.modRefs)
+        self.assertEqual(m['trivia'], [u'Bar (1999) with Smith, John 0/0/0',
+                                        u'Joe 0/0/0'])
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(m['trivia'], [u'Bar (1999) with Smith, John 0/0/0',
+                                        u'Joe 0/0/0'])
+        self.assertEqual(self.calls, 2)
+
+    def test_mutation(self):
+        m = self.movie
+        trivia = m['trivia']
+        trivia.append(u'Other')
+        trivia[0] = u'Changed'
+        self.assertEqual(m['trivia'], [u'Bar (1999) with Smith, John',
+                                        u'Joe'])
+        self.assertEqual(len(m.data['trivia']), 2)
+
+    def test_data(self):
+        m = self.movie
+        m['trivia']
+        m.data['trivia'][1] = u"'Doe, Jane' (qv)"
+        self.assertEqual(m['trivia'], [u'Bar (1999) with Smith, John',
+                                        u'Doe, Jane'])
+        m.data['trivia'].append(u'_Baz (2001)_ (qv)')
+        self.assertEqual(m['trivia'][2], u'Baz (2001)')
+        m.data['trivia'] = [u'#Ann# (qv)']
+        self.assertEqual(m['trivia'], [u'Ann'])
+        m.append_item('trivia', u"'Roe, Rick' (qv)")
+        self.assertEqual(m['trivia'], [u'Ann', u'Roe, Rick'])
+        del m['trivia']
+        self.assertRaises(KeyError, m.__getitem__, 'trivia')
+
+    def test_set_data(self):
+        m = self.movie
+        m['trivia']
+        m.set_data({'trivia': [u'_New (2002)_ (qv)']})
+        self.assertEqual(m['trivia'], [u'New (2002)'])
+        m.set_data({'title': u'Foo', 'trivia': [u'#Last# (qv)']}, override=1)
+        self.assertEqual(m['trivia'], [u'Last'])
+
+    def test_set_mod_funct(self):
+        m = self.movie
+        m['trivia']
+        m.set_mod_funct(self.modRefs)
+        self.assertEqual(m['trivia'][1], u'Joe 0/0/0')
+        m.set_mod_funct(None)
+        self.assertEqual(m['trivia'][1], u'Joe')
+        m.modFunct = self.modRefs
+        self.assertEqual(m['trivia'][1], u'Joe 0/0/0')
+
+    def test_refs(self):
+        m = self.movie
+        m.set_mod_funct(self.modRefs)
+        m['trivia']
+        m.update_titlesRefs({u'Bar (1999)': Movie(title=u'Bar (1999)',
+                                                movieID='0000002')})
+        self.assertEqual(m['trivia'][1], u'Joe 1/0/0')
+        m.update_namesRefs({u'Smith, John': Person(name=u'Smith, John',
+                                                personID='0000001')})
+        self.assertEqual(m['trivia'][1], u'Joe 1/1/0')
+        m.update_charactersRefs({u'Joe': Character(name=u'Joe',
+                                                characterID='0000001')})
+        self.assertEqual(m['trivia'][1], u'Joe 1/1/1')
+        m.titlesRefs[u'Baz (2001)'] = Movie(title=u'Baz (2001)')
+        self.assertEqual(m['trivia'][1], u'Joe 2/1/1')
+        m.namesRefs = {}
+        self.assertEqual(m['trivia'][1], u'Joe 2/0/1')
+
+
+class References_UnitTest(unittest.TestCase):
+    """modClearRefs and _normalizeValue, compared with the old code
+    that used a regular expression for every kind of reference."""
+
+    def setUp(self):
+        self.titlesRefs = {u'Foo (2000)': Movie(title=u'Foo (2000)',
+                                                movieID='0000001'),
+                            u'a': Movie(title=u'a', movieID='0000002')}
+        self.namesRefs = {u'Smith, John': Person(name=u'Smith, John',
+                                                personID='0000001'),
+                        u'B c': Person(name=u'B c', personID='0000002')}
+        rnd = random.Random(0)
+        pieces = ['_', "'", '#', ' (qv)', '_ (qv)', "' (qv)", '# (qv)', 'a',
+                'B c', ' (2000)', '&', '<', '::', ' ', '_Foo (2000)_ (qv)',
+                "'Smith, John' (qv)", '#Joe# (qv)', u'\xe8']
+        self.strings = [x[0] for x in REFS_STRINGS]
+        for i in xrange(5000):
+            self.strings.append(u''.join([rnd.choice(pieces)
+                                for j in xrange(rnd.randint(1, 10))]))
+
+    def test_values(self):
+        for s, cleared in REFS_STRINGS:
+            self.assertEqual(modClearRefs(s, {}, {}, {}), cleared)
+
+    def test_modClearRefs(self):
+        for s in self.strings:
+            self.assertEqual(modClearRefs(s, self.titlesRefs,
+                                        self.namesRefs, {}),
+                            _oldModClearRefs(s, self.titlesRefs,
+                                        self.namesRefs, {}))
+
+    def test_normalizeValue(self):
+        for modFunct in (modClearRefs, _modLinks):
+            # The escaped references are shared, as in asXML.
+            refsCache = {}
+            for s in self.strings:
+                self.assertEqual(_normalizeValue(s, True, modFunct,
+                                    self.titlesRefs, self.namesRefs, {},
+                                    refsCache),
+                                _oldNormalizeValue(s, modFunct,
+                                    self.titlesRefs, self.namesRefs, {}))
+
+    def test_asXML(self):
+        m = Movie(title=u'Foo (2000)', movieID='0000001',
+                data={'trivia': self.strings[:200]},
+                titlesRefs=self.titlesRefs, namesRefs=self.namesRefs)
+        def _oldNormalize(value, withRefs=False, modFunct=None,
+                        titlesRefs=None, namesRefs=None,
+                        charactersRefs=None, refsCache=None):
+            if withRefs and isinstance(value, (unicode, str)):
+                return _oldNormalizeValue(value, modFunct, titlesRefs or {},
+                                    namesRefs or {}, charactersRefs or {})
+            return _normalizeValue(value, withRefs, modFunct, titlesRefs,
+                                namesRefs, charactersRefs)
+        for modFunct in (modClearRefs, _modLinks):
+            m.set_mod_funct(modFunct)
+            xml = m.asXML()
+            utils._normalizeValue = _oldNormalize
+            try:
+                self.assertEqual(xml, m.asXML())
+            finally:
+                utils._normalizeValue = _normalizeValue
+
+
+class XML_UnitTest(unittest.TestCase):
+    """iterXML and writeXML, compared with asXML."""
+
+    def setUp(self):
+        titlesRefs = {u'Foo (2000)': Movie(title=u'Foo (2000)',
+                                            movieID='0000002')}
+        namesRefs = {u'Smith, John': Person(name=u'Smith, John',
+                                            personID='0000001')}
+        charactersRefs = {u'Joe': Character(name=u'Joe',
+                                            characterID='0000001')}
+        episode = Movie(title=u'"Show" (2000) {Pilot (#1.1)}',
+                        movieID='0000004')
+        episode['episode of'] = Movie(title=u'"Show" (2000)',
+                                    movieID='0000003')
+        self.movie = Movie(title=u'Foo (2000)', movieID='0000002',
+                data={'cast': [Person(name=u'Smith, John',
+                                    personID='0000001', currentRole=u'Joe')],
+                    'trivia': [u"_Foo (2000)_ (qv) & 'Smith, John' (qv) as "
+                                u'#Joe# (qv)::note <x>'],
+                    'plot': [u'A plot.::Author'],
+                    'episodes': {1: {1: episode}}},
+                titlesRefs=titlesRefs, namesRefs=namesRefs,
+                charactersRefs=charactersRefs)
+        self.person = Person(name=u'Smith, John', personID='0000001',
+                data={'actor': [Movie(title=u'Foo (2000)', movieID='0000002',
+                                    currentRole=u'Joe'), episode],
+                    'trivia': [u'In _Foo (2000)_ (qv).']},
+                titlesRefs=titlesRefs)
+        self.character = Character(name=u'Joe', characterID='0000001',
+                data={'filmography': [episode],
+                    'quotes': [u"'Smith, John' (qv): hi"],
+                    'introduction': u"Played by 'Smith, John' (qv)."},
+                namesRefs=namesRefs)
+        self.objects = [self.movie, self.person, self.character]
+
+    def test_iterXML(self):
+        for o in self.objects:
+            for withAddKeys in (True, False):
+                pieces = list(o.iterXML(withAddKeys))
+                self.assertTrue(len(pieces) > 2)
+                self.assertEqual(u''.join(pieces), o.asXML(withAddKeys))
+
+    def test_writeXML(self):
+        for o in self.objects:
+            for withAddKeys in (True, False):
+                fd = StringIO()
+                o.writeXML(fd, withAddKeys)
+                self.assertEqual(fd.getvalue(), o.asXML(withAddKeys))
+
+    def test_asXML(self):
+        xml = self.movie.asXML()
+        self.assertTrue(u'<trivia><item>Foo (2000) &amp; Smith, John as Joe'
+                        u'<notes>note &lt;x&gt;</notes></item></trivia>' in xml)
+        self.assertTrue(u'<episodes><season keytype="int" key="1"><episode '
+                        u'keytype="int" key="1"><movie id="0000004">' in xml)
+        self.assertTrue(u'<current-role><character><name>Joe</name>'
+                        u'</character></current-role>' in xml)
+
+
+if __name__ == '__main__':
+    unittest.main()